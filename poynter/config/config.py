@@ -36,15 +36,78 @@ class AppConfig(GoodConf):
         default="", description="Connection to S3 private bucket for media"
     )
     REDIS_ENABLED: bool = Field(default=False, description="If False, db caching will be used.")
-    REDIS_URL: str = Field(default="redis://127.0.0.1:6379")
+    REDIS_URL: str = Field(
+        default="redis://127.0.0.1:6379",
+        description="Redis for the cache, vote store, event log and channel layer. "
+        "Database 0 unless the URL names one.",
+    )
+    REDIS_MAX_CONNECTIONS: int = Field(
+        default=20,
+        description="Connection pool size per process for the cache (shared by the vote "
+        "store and event log).",
+    )
+    REDIS_CHANNEL_MAX_CONNECTIONS: int = Field(
+        default=10,
+        description="Connection pool size per process, event loop and host for the "
+        "channel layer.",
+    )
+    REDIS_SENTINELS: List[str] = Field(
+        default=[],
+        description="Sentinel nodes as host:port. When set, Redis is the master named "
+        "REDIS_SENTINEL_MASTER (REDIS_URL's host is ignored; its password and db are used).",
+    )
+    REDIS_SENTINEL_MASTER: str = Field(default="mymaster")
+    REDIS_CHANNEL_URLS: List[str] = Field(
+        default=[],
+        description="Redis URLs to shard channel layer groups across. Empty uses REDIS_URL "
+        "(or the Sentinel master).",
+    )
     REDIS_PREFIX: str = Field(default="poynter")
+    ASGI_WORKERS: int = Field(
+        default=0,
+        description="Worker processes started by manage.py serve_asgi. 0 starts one per CPU "
+        "available to the container, or just one unless REDIS_ENABLED (with a shared VOTE_STORE).",
+    )
+    ASGI_DRAIN_SECONDS: int = Field(
+        default=30,
+        description="On restart or shutdown, how long serve_asgi workers wait for open "
+        "requests and sockets to finish before exiting.",
+    )
+    ASYNC_VIEWS: bool = Field(
+        default=True,
+        description="Serve the HTMX partials with async views. Best under daphne/ASGI; "
+        "turn off when serving through WSGI (uwsgi).",
+    )
+    BROADCAST_SHARED_WIDGETS: bool = Field(
+        default=True,
+        description="Render widgets that are the same for every member once per change "
+        "and push the HTML to the space, instead of each client re-fetching.",
+    )
+    REFRESH_DEBOUNCE_MS: int = Field(
+        default=100,
+        description="Window in which ticket table refreshes for a space, as fetched ticket "
+        "titles come in, collapse into one. 0 disables debouncing.",
+    )
     SECRET_KEY: str = Field(
         default_factory=lambda: base64.b64encode(os.urandom(60)).decode(),
         description="Used for cryptographic signing. "
         "https://docs.djangoproject.com/en/2.0/ref/settings/#secret-key",
     )
     SENTRY_DSN: str = Field(default="")
+    TITLE_FETCH_WORKERS: int = Field(
+        default=4, description="Background threads per process fetching ticket titles."
+    )
     TEST_EMAIL_TO: str = Field(default="")
+    VOTE_STORE: str = Field(
+        default="",
+        description="Where votes are kept while voting: redis, local (in-process, single "
+        "server only) or database. Empty picks redis if REDIS_ENABLED, else local.",
+    )
+    VOTE_FLUSH_MS: int = Field(
+        default=500,
+        description="Interval at which votes are written to the database in batches. "
+        "0 writes each vote as it is cast.",
+    )
 
     class Config:
         default_files: List[str] = ["poynter/config/local.yml", "poynter/config/local.json"]
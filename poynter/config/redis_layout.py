@@ -0,0 +1,139 @@
+from urllib.parse import urlsplit, urlunsplit
+
+"""
+Builds CACHES and CHANNEL_LAYERS from the one set of REDIS_* config values, so
+the cache (which the vote store and event log share, see points/votes.py and
+points/events.py) and the channel layer always point at the same Redis
+deployment: a single server, a Sentinel-managed master, or, for the channel
+layer only, several servers that channel groups are sharded across.
+
+describe_pools() reports what the settings add up to for one worker process;
+serve_asgi prints it on startup.
+"""
+
+# Redis databases: cache (also vote store and event log) and channel layer share db 0
+CACHE_DB = 0
+
+
+def with_db(url: str, db: int) -> str:
+    "`url` pointing at database `db`, unless it already names one."
+    parts = urlsplit(url)
+    if parts.path.strip("/"):
+        return url
+    return urlunsplit(parts._replace(path=f"/{db}"))
+
+
+def sentinel_hosts(sentinels: list) -> list:
+    "[(host, port)] from ['host:port', ...]."
+    hosts = []
+    for sentinel in sentinels:
+        host, _, port = sentinel.rpartition(":")
+        hosts.append((host, int(port)))
+    return hosts
+
+
+def sentinel_url(config) -> str:
+    "REDIS_URL with its host replaced by the Sentinel master name, as django-redis expects."
+    parts = urlsplit(config.REDIS_URL)
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = config.REDIS_SENTINEL_MASTER
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def cache_settings(config) -> dict:
+    "CACHES['default'] for django-redis."
+    options = {
+        "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        "IGNORE_EXCEPTIONS": False,
+        "CONNECTION_POOL_KWARGS": {"max_connections": config.REDIS_MAX_CONNECTIONS},
+    }
+    location = with_db(config.REDIS_URL, CACHE_DB)
+    if config.REDIS_SENTINELS:
+        location = with_db(sentinel_url(config), CACHE_DB)
+        options |= {
+            "CLIENT_CLASS": "django_redis.client.SentinelClient",
+            "CONNECTION_FACTORY": "django_redis.pool.SentinelConnectionFactory",
+            "SENTINELS": sentinel_hosts(config.REDIS_SENTINELS),
+        }
+
+    return {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": location,
+        "OPTIONS": options,
+        "KEY_PREFIX": config.REDIS_PREFIX,
+        "TIMEOUT": 60 * 60 * 24 * 30,  # 30 days
+    }
+
+
+def channel_layer_settings(config) -> dict:
+    "CHANNEL_LAYERS['default'] for channels_redis; groups are sharded across all hosts."
+    pool = {"max_connections": config.REDIS_CHANNEL_MAX_CONNECTIONS}
+    if config.REDIS_CHANNEL_URLS:
+        hosts = [{"address": url} | pool for url in config.REDIS_CHANNEL_URLS]
+    elif config.REDIS_SENTINELS:
+        parts = urlsplit(config.REDIS_URL)
+        hosts = [
+            {
+                "master_name": config.REDIS_SENTINEL_MASTER,
+                "sentinels": sentinel_hosts(config.REDIS_SENTINELS),
+                "db": CACHE_DB,
+                "password": parts.password,
+            }
+            | pool
+        ]
+    else:
+        hosts = [{"address": with_db(config.REDIS_URL, CACHE_DB)} | pool]
+
+    return {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": hosts},
+    }
+
+
+def describe_host(host: dict) -> str:
+    "Where one channel layer host points, without credentials."
+    if "master_name" in host:
+        return f"sentinel master {host['master_name']}"
+    if "address" in host:
+        parts = urlsplit(host["address"])
+        return f"{parts.hostname}:{parts.port or 6379}{parts.path}"
+    return f"{host.get('host')}:{host.get('port', 6379)}"
+
+
+def describe_pools(caches: dict, channel_layers: dict) -> list:
+    "Lines describing the Redis connection pools one worker process opens, at most."
+    lines = []
+    sizes = []
+
+    cache = caches.get("default", {})
+    if cache.get("BACKEND") == "django_redis.cache.RedisCache":
+        options = cache.get("OPTIONS", {})
+        size = options.get("CONNECTION_POOL_KWARGS", {}).get("max_connections")
+        location = urlsplit(cache["LOCATION"])
+        via = " via sentinels" if "SENTINELS" in options else ""
+        lines.append(
+            f"cache, vote store, event log: {location.hostname}{location.path}{via}, "
+            f"pool of {size or 'unlimited'}"
+        )
+        sizes.append(size)
+    else:
+        lines.append(f"cache: {cache.get('BACKEND', 'none')} (no Redis pool)")
+
+    layer = channel_layers.get("default", {})
+    if layer.get("BACKEND") == "channels_redis.core.RedisChannelLayer":
+        hosts = layer.get("CONFIG", {}).get("hosts", [])
+        shards = "one host" if len(hosts) == 1 else f"groups sharded across {len(hosts)} hosts"
+        lines.append(f"channel layer: {shards}, one pool per host and event loop")
+        for host in hosts:
+            size = host.get("max_connections") if isinstance(host, dict) else None
+            described = describe_host(host) if isinstance(host, dict) else str(host)
+            lines.append(f"  {described}, pool of {size or 'unlimited'}")
+            sizes.append(size)
+    else:
+        lines.append(f"channel layer: {layer.get('BACKEND', 'none')} (no Redis pool)")
+
+    if sizes and None not in sizes:
+        lines.append(f"up to {sum(sizes)} Redis connections per worker")
+    return lines
@@ -6,6 +6,7 @@ from django.contrib.messages import constants as message_constants
 
 # Load secrets from ENV VARS or local json/yml and hoist them into django settings
 from .config import config
+from .redis_layout import cache_settings, channel_layer_settings
 
 config.load()
 
@@ -200,21 +201,11 @@ LOGOUT_REDIRECT_URL = "account_login"
 REQUIRE_LOGIN_PUBLIC_NAMED_URLS = (LOGIN_URL, LOGOUT_REDIRECT_URL)
 
 
-# Use Redis caching if enabled for this project; else db caching
+# Use Redis caching if enabled for this project; else db caching.
+# Cache and channel layer share the REDIS_* config, see redis_layout.py
 REDIS_ENABLED = config.REDIS_ENABLED
 if REDIS_ENABLED:
-    CACHES = {
-        "default": {
-            "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": f"{config.REDIS_URL}/0",
-            "OPTIONS": {
-                "CLIENT_CLASS": "django_redis.client.DefaultClient",
-                "IGNORE_EXCEPTIONS": False,
-            },
-            "KEY_PREFIX": config.REDIS_PREFIX,
-            "TIMEOUT": 60 * 60 * 24 * 30,  # 30 days
-        }
-    }
+    CACHES = {"default": cache_settings(config)}
 else:
     CACHES = {
         "default": {
@@ -260,11 +251,27 @@ CRISPY_TEMPLATE_PACK = "bootstrap4"
 
 ASGI_APPLICATION = "poynter.config.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
-        },
-    },
-}
+# Worker processes for manage.py serve_asgi (0: one per available CPU, or 1 without Redis)
+# and their shutdown grace period
+ASGI_WORKERS = config.ASGI_WORKERS
+ASGI_DRAIN_SECONDS = config.ASGI_DRAIN_SECONDS
+
+# Push shared (non-personalized) widget HTML to the space instead of per-client re-fetch
+BROADCAST_SHARED_WIDGETS = config.BROADCAST_SHARED_WIDGETS
+
+# HTMX partials are served by views_htmx_async instead of views_htmx
+ASYNC_VIEWS = config.ASYNC_VIEWS
+
+# Ticket titles are fetched from their URLs by a background pool of this size
+TITLE_FETCH_WORKERS = config.TITLE_FETCH_WORKERS
+
+# Ticket table refreshes for fetched titles within this many ms are sent as one broadcast
+REFRESH_DEBOUNCE_MS = config.REFRESH_DEBOUNCE_MS
+
+# Vote store backend, see points/votes.py
+VOTE_STORE = config.VOTE_STORE
+
+# Votes are copied to the Vote table in batches at this interval
+VOTE_FLUSH_MS = config.VOTE_FLUSH_MS
+
+CHANNEL_LAYERS = {"default": channel_layer_settings(config)}
@@ -1,6 +1,7 @@
 """
 Settings and variables specific to the test runner.
 """
+
 import os
 from .settings import *  # noqa
 
@@ -43,13 +44,25 @@ CONCURRENT_MAX_WORKERS = 1
 
 CACHEOPS_ENABLED = False
 
+# CHANNELS
+# ------------------------------------------------------------------------------
+# Broadcasts from ops go to an in-process layer so tests don't need Redis.
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+# Broadcast and write votes immediately, so no timer outlives the test that started it.
+REFRESH_DEBOUNCE_MS = 0
+VOTE_FLUSH_MS = 0
+
 # File Storage
 # ------------------------------------------------------------------------------
 # Instead of having to deal with S3/boto for dynamically spun up test envs, use local file store in tests
 STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
-    }
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
 }
 
 
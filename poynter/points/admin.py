@@ -1,28 +1,64 @@
+from operator import attrgetter
+
 from django.contrib import admin
 from django.db import models
 from jsoneditor.forms import JSONEditor
 
 from .forms import TicketForm
-from .models import Project, Snapshot, Space, Ticket
+from .models import Project, Snapshot, Space, Ticket, Vote
+from .state import invalidate_space_state
+
+
+class InvalidatesSpaceState:
+    """Admin edits change what the HTMX partials show, so like ops they must
+    invalidate the cached state and version of each space they touch (state.py).
+    space_slug_path is the lookup from the model to its space's slug."""
+
+    space_slug_path = "slug"
+
+    def space_slug(self, obj) -> str:
+        return attrgetter(self.space_slug_path.replace("__", "."))(obj)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        invalidate_space_state(self.space_slug(form.instance))
 
-class TicketAdmin(admin.ModelAdmin):
+    def delete_model(self, request, obj):
+        slug = self.space_slug(obj)
+        super().delete_model(request, obj)
+        invalidate_space_state(slug)
+
+    def delete_queryset(self, request, queryset):
+        slugs = set(queryset.values_list(self.space_slug_path, flat=True))
+        super().delete_queryset(request, queryset)
+        for slug in slugs:
+            invalidate_space_state(slug)
+
+
+class TicketAdmin(InvalidatesSpaceState, admin.ModelAdmin):
     form = TicketForm
     list_display = ("title", "active", "archived", "space", "created")
+    space_slug_path = "space__slug"
 
 
-class SpaceAdmin(admin.ModelAdmin):
+class SpaceAdmin(InvalidatesSpaceState, admin.ModelAdmin):
     list_display = ("project", "moderator", "is_open")
     filter_horizontal = ("members",)
 
 
 class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ("space", "created", "is_checkpoint")
     formfield_overrides = {
         models.JSONField: {"widget": JSONEditor()},
     }
 
 
+class VoteAdmin(admin.ModelAdmin):
+    list_display = ("ticket", "username", "choice", "modified")
+
+
 admin.site.register(Space, SpaceAdmin)
 admin.site.register(Ticket, TicketAdmin)
 admin.site.register(Project)
 admin.site.register(Snapshot, SnapshotAdmin)
+admin.site.register(Vote, VoteAdmin)
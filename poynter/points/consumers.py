@@ -1,29 +1,170 @@
 import json
+from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from poynter.points.events import get_event_log
+from poynter.points.models import Space
+from poynter.points.ops import acast_vote, asend_member_presence
+from poynter.points.presence import get_presence
+from poynter.points.state import abump_space_version, aget_space_state
+from poynter.points.views_htmx import MODERATOR_WIDGETS
+from poynter.points.votes import VOTE_CHOICES
+
 
 class BroadcastConsumer(AsyncWebsocketConsumer):
     """Note two types of consumers here:
-    - broadcast_html_update() sends a block of HTML to all clients at once
+    - broadcast_html_update() sends a block of HTML to all clients at once.
+        Only used for widgets that look the same to every member
+        (views_htmx.SHARED_WIDGETS), so it is rendered once instead of per client.
     - unicast_refresh() just sends a notice to clients that they should refresh
         from source - they will make their own request to get new content.
         We have settled on this approach throughout for consistency and to
         ensure that each request.user is handled correctly in each view.
+    - batch_refresh() is unicast_refresh() for several widgets in one frame.
+        This is what ops.refresh_widgets() sends.
+    - member_voted(), member_presence() and ticket_tallies() carry state changes
+        for the members widget as data, which the client applies to the DOM it
+        already has.
+
+    The space moderator's sockets also join a moderator group, which receives
+    refreshes for widgets only the moderator has (views_htmx.MODERATOR_WIDGETS).
+
+    Clients also send votes up the socket (see receive()), rather than making
+    an HTTP request per vote, and a periodic heartbeat. Sockets are tracked in
+    presence.py so the members widget can show who is online.
+
+    Events that redraw widgets for the whole space carry a per-space 'seq' (see events.py). Clients
+    connect with ?since=<seq applied through> and first receive a resume frame
+    listing the widgets changed since then, or target_ids null if that's unknown.
+    They ask for the same over the socket when an event goes missing.
     """
 
     async def connect(self):
         self.space_name = self.scope["url_route"]["kwargs"]["space_name"]
         self.room_group_name = f"broadcast_{self.space_name}"
+        self.moderator_group_name = f"moderators_{self.space_name}"
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
+        self.is_moderator = await self.user_is_moderator()
+        if self.is_moderator:
+            await self.channel_layer.group_add(self.moderator_group_name, self.channel_name)
+
         await self.accept()
+        await self.update_presence("connect")
+
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        if since and since[0].isdigit():
+            await self.send_resume(int(since[0]), reconnect=True)
+
+    async def send_resume(self, since: int, applied=(), reconnect: bool = False):
+        """Tell a client which widgets changed after `since` in events other than
+        those it has `applied`, e.g. while it was away."""
+        latest, target_ids = await sync_to_async(get_event_log().since)(
+            self.space_name, since, applied
+        )
+        # Refreshes of the moderator's widgets aren't numbered, so aren't in the log
+        if target_ids is not None and reconnect and self.is_moderator:
+            target_ids += [elem for elem in sorted(MODERATOR_WIDGETS) if elem not in target_ids]
+        await self.send(
+            text_data=json.dumps({"type": "resume", "seq": latest, "target_ids": target_ids})
+        )
 
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, "is_moderator", False):
+            await self.channel_layer.group_discard(self.moderator_group_name, self.channel_name)
+        await self.update_presence("disconnect")
+
+    async def update_presence(self, action: str):
+        """List, keep or drop this socket in the space's presence set (see presence.py)
+        and tell clients which members came online or went offline as a result,
+        including members whose sockets timed out."""
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return
+        update = getattr(get_presence(), action)
+        changes = await sync_to_async(update)(self.space_name, user.username, self.channel_name)
+        if not changes:
+            return
+        # The widget only lists members; other visitors coming and going don't show
+        state = await aget_space_state(self.space_name)
+        members = {member.username for member in state.members}
+        changes = {username: online for username, online in changes.items() if username in members}
+        if changes:
+            await abump_space_version(self.space_name)
+            await asend_member_presence(self.space_name, changes)
+
+    @database_sync_to_async
+    def user_is_moderator(self) -> bool:
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return False
+        return Space.objects.filter(slug=self.space_name, moderator=user).exists()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Votes from the voting row arrive as
+        {"type": "vote", "ticket": 17, "number": 5}
+        and are answered with {"type": "vote_ack", ...} or {"type": "vote_error", ...}.
+
+        {"type": "heartbeat"} keeps the socket in the presence set; no answer.
+
+        {"type": "resume", "since": 12, "applied": [14]} is answered with a resume
+        frame, as on connect; clients send it when event 13 doesn't arrive.
+        """
+        try:
+            message = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get("type") == "heartbeat":
+            await self.update_presence("heartbeat")
+            return
+        if message.get("type") == "resume":
+            try:
+                since = int(message["since"])
+                applied = {int(seq) for seq in message.get("applied") or ()}
+            except (TypeError, ValueError, KeyError):
+                return
+            await self.send_resume(since, applied)
+            return
+        if message.get("type") != "vote":
+            return
+        try:
+            ticket_id, choice = int(message["ticket"]), int(message["number"])
+        except (TypeError, ValueError, KeyError):
+            return
+
+        error = await self.record_vote(ticket_id, choice)
+        reply = {"type": "vote_error", "error": error} if error else {"type": "vote_ack"}
+        await self.send(text_data=json.dumps(reply | {"ticket": ticket_id, "number": choice}))
+
+    async def record_vote(self, ticket_id: int, choice: int) -> str | None:
+        """Cast a vote as the socket's user, if they may vote on this ticket now.
+        Returns the reason if not."""
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return "Log in to vote."
+
+        state = await aget_space_state(self.space_name)
+        if not state.space.is_open:
+            return "Voting is closed in this space."
+        if user.pk not in {member.pk for member in state.members}:
+            return "You are not a voting member - join space to vote."
+        ticket = state.active_ticket
+        if ticket is None or ticket.id != ticket_id or ticket.closed:
+            return "Voting on this ticket has ended."
+        if choice not in dict(VOTE_CHOICES):
+            return "Not a valid vote."
+
+        await acast_vote(self.space_name, ticket_id, user.username, choice)
+        return None
 
     # Receive message from room group (for demo purpose unless we )
     async def broadcast_message(self, event):
@@ -35,7 +176,7 @@ class BroadcastConsumer(AsyncWebsocketConsumer):
 
     async def broadcast_html_update(self, event):
         """Broadcast pre-rendered HTML to all users of the space.
-        Essentially deprecated but leaving in place in case useful."""
+        Used by ops.refresh_widgets() for shared, non-personalized widgets."""
         html_content = event["html_content"]
         target_element = event["target_element"]
 
@@ -46,6 +187,7 @@ class BroadcastConsumer(AsyncWebsocketConsumer):
                     "type": "html_update",
                     "html_content": html_content,
                     "target_element": target_element,
+                    "seq": event.get("seq"),
                 }
             )
         )
@@ -56,5 +198,66 @@ class BroadcastConsumer(AsyncWebsocketConsumer):
         """
         # Send trigger-only update to WebSocket
         await self.send(
-            text_data=json.dumps({"type": "unicast_refresh", "target_id": event["target_id"]})
+            text_data=json.dumps(
+                {
+                    "type": "unicast_refresh",
+                    "target_id": event["target_id"],
+                    "seq": event.get("seq"),
+                }
+            )
+        )
+
+    async def batch_refresh(self, event):
+        """Unicast refresh for several widgets at once.
+        Event should contain 'target_ids', a list of elements to refresh.
+        """
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "batch_refresh",
+                    "target_ids": event["target_ids"],
+                    "seq": event.get("seq"),
+                }
+            )
+        )
+
+    async def member_voted(self, event):
+        """A member voted on a ticket (see ops.send_member_voted()).
+        Event contains 'ticket' and 'username'.
+        """
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "member_voted",
+                    "ticket": event["ticket"],
+                    "username": event["username"],
+                    "seq": event.get("seq"),
+                }
+            )
+        )
+
+    async def member_presence(self, event):
+        """Members came online or went offline (see ops.asend_member_presence()).
+        Event contains 'online' ({username: now online}).
+        """
+        await self.send(
+            text_data=json.dumps(
+                {"type": "member_presence", "online": event["online"], "seq": event.get("seq")}
+            )
+        )
+
+    async def ticket_tallies(self, event):
+        """A ticket was closed (see ops.send_ticket_tallies()).
+        Event contains 'ticket', 'votes' ({username: choice}) and 'aggregate'.
+        """
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "ticket_tallies",
+                    "ticket": event["ticket"],
+                    "votes": event["votes"],
+                    "aggregate": event["aggregate"],
+                    "seq": event.get("seq"),
+                }
+            )
         )
@@ -0,0 +1,82 @@
+import threading
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+"""
+Coalesce bursts of widget refreshes for a space into one broadcast.
+
+Used for the ticket table as background title fetches finish (see
+titles.resolve_title()): tickets added one after another resolve their titles
+within moments of each other, and each would otherwise push the table to every
+client. Votes don't come through here; they send member_voted deltas instead.
+
+The first request for a (space, widget) pair opens a window of
+REFRESH_DEBOUNCE_MS; later requests inside that window are folded into it and
+a single refresh goes out when the window closes. Because the broadcast is
+sent after the window, every title written during it is in the table clients get.
+
+Within a process, pending widgets are tracked in memory. Across processes, a
+short-lived cache key per (space, widget) marks that some process already has
+a broadcast scheduled, so the others can drop their request.
+"""
+
+
+class RefreshDebouncer:
+    """Trailing-edge debounce in front of a refresh function
+    with the signature of ops.refresh_widgets(space_name, element_names).
+    """
+
+    def __init__(self, flush: Callable[[str, list], None]):
+        self.flush = flush
+        self._lock = threading.Lock()
+        self._pending: dict[str, list] = {}
+
+    @staticmethod
+    def _claim_key(space_name: str, element_name: str) -> str:
+        return f"refresh_debounce:{space_name}:{element_name}"
+
+    def request(self, space_name: str, element_names: list):
+        "Ask for a refresh of `element_names` in this space at the end of the current window."
+        window = settings.REFRESH_DEBOUNCE_MS / 1000
+        if window <= 0:
+            self.flush(space_name, list(element_names))
+            return
+
+        with self._lock:
+            pending = self._pending.get(space_name, [])
+            wanted = [name for name in element_names if name not in pending]
+
+        # Skip widgets another process will already refresh. The claim outlives the
+        # window so it can't expire before the owner flushes, and is deleted at flush.
+        claimed = [
+            name for name in wanted if cache.add(self._claim_key(space_name, name), 1, window * 2)
+        ]
+        if not claimed:
+            return
+
+        with self._lock:
+            start_window = space_name not in self._pending
+            pending = self._pending.setdefault(space_name, [])
+            pending.extend(name for name in claimed if name not in pending)
+
+        if start_window:
+            timer = threading.Timer(window, self._fire, args=(space_name,))
+            timer.daemon = True
+            timer.start()
+
+    def _fire(self, space_name: str):
+        with self._lock:
+            element_names = self._pending.pop(space_name, [])
+
+        # Release claims before broadcasting, so a write landing after this point
+        # opens a new window rather than being folded into a refresh already sent.
+        cache.delete_many([self._claim_key(space_name, name) for name in element_names])
+        try:
+            if element_names:
+                self.flush(space_name, element_names)
+        finally:
+            # Flushing may render shared widgets; don't leak this timer thread's connection
+            connections.close_all()
@@ -0,0 +1,148 @@
+import json
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from poynter.points.redis_store import RedisStore
+
+"""
+Sequence numbers and a short replay buffer for the events sent to a space.
+
+Every channel-layer event that makes the whole space redraw something
+(ops.refresh_widgets() and the members widget deltas) is numbered per space and
+remembered with the widgets it touches. Refreshes of the moderator's own widgets
+go out unnumbered, as a number other members never get would look missed to them.
+
+Numbers are issued before the event is sent, so events sent by different
+processes can arrive out of order. Clients therefore keep the seq below which
+they have applied everything plus the seqs applied above it, and drop only
+events they have already applied.
+
+Clients reconnect with ?since=<that seq>, and ask the same over the socket when
+an event is missing for a while; the consumer then answers with a single resume
+frame listing the widgets changed since, skipping events the client says it
+has applied (see BroadcastConsumer.send_resume()). If the buffer no longer
+reaches back that far, the answer is "refresh everything".
+
+Redis layout (keys pass through cache.make_key so they share REDIS_PREFIX):
+
+    events_seq:<space_name>  last sequence number issued
+    events:<space_name>      list of "<seq> <json list of widget ids>", oldest first
+"""
+
+# Events remembered per space for replay
+EVENT_BUFFER_SIZE = 100
+
+# Replay buffers of idle spaces expire; the sequence counter never does
+EVENT_BUFFER_TTL = 86400
+
+# Issue one sequence number per event and append them to the buffer, atomically.
+# KEYS: sequence counter, buffer list. ARGV: buffer size, ttl, then one JSON list per event
+RECORD_EVENTS_SCRIPT = """
+local count = #ARGV - 2
+local last = redis.call('INCRBY', KEYS[1], count)
+for i = 1, count do
+    redis.call('RPUSH', KEYS[2], (last - count + i) .. ' ' .. ARGV[i + 2])
+end
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[1]), -1)
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return last
+"""
+
+
+def replay(events: list, latest: int, since: int, applied=()) -> list | None:
+    """Widget ids touched by the buffered `events` [(seq, ids)] after `since`,
+    except those numbered in `applied`, or None if some of those events are no
+    longer buffered (or `since` comes from an earlier counter, e.g. before a restart)."""
+    if since > latest:
+        return None
+    if since < latest and (not events or events[0][0] > since + 1):
+        return None
+
+    target_ids = []
+    for seq, ids in events:
+        if seq > since and seq not in applied:
+            target_ids += [target_id for target_id in ids if target_id not in target_ids]
+    return target_ids
+
+
+class RedisEventLog(RedisStore):
+    "Per-space sequence counter and replay buffer in Redis, shared by all processes."
+
+    def _keys(self, space_name: str) -> list:
+        return [cache.make_key(f"events_seq:{space_name}"), cache.make_key(f"events:{space_name}")]
+
+    def record(self, space_name: str, events: list) -> list:
+        "Number a list of events (each a list of widget ids). Returns their sequence numbers."
+        if not events:
+            return []
+        last = int(
+            self.script(RECORD_EVENTS_SCRIPT)(
+                keys=self._keys(space_name),
+                args=[EVENT_BUFFER_SIZE, EVENT_BUFFER_TTL]
+                + [json.dumps(target_ids) for target_ids in events],
+            )
+        )
+        return list(range(last - len(events) + 1, last + 1))
+
+    def latest(self, space_name: str) -> int:
+        "Sequence number of the last event sent to a space (0 if none)."
+        return int(self.client.get(self._keys(space_name)[0]) or 0)
+
+    def since(self, space_name: str, since: int, applied=()) -> tuple:
+        """(latest seq, widget ids changed after `since` by events not in `applied`,
+        or None if unknown)."""
+        seq_key, buffer_key = self._keys(space_name)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(seq_key)
+        pipe.lrange(buffer_key, 0, -1)
+        latest, raw = pipe.execute()
+
+        events = []
+        for entry in raw:
+            seq, target_ids = entry.decode().split(" ", 1)
+            events.append((int(seq), json.loads(target_ids)))
+        latest = int(latest or 0)
+        return latest, replay(events, latest, since, applied)
+
+
+class LocalEventLog:
+    """In-process fallback for when Redis is not enabled. Same semantics;
+    numbering restarts with the process, which clients detect and recover from."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = defaultdict(int)
+        self._events = defaultdict(lambda: deque(maxlen=EVENT_BUFFER_SIZE))
+
+    def record(self, space_name: str, events: list) -> list:
+        with self._lock:
+            seqs = []
+            for target_ids in events:
+                self._latest[space_name] += 1
+                seqs.append(self._latest[space_name])
+                self._events[space_name].append((self._latest[space_name], list(target_ids)))
+            return seqs
+
+    def latest(self, space_name: str) -> int:
+        with self._lock:
+            return self._latest.get(space_name, 0)
+
+    def since(self, space_name: str, since: int, applied=()) -> tuple:
+        with self._lock:
+            latest = self._latest.get(space_name, 0)
+            events = list(self._events.get(space_name, []))
+        return latest, replay(events, latest, since, applied)
+
+
+_event_log = None
+
+
+def get_event_log():
+    "Module-level event log, Redis-backed when REDIS_ENABLED."
+    global _event_log
+    if _event_log is None:
+        _event_log = RedisEventLog() if settings.REDIS_ENABLED else LocalEventLog()
+    return _event_log
@@ -1,29 +1,18 @@
 from django import forms
 
+from poynter.points.imports import parse_ticket_rows
 from poynter.points.models import Ticket
 
 
 class TicketForm(forms.ModelForm):
-    """Used in the Admin to validate one active ticket per session.
-    self is the form; instance is the ticket.
+    """Used in the Admin to edit tickets. One active ticket per session is
+    enforced by the Ticket constraint, which ModelForm validation reports.
     """
 
     class Meta:
         model = Ticket
         fields = ["url", "title", "space", "active", "closed", "archived"]
 
-    def clean(self):
-        cleaned_data = super().clean()
-        space = cleaned_data.get("space")
-        if self.instance.active and space.ticket_set.exclude(id=self.instance.id).filter(
-            active=True
-        ):
-            raise forms.ValidationError(
-                "Another ticket is already listed as active in this Space. "
-                "Set others to Unknown before changing this one."
-            )
-        return self.cleaned_data
-
 
 class AddTicketForm(forms.ModelForm):
     """Moderator can add new tickets to a space on the fly.
@@ -33,3 +22,33 @@ class AddTicketForm(forms.ModelForm):
     class Meta:
         model = Ticket
         fields = ["url", "title"]
+
+
+class BulkTicketForm(forms.Form):
+    """Moderator can add many tickets at once, pasted or uploaded.
+    Either source holds one ticket per line: a URL, or CSV `url,title`.
+    """
+
+    urls = forms.CharField(
+        widget=forms.Textarea(attrs={"rows": 12}),
+        required=False,
+        help_text="One URL per line, or CSV rows of url,title.",
+    )
+    csv_file = forms.FileField(required=False, help_text="Or upload a CSV file of url,title.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get("urls", "")
+        if cleaned_data.get("csv_file"):
+            try:
+                text += "\n" + cleaned_data["csv_file"].read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise forms.ValidationError(
+                    {"csv_file": "Could not read this file. Save it as UTF-8 CSV and try again."}
+                ) from None
+
+        rows = parse_ticket_rows(text)
+        if not rows:
+            raise forms.ValidationError("Paste some ticket URLs or upload a CSV file.")
+        cleaned_data["rows"] = rows
+        return cleaned_data
@@ -0,0 +1,47 @@
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+
+from poynter.points.models import TITLE_PLACEHOLDER, Space, Ticket
+from poynter.points.state import invalidate_space_state
+
+"""
+Bulk ticket import, used by the bulk_add_tickets view and the import_tickets
+management command. All tickets go in with one bulk_create; titles that weren't
+supplied are resolved afterwards by titles.resolve_titles().
+"""
+
+
+def parse_ticket_rows(text: str) -> list[tuple[str, str]]:
+    """Parse pasted text or CSV into (url, title) pairs.
+    One ticket per line, either a bare URL or `url,title`. Blank lines and a
+    header row starting with "url" are skipped.
+    """
+    validate_url = URLValidator()
+    rows = []
+    for line_no, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not row[0].strip():
+            continue
+        url = row[0].strip()
+        if line_no == 1 and url.lower() == "url":
+            continue
+        try:
+            validate_url(url)
+        except ValidationError:
+            raise ValidationError(f"Line {line_no}: {url} is not a valid URL")
+        title = row[1].strip()[:120] if len(row) > 1 else ""
+        rows.append((url, title))
+    return rows
+
+
+def import_tickets(space: Space, rows: list[tuple[str, str]]) -> list[Ticket]:
+    """Insert all rows as tickets in one query. Tickets without a title get the
+    placeholder; pass their IDs to titles.resolve_titles() or queue_bulk_title_fetch().
+    """
+    tickets = Ticket.objects.bulk_create(
+        [Ticket(space=space, url=url, title=title or TITLE_PLACEHOLDER) for url, title in rows]
+    )
+    invalidate_space_state(space.slug)
+    return tickets
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncRequestFactory
+
+from poynter.points import views_htmx, views_htmx_async
+from poynter.points.models import Project, Space, Ticket
+from poynter.points.votes import VOTE_CHOICES, get_vote_store
+
+
+class Command(BaseCommand):
+    help = """Compare request throughput of the sync and async HTMX partials under
+    concurrency, as when every client in a space refreshes at once. Sync views are
+    run the way the ASGI handler runs them, through sync_to_async. Uses a throwaway
+    space, deleted afterwards.
+
+    ./manage.py benchmark_partials
+    ./manage.py benchmark_partials --widget display_widgets --requests 1000 --concurrency 100
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--widget",
+            action="append",
+            choices=list(views_htmx.WIDGETS) + ["display_widgets"],
+            help="Partial to request; repeat for several (default: display_members)",
+        )
+        parser.add_argument("--requests", type=int, default=500, help="Requests per run")
+        parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight")
+        parser.add_argument("--members", type=int, default=12, help="Members in the space")
+
+    def handle(self, *args, **options):
+        if min(options["requests"], options["concurrency"], options["members"]) < 1:
+            raise CommandError("--requests, --concurrency and --members must be at least 1")
+
+        space = self.seed(options["members"])
+        try:
+            self.stdout.write(f"{'widget':<24} {'sync req/s':>11} {'async req/s':>12}")
+            for widget in options["widget"] or ["display_members"]:
+                sync_rate = asyncio.run(self.run(space, widget, options, use_async=False))
+                async_rate = asyncio.run(self.run(space, widget, options, use_async=True))
+                self.stdout.write(f"{widget:<24} {sync_rate:>11.0f} {async_rate:>12.0f}")
+        finally:
+            get_vote_store().clear_space(space.slug)
+            space.project.delete()
+            # The moderator and members, all named after the moderator
+            User.objects.filter(username__startswith=space.moderator.username).delete()
+
+    def seed(self, members: int) -> Space:
+        "Open space with an active ticket and a vote from every member."
+        stamp = time.time_ns()
+        moderator = User.objects.create_user(username=f"benchmark-{stamp}")
+        project = Project.objects.create(name=f"Benchmark {stamp}")
+        space = Space.objects.create(project=project, moderator=moderator, is_open=True)
+        ticket = Ticket.objects.create(
+            url="http://example.com/1", title="Benchmark ticket", space=space, active=True
+        )
+        users = User.objects.bulk_create(
+            User(username=f"benchmark-{stamp}-{n}") for n in range(members)
+        )
+        space.members.add(moderator, *users)
+        for n, user in enumerate(users):
+            get_vote_store().record_vote(
+                space.slug, ticket.id, user.username, VOTE_CHOICES[n % len(VOTE_CHOICES)][0]
+            )
+        return space
+
+    async def run(self, space: Space, widget: str, options, use_async: bool) -> float:
+        "Requests per second for one partial, sync or async."
+        if use_async:
+            view = getattr(views_htmx_async, widget)
+        else:
+            view = sync_to_async(getattr(views_htmx, widget))
+
+        factory = AsyncRequestFactory()
+        moderator = space.moderator
+
+        async def auser():
+            return moderator
+
+        async def one_request(semaphore):
+            async with semaphore:
+                request = factory.get(f"/points/{widget}/{space.slug}")
+                request.user, request.auser = moderator, auser
+                response = await view(request, space.slug)
+                assert response.status_code == 200
+
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(semaphore) for _ in range(options["requests"])))
+        return options["requests"] / (time.perf_counter() - start)
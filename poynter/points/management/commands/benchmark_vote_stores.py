@@ -0,0 +1,121 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from poynter.points.management.stats import percentile
+from poynter.points.models import Project, Space, Ticket
+from poynter.points.votes import VOTE_CHOICES, VOTE_STORES, RedisVoteStore
+
+
+class Command(BaseCommand):
+    help = """Measure write throughput and read latency of each vote store backend
+    against a throwaway space (rolled back afterwards).
+
+    ./manage.py benchmark_vote_stores
+    ./manage.py benchmark_vote_stores --store database --votes 5000
+
+    Without REDIS_ENABLED, the redis store runs against fakeredis (a dev
+    requirement), which exercises its scripts but says nothing about Redis latency.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            action="append",
+            choices=list(VOTE_STORES),
+            help="Store to measure; repeat for several (default: all available)",
+        )
+        parser.add_argument("--votes", type=int, default=2000, help="Votes to cast per store")
+        parser.add_argument("--voters", type=int, default=12, help="Members voting")
+        parser.add_argument("--tickets", type=int, default=10, help="Tickets voted on")
+        parser.add_argument("--reads", type=int, default=200, help="Reads of each kind to time")
+
+    def handle(self, *args, **options):
+        names = options["store"] or list(VOTE_STORES)
+        if min(options["votes"], options["voters"], options["tickets"], options["reads"]) < 1:
+            raise CommandError("--votes, --voters, --tickets and --reads must be at least 1")
+
+        self.stdout.write(
+            f"{'store':<10} {'votes/sec':>10} {'ticket read p50/p95 ms':>24} "
+            f"{'space read p50/p95 ms':>23}"
+        )
+        for name in names:
+            store = redis_store() if name == "redis" else VOTE_STORES[name]()
+            result = self.measure(store, options)
+            self.stdout.write(
+                f"{name:<10} {result['votes_per_sec']:>10.0f} "
+                f"{result['ticket_read_p50']:>12.3f}/{result['ticket_read_p95']:<11.3f} "
+                f"{result['space_read_p50']:>11.3f}/{result['space_read_p95']:<11.3f}"
+            )
+        if "redis" in names and not settings.REDIS_ENABLED:
+            self.stdout.write("redis: emulated by fakeredis, as REDIS_ENABLED is off")
+
+    def measure(self, store, options) -> dict:
+        "Cast and read votes in a throwaway space; nothing written to the database is kept."
+        with transaction.atomic():
+            moderator = User.objects.create_user(username=f"benchmark-{time.time_ns()}")
+            project = Project.objects.create(name="Benchmark")
+            space = Space.objects.create(project=project, moderator=moderator, is_open=True)
+            tickets = Ticket.objects.bulk_create(
+                Ticket(url=f"http://example.com/{n}", title=f"Ticket {n}", space=space)
+                for n in range(options["tickets"])
+            )
+            ticket_ids = [ticket.id for ticket in tickets]
+            choices = [choice for choice, _ in VOTE_CHOICES]
+
+            try:
+                start = time.perf_counter()
+                for n in range(options["votes"]):
+                    store.record_vote(
+                        space.slug,
+                        ticket_ids[n % len(ticket_ids)],
+                        f"voter{n % options['voters']}",
+                        choices[n % len(choices)],
+                    )
+                elapsed = time.perf_counter() - start
+
+                ticket_reads = timings(
+                    lambda: store.get_ticket_votes(space.slug, ticket_ids[0]), options["reads"]
+                )
+                space_reads = timings(
+                    lambda: (
+                        store.get_space_votes(space.slug),
+                        store.get_space_aggregates(space.slug),
+                    ),
+                    options["reads"],
+                )
+            finally:
+                store.clear_space(space.slug)
+                transaction.set_rollback(True)
+
+        return {
+            "votes_per_sec": options["votes"] / elapsed,
+            "ticket_read_p50": percentile(ticket_reads, 50),
+            "ticket_read_p95": percentile(ticket_reads, 95),
+            "space_read_p50": percentile(space_reads, 50),
+            "space_read_p95": percentile(space_reads, 95),
+        }
+
+
+def redis_store() -> RedisVoteStore:
+    "The Redis vote store, against fakeredis unless REDIS_ENABLED."
+    if settings.REDIS_ENABLED:
+        return RedisVoteStore()
+    try:
+        import fakeredis
+    except ImportError:
+        raise CommandError("REDIS_ENABLED is off and fakeredis isn't installed (dev requirement)")
+    return RedisVoteStore(client=fakeredis.FakeStrictRedis())
+
+
+def timings(func, repeat: int) -> list:
+    "Milliseconds taken by each of `repeat` calls."
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
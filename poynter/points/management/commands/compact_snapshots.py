@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from poynter.points.models import Space
+from poynter.points.snapshots import CHECKPOINT_EVERY, compact_snapshots
+
+
+class Command(BaseCommand):
+    help = """Rewrite Snapshot history as deltas with periodic full checkpoints,
+    dropping snapshots identical to the one before them. Safe to re-run.
+
+    ./manage.py compact_snapshots
+    ./manage.py compact_snapshots shacker-cosmos --checkpoint-every 20
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("space_name", nargs="?", help="Only compact this space")
+        parser.add_argument(
+            "--checkpoint-every",
+            type=int,
+            default=CHECKPOINT_EVERY,
+            help="Store a full copy every N snapshots (default %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        if options["checkpoint_every"] < 1:
+            raise CommandError("--checkpoint-every must be at least 1")
+
+        spaces = Space.objects.all()
+        if options["space_name"]:
+            spaces = spaces.filter(slug=options["space_name"])
+            if not spaces.exists():
+                raise CommandError(f"No space {options['space_name']}")
+
+        for space in spaces:
+            kept, deleted = compact_snapshots(space, options["checkpoint_every"])
+            self.stdout.write(f"{space.slug}: kept {kept} snapshots, deleted {deleted}")
+
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,54 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from poynter.points.imports import import_tickets, parse_ticket_rows
+from poynter.points.models import TITLE_PLACEHOLDER, Space
+from poynter.points.ops import refresh_widgets
+from poynter.points.titles import resolve_titles
+
+
+class Command(BaseCommand):
+    help = """Bulk-add tickets to a space from a file of URLs (one per line, or CSV `url,title`).
+    Missing titles are fetched concurrently and the ticket table is refreshed once at the end.
+
+    ./manage.py import_tickets shacker-cosmos sprint.csv
+    pbpaste | ./manage.py import_tickets shacker-cosmos -
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("space_name", help="Slug of the space to add tickets to")
+        parser.add_argument("path", help="File of URLs or CSV rows, or - for stdin")
+
+    def handle(self, *args, **options):
+        try:
+            space = Space.objects.get(slug=options["space_name"])
+        except Space.DoesNotExist:
+            raise CommandError(f"No space {options['space_name']}")
+
+        if options["path"] == "-":
+            text = sys.stdin.read()
+        else:
+            with open(options["path"], encoding="utf-8") as f:
+                text = f.read()
+
+        try:
+            rows = parse_ticket_rows(text)
+        except ValidationError as e:
+            raise CommandError(e.message)
+
+        tickets = import_tickets(space, rows)
+        pending = [ticket.id for ticket in tickets if ticket.title == TITLE_PLACEHOLDER]
+        if pending:
+            # Refreshes the ticket table once all titles are in
+            resolved = resolve_titles(space.slug, pending)
+        else:
+            resolved = {}
+            refresh_widgets(space.slug, ["display_ticket_table"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Added {len(tickets)} tickets to {space.slug} ({len(resolved)} titles fetched)"
+            )
+        )
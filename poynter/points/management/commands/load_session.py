@@ -0,0 +1,463 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient
+from django.urls import reverse
+
+from poynter.points import routing
+from poynter.points.events import get_event_log
+from poynter.points.management.stats import percentile
+from poynter.points.models import Project, Space, Ticket
+from poynter.points.presence import HEARTBEAT_SECONDS
+from poynter.points.views_htmx import MODERATOR_WIDGETS
+from poynter.points.votes import VOTE_CHOICES, get_vote_store
+from poynter.points.writebehind import discard_queued_votes
+
+"""
+Simulated pointing sessions, all in this process: HTTP requests go through the
+ASGI handler (django.test.AsyncClient) and sockets through BroadcastConsumer
+(channels.testing.WebsocketCommunicator), sharing whichever channel layer
+CHANNEL_LAYERS configures - in-memory, or Redis when REDIS_ENABLED.
+
+Each simulated member behaves like space.html: it sends heartbeats, votes with
+tally_single, applies member_voted, member_presence, ticket_tallies and
+html_update frames in place, and follows every batch_refresh/unicast_refresh
+by fetching the partials it has, one widget directly or several through
+display_widgets. Partials are fetched with the ETag of the member's last copy,
+as a browser would. Event sequence numbers are tracked as the page does, asking
+the server for a resume when an event goes missing.
+
+A vote's latency runs from sending tally_single until every socket in its
+space (the voter's own included) has received the resulting member_voted
+frame, which is what redraws the members widget. AsyncClient runs every sync
+view on one shared thread, so latencies here include queueing behind other
+spaces' requests that a multi-worker deployment would not see: compare them
+between runs rather than against production.
+"""
+
+# How long a missing event may take to arrive before asking for it (gapWaitMs in space.html)
+GAP_WAIT_SECONDS = 1
+
+
+class Counters:
+    "Totals for one measured phase. Counted from several threads."
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.http = self.sends = self.frames = self.queries = 0
+
+    def add(self, name: str, amount: int = 1):
+        if self.enabled:
+            with self._lock:
+                setattr(self, name, getattr(self, name) + amount)
+
+
+class SimulatedMember:
+    "One member of a space: a logged-in HTTP client and a socket, as in a browser tab."
+
+    def __init__(self, space: Space, user: User, counters: Counters, tracker: "VoteTracker"):
+        self.space = space
+        self.user = user
+        self.counters = counters
+        self.tracker = tracker
+        self.client = AsyncClient()
+        self.widgets = {"display_voting_row", "display_ticket_table", "display_members"}
+        if user == space.moderator:
+            self.widgets |= MODERATOR_WIDGETS
+        self.etags = {}
+        # Space events applied: every one through applied_through, and those above it
+        self.applied_through = 0
+        self.applied_above = set()
+        self.gap_check = None
+        self.frames = 0
+        self.tallied = set()
+        self.fetches = set()
+        self.error = None
+        self.socket = None
+        self.reader = None
+        self.heartbeat = None
+
+    async def connect(self):
+        await isolated(self._connect())
+
+    async def _connect(self):
+        await self.client.aforce_login(self.user)
+        # The page is drawn as of the latest event, and its socket resumes from there
+        self.applied_through = await sync_to_async(get_event_log().latest)(self.space.slug)
+        path = f"ws/broadcast/{self.space.slug}?since={self.applied_through}"
+        self.socket = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), path)
+        self.socket.scope["user"] = self.user
+        connected, _ = await self.socket.connect()
+        if not connected:
+            raise CommandError(f"Socket refused for {self.user.username}")
+        self.reader = asyncio.create_task(self.read())
+        self.heartbeat = asyncio.create_task(self.beat())
+
+    async def disconnect(self):
+        if self.gap_check is not None:
+            self.gap_check.cancel()
+        self.heartbeat.cancel()
+        self.reader.cancel()
+        await self.socket.disconnect()
+
+    async def request(self, method: str, url: str, data=None, **headers):
+        self.counters.add("http")
+        response = await isolated(getattr(self.client, method)(url, data, **headers))
+        if response.status_code >= 400:
+            raise CommandError(f"{method.upper()} {url} answered {response.status_code}")
+        return response
+
+    async def beat(self):
+        "Stay listed as online (see presence.py)."
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await self.socket.send_to(text_data=json.dumps({"type": "heartbeat"}))
+
+    async def read(self):
+        while True:
+            frame = json.loads(await self.socket.receive_from(timeout=None))
+            self.frames += 1
+            self.counters.add("frames")
+            self.handle(frame)
+
+    def handle(self, frame: dict):
+        "socket.onmessage from space.html."
+        if frame.get("type") == "resume":
+            self.resumed_through(frame["seq"], frame["target_ids"] is None)
+            target_ids = frame["target_ids"]
+            self.background(self.refresh(list(self.widgets) if target_ids is None else target_ids))
+            return
+        seq = frame.get("seq")
+        if seq is not None:
+            # Only drop events already applied; events can arrive out of order
+            if seq <= self.applied_through or seq in self.applied_above:
+                return
+            self.mark_applied(seq)
+
+        if frame.get("type") in ("batch_refresh", "unicast_refresh"):
+            # In the background, as htmx does, so later frames aren't held up
+            self.background(self.refresh(frame.get("target_ids") or [frame["target_id"]]))
+        elif frame.get("type") == "member_voted":
+            self.tracker.received(self.space.slug, frame["ticket"], frame["username"])
+        elif frame.get("type") == "ticket_tallies":
+            self.tallied.add(frame["ticket"])
+
+    def mark_applied(self, seq: int):
+        self.applied_above.add(seq)
+        while self.applied_through + 1 in self.applied_above:
+            self.applied_through += 1
+            self.applied_above.discard(self.applied_through)
+        # An earlier event is still missing: give it a moment, then ask what it changed
+        if self.applied_above and self.gap_check is None:
+            self.gap_check = asyncio.get_running_loop().call_later(
+                GAP_WAIT_SECONDS, self.request_resume
+            )
+
+    def request_resume(self):
+        self.gap_check = None
+        if self.applied_above:
+            frame = {
+                "type": "resume",
+                "since": self.applied_through,
+                "applied": sorted(self.applied_above),
+            }
+            self.background(self.socket.send_to(text_data=json.dumps(frame)))
+
+    def resumed_through(self, seq: int, restarted: bool):
+        self.applied_through = seq
+        self.applied_above = set() if restarted else {s for s in self.applied_above if s > seq}
+        if self.gap_check is not None:
+            self.gap_check.cancel()
+            self.gap_check = None
+
+    def background(self, coro):
+        "Run coro alongside the reader; run() waits for these to finish."
+        fetch = asyncio.create_task(coro)
+        self.fetches.add(fetch)
+        fetch.add_done_callback(self.fetched)
+
+    def fetched(self, fetch: asyncio.Task):
+        self.fetches.discard(fetch)
+        if not fetch.cancelled() and fetch.exception():
+            self.reader.cancel()
+            self.error = fetch.exception()
+
+    async def refresh(self, target_ids: list):
+        "refreshWidgets() from space.html."
+        present = [target for target in target_ids if target in self.widgets]
+        if len(present) == 1:
+            url = reverse(f"points:{present[0]}", args=[self.space.slug])
+        elif present:
+            url = reverse("points:display_widgets", args=[self.space.slug])
+            url += "?widgets=" + ",".join(present)
+        else:
+            return
+
+        headers = {"HTTP_IF_NONE_MATCH": self.etags[url]} if url in self.etags else {}
+        response = await self.request("get", url, **headers)
+        if response.has_header("ETag"):
+            self.etags[url] = response["ETag"]
+
+    async def vote(self, ticket_id: int, choice: int):
+        self.tracker.sent(self.space.slug, ticket_id, self.user.username)
+        await self.request(
+            "post",
+            reverse("points:tally_single"),
+            {
+                "space": self.space.slug,
+                "username": self.user.username,
+                "ticket": ticket_id,
+                "number": choice,
+            },
+        )
+
+
+class VoteTracker:
+    "Times each vote until every socket in its space has received it."
+
+    def __init__(self, sockets_per_space: int):
+        self.sockets_per_space = sockets_per_space
+        self.pending = {}
+        self.latencies = []
+
+    def sent(self, space_name: str, ticket_id: int, username: str):
+        self.pending[(space_name, ticket_id, username)] = [time.perf_counter(), 0]
+
+    def received(self, space_name: str, ticket_id: int, username: str):
+        vote = self.pending.get((space_name, ticket_id, username))
+        if vote is None:
+            return
+        vote[1] += 1
+        if vote[1] == self.sockets_per_space:
+            self.latencies.append((time.perf_counter() - vote[0]) * 1000)
+            del self.pending[(space_name, ticket_id, username)]
+
+
+class Command(BaseCommand):
+    help = """Run simulated pointing sessions: --spaces spaces of --members members
+    each vote on --tickets tickets in turn, the moderator activating each ticket and
+    closing it once everyone has voted. Reports vote-to-refresh latency percentiles
+    and the HTTP requests, channel-layer sends, WebSocket frames and DB queries
+    per vote. Uses throwaway spaces, deleted afterwards.
+
+    ./manage.py load_session
+    ./manage.py load_session --spaces 20 --members 12 --tickets 5 --think-ms 500
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--spaces", type=int, default=4, help="Spaces voting at once")
+        parser.add_argument("--members", type=int, default=8, help="Members per space")
+        parser.add_argument("--tickets", type=int, default=3, help="Tickets voted on per space")
+        parser.add_argument(
+            "--think-ms", type=int, default=100, help="Most time a member takes to vote"
+        )
+        parser.add_argument("--seed", type=int, help="Random seed, to repeat a run")
+
+    def handle(self, *args, **options):
+        if min(options["spaces"], options["members"], options["tickets"]) < 1:
+            raise CommandError("--spaces, --members and --tickets must be at least 1")
+        if options["think_ms"] < 0:
+            raise CommandError("--think-ms can't be negative")
+        self.random = random.Random(options["seed"])
+
+        stamp = time.time_ns()
+        spaces = [self.seed(stamp, n, options) for n in range(options["spaces"])]
+        counters = Counters()
+        tracker = VoteTracker(options["members"])
+        members = {
+            space: [
+                SimulatedMember(space, user, counters, tracker)
+                for user in space.members.order_by("id")
+            ]
+            for space in spaces
+        }
+        tickets = {space: list(space.ticket_set.values_list("id", flat=True)) for space in spaces}
+        try:
+            with count_queries(counters), count_sends(counters):
+                elapsed = asyncio.run(self.run(members, tickets, options))
+        finally:
+            for space in spaces:
+                get_vote_store().clear_space(space.slug)
+                discard_queued_votes(space.slug)
+                space.project.delete()
+            User.objects.filter(username__startswith=f"load-{stamp}-").delete()
+
+        self.report(counters, tracker, elapsed, options)
+
+    def seed(self, stamp: int, number: int, options) -> Space:
+        "Open space whose members (the moderator among them) have all joined."
+        prefix = f"load-{stamp}-{number}"
+        users = User.objects.bulk_create(
+            User(username=f"{prefix}-{n}") for n in range(options["members"])
+        )
+        project = Project.objects.create(name=f"Load {stamp} {number}")
+        space = Space.objects.create(project=project, moderator=users[0], is_open=True)
+        space.members.add(*users)
+        Ticket.objects.bulk_create(
+            Ticket(url=f"http://example.com/{n}", title=f"Ticket {n}", space=space)
+            for n in range(options["tickets"])
+        )
+        return space
+
+    async def run(self, members: dict, tickets: dict, options) -> float:
+        "Connect everyone, run every space's session at once. Returns the seconds taken."
+        everyone = [member for group in members.values() for member in group]
+        counters = everyone[0].counters
+
+        # Members coming online redraw each other's members widget; not measured
+        await asyncio.gather(*(self.join(group) for group in members.values()))
+
+        counters.enabled = True
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                self.session(space, group, tickets[space], options)
+                for space, group in members.items()
+            )
+        )
+        elapsed = time.perf_counter() - start
+        counters.enabled = False
+
+        await asyncio.gather(*(member.disconnect() for member in everyone))
+        return elapsed
+
+    async def join(self, members: list):
+        """Connect a space's members one at a time, each time waiting until everyone
+        connected has seen the newcomer come online."""
+        for count, member in enumerate(members, 1):
+            online = members[:count]
+            frames = [peer.frames for peer in online]
+            await member.connect()
+            await wait_for(
+                online, lambda: all(peer.frames > seen for peer, seen in zip(online, frames))
+            )
+
+    async def session(self, space: Space, members: list, ticket_ids: list, options):
+        "The moderator (members[0]) takes the space through every ticket."
+        moderator = members[0]
+        choices = [choice for choice, _ in VOTE_CHOICES]
+
+        async def vote(member, ticket_id):
+            await asyncio.sleep(self.random.uniform(0, options["think_ms"]) / 1000)
+            await member.vote(ticket_id, self.random.choice(choices))
+
+        for ticket_id in ticket_ids:
+            await moderator.request(
+                "get", reverse("points:activate_ticket", args=[space.slug, ticket_id]) + "?active=1"
+            )
+            await asyncio.gather(*(vote(member, ticket_id) for member in members))
+            await moderator.request(
+                "get",
+                reverse("points:open_close_ticket", args=[space.slug, ticket_id]) + "?closed=1",
+            )
+
+        # Done once everyone has the last ticket's results and has redrawn for it
+        await wait_for(members, lambda: all(ticket_ids[-1] in member.tallied for member in members))
+
+    def report(self, counters: Counters, tracker: VoteTracker, elapsed: float, options):
+        votes = options["spaces"] * options["members"] * options["tickets"]
+        layer = type(get_channel_layer()).__name__
+        latencies = tracker.latencies
+        self.stdout.write(
+            f"{options['spaces']} spaces x {options['members']} members x "
+            f"{options['tickets']} tickets: {votes} votes in {elapsed:.2f}s ({layer})"
+        )
+        if tracker.pending:
+            self.stdout.write(f"{len(tracker.pending)} votes never reached every socket")
+        if latencies:
+            self.stdout.write(
+                "vote-to-refresh ms: "
+                + "  ".join(f"p{pct} {percentile(latencies, pct):.1f}" for pct in (50, 90, 99))
+                + f"  max {max(latencies):.1f}"
+            )
+        self.stdout.write(
+            f"per vote: {counters.http / votes:.2f} HTTP requests, "
+            f"{counters.sends / votes:.2f} channel-layer sends, "
+            f"{counters.frames / votes:.2f} WebSocket frames, "
+            f"{counters.queries / votes:.2f} DB queries"
+        )
+
+
+async def isolated(coro):
+    """Run coro in a fresh context, as a server does for each connection. asgiref
+    keeps the sync thread a view is running async_to_sync() from in a context
+    variable that copied contexts share, so without this, one simulated client's
+    sync_to_async() calls can be sent to another's finished view thread and hang."""
+    return await asyncio.create_task(coro, context=contextvars.Context())
+
+
+async def wait_for(members: list, condition):
+    "Wait until condition() holds and none of members has a fetch in flight."
+    while True:
+        for member in members:
+            if member.error:
+                raise member.error
+            if member.reader.done():
+                member.reader.result()
+        if condition() and not any(member.fetches for member in members):
+            return
+        await asyncio.sleep(0.01)
+
+
+class count_queries:
+    """Count queries on every database connection, whichever thread opens it.
+    Each connection gets the wrapper through connection.execute_wrapper(), and
+    loses it again on exit."""
+
+    def __init__(self, counters: Counters):
+        self.counters = counters
+        self.lock = threading.Lock()
+        self.installed = contextlib.ExitStack()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.counters.add("queries")
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=connection, **kwargs):
+        with self.lock:
+            if self not in connection.execute_wrappers:
+                self.installed.enter_context(connection.execute_wrapper(self))
+
+    def __enter__(self):
+        self.install()
+        connection_created.connect(self.install, weak=False)
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        with self.lock:
+            self.installed.close()
+
+
+class count_sends:
+    """Count group_send calls on the channel layer, which is how every event in
+    ops.py goes out (one per event, however many sockets it reaches)."""
+
+    def __init__(self, counters: Counters):
+        self.counters = counters
+        self.layer = get_channel_layer()
+
+    def __enter__(self):
+        original = self.layer.group_send
+
+        async def group_send(*args, **kwargs):
+            self.counters.add("sends")
+            return await original(*args, **kwargs)
+
+        self.layer.group_send = group_send
+
+    def __exit__(self, *exc_info):
+        del self.layer.group_send
@@ -0,0 +1,326 @@
+import argparse
+import json
+import math
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from daphne.server import Server  # Installs the asyncio reactor; import before twisted
+from daphne.ws_protocol import WebSocketProtocol
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from twisted.internet import reactor
+from twisted.internet.endpoints import AdoptedStreamServerEndpoint
+
+from poynter.config.redis_layout import describe_pools
+
+# WebSocket close code telling clients the server is restarting; they reconnect and resume.
+# Mirrors 1012 Service Restart, which autobahn won't let a server send.
+SERVICE_RESTART = 4012
+
+# Seconds between updates of each worker's status file
+STATUS_INTERVAL = 5
+
+# A worker exiting sooner than this after it started is treated as a startup failure
+STARTUP_SECONDS = 10
+
+# CPU quota of the container we run in: cgroup v2, then v1 (quota and period in µs)
+CGROUP_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+CGROUP_V1_CPU = Path("/sys/fs/cgroup/cpu")
+
+
+def status_dir(port: int) -> Path:
+    "Where workers serving `port` write their connection counts."
+    return Path(tempfile.gettempdir()) / f"poynter-asgi-{port}"
+
+
+def cgroup_cpu_limit() -> int | None:
+    "CPUs allowed by the container's CPU quota, rounded up, or None if it has none."
+    try:
+        quota, period = CGROUP_CPU_MAX.read_text().split()
+    except (OSError, ValueError):
+        try:
+            quota = (CGROUP_V1_CPU / "cpu.cfs_quota_us").read_text().strip()
+            period = (CGROUP_V1_CPU / "cpu.cfs_period_us").read_text().strip()
+        except OSError:
+            return None
+    try:
+        quota, period = int(quota), int(period)
+    except ValueError:  # "max": no quota
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, math.ceil(quota / period))
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, capped by the container's CPU quota.
+    os.cpu_count() reports the host's cores, however few the container gets."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not on Linux
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+
+def unshared_state() -> str | None:
+    "Why worker processes would each keep their own votes, events and sockets, if so."
+    if not settings.REDIS_ENABLED:
+        return "REDIS_ENABLED is off, so the channel layer, cache and vote store are per process"
+    if settings.VOTE_STORE == "local":
+        return "VOTE_STORE is local, so each process would keep its own votes"
+    return None
+
+
+class WorkerServer(Server):
+    """daphne Server for one worker process: serves an inherited listening socket,
+    reports its connection counts to a status file, and drains on SIGTERM.
+    """
+
+    def __init__(self, *args, fileno: int, status_path: Path, drain_seconds: int, **kwargs):
+        # daphne only builds endpoints from strings, and twisted has no string form for
+        # an inherited TCP socket; this one is only a label, run() adopts the socket.
+        super().__init__(*args, endpoints=[f"fd:fileno={fileno}"], signal_handlers=False, **kwargs)
+        self.fileno = fileno
+        self.status_path = status_path
+        self.drain_seconds = drain_seconds
+        self.ports = []
+        self.draining = False
+
+    def listen_success(self, port):
+        self.ports.append(port)
+        super().listen_success(port)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: reactor.callFromThread(self.drain))
+        signal.signal(signal.SIGINT, lambda *_: reactor.callFromThread(self.drain))
+        self.endpoints = []
+        reactor.callWhenRunning(self.adopt_socket)
+        reactor.callLater(0, self.write_status)
+        try:
+            super().run()
+        finally:
+            self.status_path.unlink(missing_ok=True)
+
+    def adopt_socket(self):
+        sock = socket.socket(fileno=self.fileno)
+        family = sock.family
+        sock.detach()
+        listener = AdoptedStreamServerEndpoint(reactor, self.fileno, family).listen(
+            self.http_factory
+        )
+        listener.addCallback(self.listen_success)
+        listener.addErrback(self.listen_error)
+        self.listeners.append(listener)
+
+    def counts(self) -> dict:
+        "Open connections by protocol."
+        open_connections = [
+            protocol
+            for protocol, details in self.connections.items()
+            if "disconnected" not in details
+        ]
+        websockets = sum(isinstance(protocol, WebSocketProtocol) for protocol in open_connections)
+        return {"websockets": websockets, "http": len(open_connections) - websockets}
+
+    def write_status(self):
+        status = self.counts() | {
+            "pid": os.getpid(),
+            "draining": self.draining,
+            "updated": time.time(),
+        }
+        tmp = self.status_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(status))
+        tmp.replace(self.status_path)
+        if not self.draining:
+            reactor.callLater(STATUS_INTERVAL, self.write_status)
+
+    def drain(self):
+        """Stop accepting connections, ask WebSocket clients to reconnect elsewhere,
+        and stop once in-flight requests are done or drain_seconds have passed."""
+        if self.draining:
+            return
+        self.draining = True
+        for port in self.ports:
+            port.stopListening()
+        for protocol, details in list(self.connections.items()):
+            if isinstance(protocol, WebSocketProtocol) and "disconnected" not in details:
+                protocol.serverClose(code=SERVICE_RESTART)
+        self.wait_for_drain(time.monotonic() + self.drain_seconds)
+
+    def wait_for_drain(self, deadline: float):
+        self.write_status()
+        if sum(self.counts().values()) and time.monotonic() < deadline:
+            reactor.callLater(0.5, self.wait_for_drain, deadline)
+        else:
+            self.stop()
+
+
+class Command(BaseCommand):
+    help = """Serve HTTP and WebSockets (settings.ASGI_APPLICATION) from several daphne
+    worker processes sharing one listening socket. All workers use the configured
+    channel layer, so broadcasts reach sockets held by any of them.
+
+    ./manage.py serve_asgi                  # ASGI_WORKERS workers on $PORT
+    ./manage.py serve_asgi --workers 2 --port 8000
+    ./manage.py serve_asgi --status         # connection counts per worker
+
+    Workers only share votes, events and presence through Redis, so more than
+    one needs REDIS_ENABLED and a vote store other than local. Without them the
+    default is a single worker.
+
+    SIGTERM/SIGINT drain and stop all workers: they stop accepting, close
+    WebSockets with code 4012 so clients reconnect, and finish in-flight requests
+    for up to ASGI_DRAIN_SECONDS. SIGHUP replaces workers one at a time the same way.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="0.0.0.0")  # noqa: S104 - behind the router
+        parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Worker processes (default ASGI_WORKERS, or one per available CPU "
+            "if they can share state through Redis, else 1)",
+        )
+        parser.add_argument(
+            "--status", action="store_true", help="Print connection counts of running workers"
+        )
+        # Internal: run as a worker on an inherited socket
+        parser.add_argument("--worker-fd", type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            return self.print_status(options["port"])
+        if options["worker_fd"] is not None:
+            return self.run_worker(options["worker_fd"], options["port"])
+        options["workers"] = self.worker_count(options["workers"])
+        self.supervise(options)
+
+    def worker_count(self, requested: int | None) -> int:
+        "--workers, else ASGI_WORKERS, else as many as can share state. Refuses splits."
+        if requested is not None and requested < 1:
+            raise CommandError("--workers must be at least 1")
+        workers = requested or settings.ASGI_WORKERS
+        problem = unshared_state()
+        if workers < 1:
+            return 1 if problem else available_cpus()
+        if workers > 1 and problem:
+            raise CommandError(
+                f"Can't run {workers} workers: {problem}. Use one worker, or enable Redis."
+            )
+        return workers
+
+    def print_status(self, port: int):
+        rows = []
+        for path in sorted(status_dir(port).glob("*.json")):
+            try:
+                rows.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        if not rows:
+            raise CommandError(f"No workers running on port {port}")
+
+        self.stdout.write(f"{'pid':>8} {'websockets':>11} {'http':>6}  state")
+        for row in rows:
+            state = "draining" if row["draining"] else "serving"
+            self.stdout.write(f"{row['pid']:>8} {row['websockets']:>11} {row['http']:>6}  {state}")
+        self.stdout.write(
+            f"{'total':>8} {sum(row['websockets'] for row in rows):>11} "
+            f"{sum(row['http'] for row in rows):>6}"
+        )
+
+    def run_worker(self, fd: int, port: int):
+        from channels.routing import get_default_application
+
+        WorkerServer(
+            application=get_default_application(),
+            fileno=fd,
+            status_path=status_dir(port) / f"{os.getpid()}.json",
+            drain_seconds=settings.ASGI_DRAIN_SECONDS,
+            application_close_timeout=settings.ASGI_DRAIN_SECONDS,
+        ).run()
+
+    def supervise(self, options):
+        "Bind the socket, keep `workers` workers running, and drain them on signals."
+        sock = socket.create_server((options["host"], options["port"]), backlog=2048)
+        sock.set_inheritable(True)
+        status_dir(options["port"]).mkdir(exist_ok=True)
+
+        def spawn() -> subprocess.Popen:
+            worker = subprocess.Popen(  # noqa: S603 - our own argv
+                [
+                    sys.executable,
+                    "-m",
+                    "django",
+                    "serve_asgi",
+                    "--worker-fd",
+                    str(sock.fileno()),
+                    "--port",
+                    str(options["port"]),
+                ],
+                pass_fds=[sock.fileno()],
+                env=os.environ | {"DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+            )
+            worker.started = time.monotonic()
+            return worker
+
+        workers = [spawn() for _ in range(options["workers"])]
+        signals = []
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, _: signals.append(signum))
+
+        self.stdout.write(
+            f"Serving {settings.ASGI_APPLICATION} on {options['host']}:{options['port']} "
+            f"with {len(workers)} workers: {', '.join(str(w.pid) for w in workers)}"
+        )
+        self.stdout.write("Redis pools per worker:")
+        for line in describe_pools(settings.CACHES, settings.CHANNEL_LAYERS):
+            self.stdout.write(f"  {line}")
+
+        while True:
+            if signal.SIGTERM in signals or signal.SIGINT in signals:
+                break
+            if signal.SIGHUP in signals:
+                signals.clear()
+                workers = self.replace_workers(workers, spawn)
+
+            for n, worker in enumerate(workers):
+                if worker.poll() is not None:
+                    self.stderr.write(f"Worker {worker.pid} exited ({worker.returncode})")
+                    if time.monotonic() - worker.started < STARTUP_SECONDS:
+                        # Failing on startup (bad config, etc.), respawning won't help
+                        self.stop_workers(workers)
+                        raise CommandError("Worker failed to start")
+                    workers[n] = spawn()
+            time.sleep(0.5)
+
+        self.stdout.write("Draining workers")
+        sock.close()
+        self.stop_workers(workers)
+
+    def replace_workers(self, workers: list, spawn) -> list:
+        "Rolling restart: start each replacement before draining the worker it replaces."
+        replaced = []
+        for worker in workers:
+            replaced.append(spawn())
+            self.stop_workers([worker])
+        self.stdout.write(f"Workers replaced: {', '.join(str(w.pid) for w in replaced)}")
+        return replaced
+
+    def stop_workers(self, workers: list):
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + settings.ASGI_DRAIN_SECONDS + 5
+        for worker in workers:
+            try:
+                worker.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                worker.kill()
@@ -0,0 +1,12 @@
+import statistics
+
+"""
+Figures shared by the benchmark and load commands.
+"""
+
+
+def percentile(values: list, pct: int) -> float:
+    "The pct-th percentile of `values` (inclusive method, so small samples stay in range)."
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
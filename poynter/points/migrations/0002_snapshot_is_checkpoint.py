@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("points", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="snapshot",
+            name="is_checkpoint",
+            field=models.BooleanField(
+                default=True,
+                help_text="Full copy of voting state. Otherwise holds only the changes since the previous snapshot (see points/snapshots.py).",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+def deactivate_extra_tickets(apps, schema_editor):
+    "Keep only the most recent active ticket in each space, so the constraint can be added."
+    Ticket = apps.get_model("points", "Ticket")
+    seen = set()
+    for ticket in Ticket.objects.filter(active=True).order_by("space_id", "-id"):
+        if ticket.space_id in seen:
+            Ticket.objects.filter(id=ticket.id).update(active=False)
+        seen.add(ticket.space_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("points", "0003_vote"),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_extra_tickets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ticket",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("active", True)),
+                fields=("space",),
+                name="one_active_ticket_per_space",
+                violation_error_message="Another ticket is already listed as active in this Space. Set others to Unknown before changing this one.",
+            ),
+        ),
+    ]
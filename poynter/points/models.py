@@ -1,9 +1,11 @@
-import requests
 from django.conf import settings
 from django.db import models
 from django_extensions.db.fields import AutoSlugField
 from django_extensions.db.models import TimeStampedModel
 
+# Stored as a ticket's title until the real one is fetched (see titles.py)
+TITLE_PLACEHOLDER = "Fetching title…"
+
 
 class Project(TimeStampedModel):
     """Voting Sessions are associated with projects within the organization."""
@@ -54,6 +56,11 @@ class Snapshot(TimeStampedModel):
     snapshot = models.JSONField(
         default=dict, blank=True, help_text="Capture state of voting when Space is closed."
     )
+    is_checkpoint = models.BooleanField(
+        default=True,
+        help_text="Full copy of voting state. Otherwise holds only the changes since the "
+        "previous snapshot (see points/snapshots.py).",
+    )
 
     def __str__(self):
         return f"{self.space.slug}: {self.created}"
@@ -93,15 +100,51 @@ class Ticket(TimeStampedModel):
     def save(self, *args, **kwargs):
         """
         Also, try to populate the title automatically.
-        If we can't get to the remote system, we can still enter the title manually."""
+        If we can't get to the remote system, we can still enter the title manually.
+        Fetching happens in the background (titles.py) so saving never waits on the
+        remote system; until then the ticket shows TITLE_PLACEHOLDER."""
+
+        fetch_title = not self.title
+        if fetch_title:
+            self.title = TITLE_PLACEHOLDER
+        result = super(Ticket, self).save(*args, **kwargs)
+
+        if fetch_title:
+            from poynter.points.titles import queue_title_fetch
 
-        if not self.title:
-            page = requests.get(self.url, timeout=15)
-            text = page.text
-            self.title = text[text.find("<title>") + 7 : text.find("</title>")]
-        return super(Ticket, self).save(*args, **kwargs)
+            queue_title_fetch(self.pk)
+        return result
 
     class Meta:
         ordering = [
             "id",
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["space"],
+                condition=models.Q(active=True),
+                name="one_active_ticket_per_space",
+                violation_error_message=(
+                    "Another ticket is already listed as active in this Space. "
+                    "Set others to Unknown before changing this one."
+                ),
+            )
+        ]
+
+
+class Vote(TimeStampedModel):
+    """Durable copy of a vote. The vote store (votes.py) is the source of truth
+    while voting; rows here are written behind it in batches (see writebehind.py)
+    and read back once the store's copy has expired."""
+
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
+    username = models.CharField(max_length=150)
+    choice = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.ticket_id}: {self.username} voted {self.choice}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ticket", "username"], name="one_vote_per_user")
+        ]
@@ -1,13 +1,30 @@
-from collections import defaultdict
-
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.layers import get_channel_layer
-from django.contrib.auth.models import User
-from django.core.cache import cache
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
-
-from poynter.points.models import Snapshot, Space, Ticket
+from django.views.decorators.http import require_POST
+
+from poynter.points.debounce import RefreshDebouncer
+from poynter.points.events import get_event_log
+from poynter.points.models import Space, Vote
+from poynter.points.snapshots import save_snapshot
+from poynter.points.state import (
+    abump_space_version,
+    bump_space_version,
+    get_space_state,
+    invalidate_space_state,
+)
+from poynter.points.transitions import (
+    set_space_open,
+    set_ticket_active,
+    set_ticket_closed,
+)
+from poynter.points.views_htmx import MODERATOR_WIDGETS, SHARED_WIDGETS
+from poynter.points.votes import VOTE_CHOICES, get_vote_store
+from poynter.points.writebehind import discard_queued_votes, queue_vote
 
 """
 - Helper functions that don't render a partial, but execute some logic and then
@@ -17,64 +34,78 @@ from poynter.points.models import Snapshot, Space, Ticket
 """
 
 
+def _requested_state(request, name: str) -> bool | None:
+    """The state a moderator's link asks for (?open=1 or ?open=0), so repeated
+    clicks set it again rather than flipping it back. None (no parameter) flips."""
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    if value not in ("0", "1"):
+        raise BadRequest(f"{name} must be 0 or 1")
+    return value == "1"
+
+
 def activate_ticket(request, space_name: str, ticket_id: int):
-    """Allow moderator to make a ticket active/inactive in a space.
-    Must set other active tickets to null first. After db is updated,
-    also update active ticket display for all other members in this space,
-    AND update the ticket_table, which is a separate HTML element.
+    """Allow moderator to make a ticket active/inactive in a space (?active=1/0).
+    Other active tickets are deactivated in the same transaction (see transitions.py).
+    After db is updated, also update active ticket display for all other members
+    in this space, AND update the ticket_table, which is a separate HTML element.
     """
 
-    space = get_object_or_404(Space, slug=space_name)
-    ticket = get_object_or_404(Ticket, id=ticket_id)
-    space.ticket_set.all().update(active=None)
-    ticket.active = not ticket.active
-
-    # Prevent logical impossibility
-    if ticket.active:
-        ticket.closed = False
+    space = get_space_state(space_name).space
+    if set_ticket_active(space.id, ticket_id, _requested_state(request, "active")) is None:
+        raise Http404(f"No ticket {ticket_id} in {space_name}")
 
-    ticket.save()
+    invalidate_space_state(space_name)
     refresh_widgets(space_name, ["display_voting_row", "display_ticket_table"])
 
     return HttpResponse(status=204)
 
 
 def open_close_ticket(request, space_name: str, ticket_id: int):
-    """Allow moderator to open or close a ticket in a space. Simple toggle.
+    """Allow moderator to open or close a ticket in a space (?closed=1/0).
     Note we do NOT set ticket to inactive when it's closed, as that would
     prevent viewing the results of the vote just held, since we can only
     show votes for a ticket that is both active and closed.
     """
-    space = get_object_or_404(Space, slug=space_name)
-    ticket = get_object_or_404(Ticket, id=ticket_id)
-    ticket.closed = not ticket.closed
-    ticket.save()
+    space = get_space_state(space_name).space
+    closed = set_ticket_closed(space.id, ticket_id, _requested_state(request, "closed"))
+    if closed is None:
+        raise Http404(f"No ticket {ticket_id} in {space_name}")
+    invalidate_space_state(space_name)
 
     # Update snapshot incrementally as tickets are closed
     votes_data = get_votes_for_space(space_name)
-    Snapshot.objects.create(space=space, snapshot=votes_data)
+    save_snapshot(space, votes_data)
 
-    refresh_widgets(space_name, ["display_voting_row", "display_ticket_table", "display_members"])
+    if closed:
+        # Members widget gets the revealed votes as data rather than re-fetching
+        refresh_widgets(space_name, ["display_voting_row", "display_ticket_table"])
+        send_ticket_tallies(space_name, ticket_id)
+    else:
+        refresh_widgets(
+            space_name, ["display_voting_row", "display_ticket_table", "display_members"]
+        )
 
     return HttpResponse(status=204)
 
 
 def open_close_space(request, space_name: str):
-    """Allow moderator to open or close a space for voting. Simple toggle.
+    """Allow moderator to open or close a space for voting (?open=1/0).
     Closing a space also auto-saves a snapshot of vote state for posterity.
     Get voting state (with averages) from cache.
     """
 
-    space = get_object_or_404(Space, slug=space_name)
-    space.is_open = False if space.is_open else True
-    space.save()
+    space = get_space_state(space_name).space
+    is_open = set_space_open(space.id, _requested_state(request, "open"))
+    invalidate_space_state(space_name)
 
     # # Also set any active ticket to False
     # space.ticket_set.all().update(active=False)
 
-    if not space.is_open:
+    if not is_open:
         votes_data = get_votes_for_space(space_name)
-        Snapshot.objects.create(space=space, snapshot=votes_data)
+        save_snapshot(space, votes_data)
 
     widgets = [
         "display_voting_row",
@@ -89,11 +120,13 @@ def open_close_space(request, space_name: str):
 def join_leave_space(request, space_name: str):
     "Allow member to join or leave a space. Simple toggle."
 
-    space = get_object_or_404(Space, slug=space_name)
-    if request.user in space.members.all():
-        space.members.remove(request.user)
+    # Membership is already in the cached state, no need to load the member list
+    state = get_space_state(space_name)
+    if request.user in state.members:
+        state.space.members.remove(request.user)
     else:
-        space.members.add(request.user)
+        state.space.members.add(request.user)
+    invalidate_space_state(space_name)
 
     refresh_widgets(space_name, ["display_voting_row", "display_members"])
 
@@ -104,15 +137,105 @@ def boot_users(request, space_name: str):
     "Allow moderator to remove users from a space."
 
     space = get_object_or_404(Space, slug=space_name)
-    usernames = request.GET.getlist("usernames")
-    for username in usernames:
-        user = User.objects.get(username=username)
-        space.members.remove(user)
+    apply_bulk(space, "boot_users", request.GET.getlist("usernames"))
+    return HttpResponse(status=204)
+
 
-    refresh_widgets(space_name, ["display_moderator_tools", "display_members"])
+@require_POST
+def bulk_moderate(request, space_name: str):
+    """Allow moderator to apply one action to many users or tickets at once.
+    POST action=<one of BULK_ACTIONS> with targets=<username or ticket id>, repeated.
+    Ticket actions without targets apply to all current tickets.
+    """
+
+    space = get_object_or_404(Space.objects.select_related("moderator"), slug=space_name)
+    if request.user != space.moderator:
+        return HttpResponseForbidden("Only the moderator can do that.")
+
+    action = request.POST.get("action")
+    if action not in BULK_ACTIONS:
+        return HttpResponseBadRequest(f"action must be one of {', '.join(BULK_ACTIONS)}")
+    targets = request.POST.getlist("targets") or None
+    if targets and action != "boot_users":
+        try:
+            targets = [int(target) for target in targets]
+        except ValueError:
+            return HttpResponseBadRequest("targets must be ticket ids")
+
+    apply_bulk(space, action, targets)
     return HttpResponse(status=204)
 
 
+def apply_bulk(space: Space, action: str, targets: list | None = None) -> int:
+    """
+    Apply a moderator action to many targets at once: the targets are resolved
+    and changed with set-based UPDATE/DELETE statements in one transaction, then
+    every affected widget is redrawn with a single refresh_widgets() call.
+    Returns the number of rows changed.
+    """
+
+    apply, widgets = BULK_ACTIONS[action]
+    with transaction.atomic():
+        changed = apply(space, targets)
+    invalidate_space_state(space.slug)
+    refresh_widgets(space.slug, widgets)
+    return changed
+
+
+def _targeted_tickets(space: Space, ticket_ids: list | None):
+    "The space's current tickets, or the given ones of them."
+    tickets = space.ticket_set.filter(archived=False)
+    if ticket_ids is not None:
+        tickets = tickets.filter(id__in=ticket_ids)
+    return tickets
+
+
+def _boot_users(space: Space, usernames: list | None) -> int:
+    # One DELETE on the through table, resolving usernames in a subquery
+    memberships = Space.members.through.objects.filter(
+        space=space, user__username__in=usernames or []
+    )
+    deleted, _ = memberships.delete()
+    return deleted
+
+
+def _archive_tickets(space: Space, ticket_ids: list | None) -> int:
+    return _targeted_tickets(space, ticket_ids).update(archived=True, active=False)
+
+
+def _close_tickets(space: Space, ticket_ids: list | None) -> int:
+    closed = _targeted_tickets(space, ticket_ids).filter(closed=False).update(closed=True)
+    if closed:
+        save_snapshot(space, get_votes_for_space(space.slug))
+    return closed
+
+
+def _reset_votes(space: Space, ticket_ids: list | None) -> int:
+    ticket_ids = list(_targeted_tickets(space, ticket_ids).values_list("id", flat=True))
+    deleted, _ = Vote.objects.filter(ticket_id__in=ticket_ids).delete()
+    get_vote_store().clear_tickets(space.slug, ticket_ids)
+    discard_queued_votes(space.slug, ticket_ids)
+    return deleted
+
+
+# action: (function applying it, widgets to refresh afterwards)
+BULK_ACTIONS = {
+    "boot_users": (
+        _boot_users,
+        ["display_voting_row", "display_members", "display_moderator_tools"],
+    ),
+    "archive_tickets": (
+        _archive_tickets,
+        ["display_voting_row", "display_ticket_table", "display_ticket_control", "display_members"],
+    ),
+    "close_tickets": (
+        _close_tickets,
+        ["display_voting_row", "display_ticket_table", "display_members"],
+    ),
+    "reset_votes": (_reset_votes, ["display_voting_row", "display_members"]),
+}
+
+
 def rt_send_message(request):
     """Receive a message via POST and broadcast via WebSockets to all clients."""
     if request.method == "POST":
@@ -128,13 +251,48 @@ def rt_send_message(request):
     return HttpResponse(status=204)  # Do nothing
 
 
+def cast_vote(space_name: str, ticket_id: int, username: str, choice: int):
+    """Record one vote and schedule the members widget refresh.
+    Each vote is one field in a per-ticket record in the vote store
+    (see votes.py), so concurrent voters never overwrite each other.
+    Votes are also queued for batched writes to the Vote table
+    (see writebehind.py).
+
+    Shared by tally_single() and BroadcastConsumer.receive(); callers
+    check that the vote is allowed.
+    """
+
+    _store_vote(space_name, ticket_id, username, choice)
+    bump_space_version(space_name)
+
+    # After vote is entered, tell all clients who voted. They mark it in the
+    # members widget themselves instead of re-fetching it.
+    send_member_voted(space_name, ticket_id, username)
+
+
+async def acast_vote(space_name: str, ticket_id: int, username: str, choice: int):
+    "cast_vote() for callers on the event loop, such as BroadcastConsumer.receive()."
+
+    await sync_to_async(_store_vote)(space_name, ticket_id, username, choice)
+    await abump_space_version(space_name)
+    await asend_numbered(space_name, _member_voted(space_name, ticket_id, username))
+
+
+def _store_vote(space_name: str, ticket_id: int, username: str, choice: int):
+    # To allow user to override their vote, we write every time.
+    store = get_vote_store()
+    store.record_vote(space_name, ticket_id, username, choice)
+    if not store.durable:
+        queue_vote(space_name, ticket_id, username, choice)
+
+
 def tally_single(request):
     """HTMX view receives POST from a voting row, and logs
-    the space name, username, and vote. All votes in a given space
-    are entered into the same shared object in redis - one per space, not
-    one per vote or one per user.
+    the space name, username, and vote. Votes normally arrive over the
+    space's WebSocket (consumers.BroadcastConsumer.receive); this is the
+    fallback while the socket is down.
 
-    Space structure in cache is like:
+    Votes for a space read back like:
 
     {
         8: {
@@ -154,21 +312,20 @@ def tally_single(request):
     if request.method == "POST":
         vote = request.POST
 
-        space_name = vote.get("space")  # same as cache key
+        space_name = vote.get("space")
         username = vote.get("username")
-        ticket = int(vote.get("ticket"))
-        choice = int(vote.get("number"))  # Cast numeric choice to int for mathing
+        try:
+            ticket = int(vote.get("ticket"))
+            choice = int(vote.get("number"))  # Cast numeric choice to int for mathing
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Not a valid vote.")
 
-        # If cache for space is expired or non-existent, default to empty dict
-        # Use defaultdict as fallback so we can nest keys/vals without checking.
-        # To allow user to override their vote, we write every time.
-        # Keep space cache for one hour unless reset by moderator
-        data = cache.get(space_name, defaultdict(dict))
-        data[ticket][username] = choice
-        cache.set(space_name, data, 3600)
+        # Only tickets of this space, so every queued vote can be written to the table
+        state = get_space_state(space_name)
+        if ticket not in {t.id for t in state.current_tickets} or choice not in dict(VOTE_CHOICES):
+            return HttpResponseBadRequest("Not a valid vote.")
 
-    # After vote is entered, tell all clients to update their displays
-    refresh_widgets(space_name, ["display_members"])
+        cast_vote(space_name, ticket, username, choice)
 
     return HttpResponse(status=204)  # Do nothing
 
@@ -199,19 +356,18 @@ def get_votes_for_space(space_name: str) -> dict:
         }
     }
 
-    """
-
-    avgs = {}
-    data = cache.get(space_name, defaultdict(dict))
-    for key in data.keys():
-        vals = data[key].values()
-        avg = sum(vals) / len(vals)
-        avgs[key] = avg
+    Averages come from the running aggregates kept by the vote store,
+    not from re-adding every vote.
 
-    data["averages"] = avgs
+    Votes that have expired from the vote store are restored by the store
+    itself from the Vote table (see votes.py).
+    """
 
-    # default_dict is unhashable - cast back
-    return dict(data)
+    store = get_vote_store()
+    data = store.get_space_votes(space_name)
+    aggregates = store.get_space_aggregates(space_name)
+    data["averages"] = {key: aggregates[key]["average"] for key in data if key in aggregates}
+    return data
 
 
 def refresh_widgets(space_name: str, element_names: list = []):
@@ -222,13 +378,159 @@ def refresh_widgets(space_name: str, element_names: list = []):
 
     Called after operations require some widgets to be redrawn.
     `element_names` is a list of those element names e.g.
-    refresh_unicast_widget("shacker_cosmos", ["update_voting_row","display_members"])
+    refresh_widgets("shacker_cosmos", ["display_voting_row", "display_members"])
+
+    All names go out together in a single batch_refresh event, so one
+    operation costs one channel-layer send and one WebSocket frame per client
+    no matter how many widgets it touches.
+
+    Exception: with settings.BROADCAST_SHARED_WIDGETS on, widgets listed in
+    views_htmx.SHARED_WIDGETS (same HTML for every member) are rendered once here
+    and pushed to the group as html_update, instead of every client re-fetching.
+
+    Widgets in views_htmx.MODERATOR_WIDGETS are only refreshed for the moderator,
+    via the moderators_<space> group joined in BroadcastConsumer.connect().
+
+    Events to the whole space carry a per-space sequence number (see send_numbered()).
     """
 
-    channel_layer = get_channel_layer()
-    channel_name = f"broadcast_{space_name}"
+    shared, unicast, moderator_only = _split_widgets(element_names)
+    shared_html = {elem: SHARED_WIDGETS[elem](space_name) for elem in shared}
+    send_numbered(space_name, _refresh_sends(space_name, shared_html, unicast, moderator_only))
+
+
+def _split_widgets(element_names: list) -> tuple:
+    "(shared, unicast, moderator-only) widgets, as described in refresh_widgets()."
+    shared = []
+    if settings.BROADCAST_SHARED_WIDGETS:
+        shared = [elem for elem in element_names if elem in SHARED_WIDGETS]
+    moderator_only = [elem for elem in element_names if elem in MODERATOR_WIDGETS]
+    unicast = [elem for elem in element_names if elem not in shared + moderator_only]
+    return shared, unicast, moderator_only
+
 
-    for elem in element_names:
-        async_to_sync(channel_layer.group_send)(
-            channel_name, {"type": "unicast_refresh", "target_id": elem}
+def _refresh_sends(space_name: str, shared_html: dict, unicast: list, moderator_only: list):
+    """(group, event, widgets it redraws) for each event of one refresh. The
+    moderator's event has None for widgets: it isn't numbered (see send_numbered())."""
+    channel_name = f"broadcast_{space_name}"
+    sends = [
+        (
+            channel_name,
+            {"type": "broadcast_html_update", "target_element": elem, "html_content": html},
+            [elem],
         )
+        for elem, html in shared_html.items()
+    ]
+    if unicast:
+        sends.append((channel_name, {"type": "batch_refresh", "target_ids": unicast}, unicast))
+    if moderator_only:
+        sends.append(
+            (
+                f"moderators_{space_name}",
+                {"type": "batch_refresh", "target_ids": moderator_only},
+                None,
+            )
+        )
+    return sends
+
+
+def send_numbered(space_name: str, sends: list):
+    """
+    group_send each (group, event, widget ids) in `sends`, with a per-space
+    sequence number added to each event so clients can drop duplicates and
+    catch up after reconnecting (see events.py).
+
+    Events for a subset of the space (widget ids None) go out unnumbered: a
+    number every member doesn't get would look like a missed event to them.
+    """
+
+    if not sends:
+        return
+    seqs = get_event_log().record(space_name, _numbered_widgets(sends))
+
+    channel_layer = get_channel_layer()
+    for group, event in _with_seqs(sends, seqs):
+        async_to_sync(channel_layer.group_send)(group, event)
+
+
+async def asend_numbered(space_name: str, sends: list):
+    "send_numbered() for callers on the event loop."
+
+    if not sends:
+        return
+    seqs = await sync_to_async(get_event_log().record, thread_sensitive=False)(
+        space_name, _numbered_widgets(sends)
+    )
+
+    channel_layer = get_channel_layer()
+    for group, event in _with_seqs(sends, seqs):
+        await channel_layer.group_send(group, event)
+
+
+def _numbered_widgets(sends: list) -> list:
+    "Widget ids of the sends that get a sequence number, for EventLog.record()."
+    return [target_ids for _, _, target_ids in sends if target_ids is not None]
+
+
+def _with_seqs(sends: list, seqs: list) -> list:
+    "(group, event) for each send, with the seqs issued by record() added in order."
+    seqs = iter(seqs)
+    return [
+        (group, event if target_ids is None else event | {"seq": next(seqs)})
+        for group, event, target_ids in sends
+    ]
+
+
+def _member_voted(space_name: str, ticket_id: int, username: str) -> list:
+    event = {"type": "member_voted", "ticket": ticket_id, "username": username}
+    return [(f"broadcast_{space_name}", event, ["display_members"])]
+
+
+def send_member_voted(space_name: str, ticket_id: int, username: str):
+    """
+    State delta for the members widget: `username` has voted on `ticket_id`.
+    Carries no choice, since votes stay hidden until the ticket is closed.
+    """
+
+    send_numbered(space_name, _member_voted(space_name, ticket_id, username))
+
+
+async def asend_member_presence(space_name: str, changes: dict):
+    """
+    State delta for the members widget: members came online or went offline.
+    `changes` is {username: now online}, as returned by presence.py updates.
+    """
+
+    event = {"type": "member_presence", "online": changes}
+    await asend_numbered(space_name, [(f"broadcast_{space_name}", event, ["display_members"])])
+
+
+def send_ticket_tallies(space_name: str, ticket_id: int):
+    """
+    State delta for the members widget when a ticket is closed:
+    every member's vote and the ticket's aggregate, applied in place by clients.
+    """
+
+    store = get_vote_store()
+    aggregate = store.get_ticket_aggregate(space_name, ticket_id)
+    event = {
+        "type": "ticket_tallies",
+        "ticket": ticket_id,
+        "votes": store.get_ticket_votes(space_name, ticket_id),
+        "aggregate": {key: aggregate[key] for key in ("count", "average", "min", "max")},
+    }
+    send_numbered(space_name, [(f"broadcast_{space_name}", event, ["display_members"])])
+
+
+_debouncer = RefreshDebouncer(refresh_widgets)
+
+
+def refresh_widgets_debounced(space_name: str, element_names: list):
+    """
+    Same as refresh_widgets(), but repeated calls for the same space and widget
+    within settings.REFRESH_DEBOUNCE_MS collapse into one broadcast at the end
+    of that window. Used by titles.resolve_title() as background title fetches
+    finish; votes send member_voted deltas instead.
+    """
+
+    _debouncer.request(space_name, element_names)
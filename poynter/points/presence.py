@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from poynter.points.redis_store import RedisStore
+
+"""
+Who currently has a space open, kept per WebSocket rather than in the database.
+
+BroadcastConsumer.connect() and disconnect() add and remove the socket, and
+clients send a heartbeat frame every HEARTBEAT_SECONDS to keep it listed.
+Sockets not heard from for PRESENCE_TTL seconds (a closed laptop, a worker
+that died without running disconnect()) are pruned whenever the set is
+touched, which live clients' heartbeats do often enough. A user is online
+while any of their sockets is. Each update returns the users it brought
+online or took offline, pruned ones included, for the consumer to pass on.
+
+Space.members stays the durable list of who has joined a space; the members
+widget marks which of them are online, from one online() call.
+
+Redis layout (keys pass through cache.make_key so they share REDIS_PREFIX):
+
+    presence:<space_name>  sorted set of "<username> <channel name>", scored by last heartbeat
+"""
+
+# Seconds between client heartbeats (see space.html)
+HEARTBEAT_SECONDS = 20
+
+# Sockets without a heartbeat for this long count as gone
+PRESENCE_TTL = 3 * HEARTBEAT_SECONDS
+
+# Prune expired sockets, then add/refresh or remove one. Returns the users whose
+# online status changed, pruned ones included, as a flat list of username, "1"
+# (now online) or "0" (now offline).
+# KEYS: presence set. ARGV: now, ttl, entry, "add" or "remove"
+TOUCH_SCRIPT = """
+local function users()
+    local online = {}
+    for _, entry in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+        online[string.match(entry, '^(.-) ')] = true
+    end
+    return online
+end
+
+local now, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+local before = users()
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if ARGV[4] == 'add' then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+else
+    redis.call('ZREM', KEYS[1], ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+local after = users()
+
+local changes = {}
+for username in pairs(after) do
+    if not before[username] then
+        table.insert(changes, username)
+        table.insert(changes, '1')
+    end
+end
+for username in pairs(before) do
+    if not after[username] then
+        table.insert(changes, username)
+        table.insert(changes, '0')
+    end
+end
+return changes
+"""
+
+
+def _entry(username: str, socket_id: str) -> str:
+    return f"{username} {socket_id}"
+
+
+class RedisPresence(RedisStore):
+    "Online sockets per space in Redis, shared by all processes."
+
+    def _key(self, space_name: str) -> str:
+        return cache.make_key(f"presence:{space_name}")
+
+    def _update(self, space_name: str, username: str, socket_id: str, action: str) -> dict:
+        changes = self.script(TOUCH_SCRIPT)(
+            keys=[self._key(space_name)],
+            args=[time.time(), PRESENCE_TTL, _entry(username, socket_id), action],
+        )
+        return {
+            changed.decode(): online == b"1" for changed, online in zip(changes[::2], changes[1::2])
+        }
+
+    def connect(self, space_name: str, username: str, socket_id: str) -> dict:
+        """List a socket. Returns {username: now online} for users whose online
+        status changed: its user if not online before, and any pruned."""
+        return self._update(space_name, username, socket_id, "add")
+
+    def heartbeat(self, space_name: str, username: str, socket_id: str) -> dict:
+        "Keep a socket listed. Returns changes as connect() does."
+        return self._update(space_name, username, socket_id, "add")
+
+    def disconnect(self, space_name: str, username: str, socket_id: str) -> dict:
+        "Drop a socket. Returns changes as connect() does."
+        return self._update(space_name, username, socket_id, "remove")
+
+    def online(self, space_name: str) -> set:
+        "Usernames with a live socket on the space."
+        entries = self.client.zrangebyscore(
+            self._key(space_name), time.time() - PRESENCE_TTL, "+inf"
+        )
+        return {entry.decode().split(" ", 1)[0] for entry in entries}
+
+
+class LocalPresence:
+    "In-process fallback for when Redis is not enabled. Only sees this process's sockets."
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sockets = defaultdict(dict)
+
+    def _update(self, space_name: str, username: str, socket_id: str, action: str) -> dict:
+        with self._lock:
+            sockets = self._sockets[space_name]
+            # Before pruning, so users pruned now are reported too
+            before = {user for user, _ in sockets}
+            cutoff = time.time() - PRESENCE_TTL
+            for entry in [entry for entry, seen in sockets.items() if seen <= cutoff]:
+                del sockets[entry]
+            if action == "add":
+                sockets[(username, socket_id)] = time.time()
+            else:
+                sockets.pop((username, socket_id), None)
+            after = {user for user, _ in sockets}
+            return {changed: changed in after for changed in before ^ after}
+
+    def connect(self, space_name: str, username: str, socket_id: str) -> dict:
+        return self._update(space_name, username, socket_id, "add")
+
+    def heartbeat(self, space_name: str, username: str, socket_id: str) -> dict:
+        return self._update(space_name, username, socket_id, "add")
+
+    def disconnect(self, space_name: str, username: str, socket_id: str) -> dict:
+        return self._update(space_name, username, socket_id, "remove")
+
+    def online(self, space_name: str) -> set:
+        cutoff = time.time() - PRESENCE_TTL
+        with self._lock:
+            sockets = self._sockets[space_name]
+            return {user for (user, _), seen in sockets.items() if seen > cutoff}
+
+
+_presence = None
+
+
+def get_presence():
+    "Module-level presence tracker, Redis-backed when REDIS_ENABLED."
+    global _presence
+    if _presence is None:
+        _presence = RedisPresence() if settings.REDIS_ENABLED else LocalPresence()
+    return _presence
@@ -0,0 +1,29 @@
+"""
+Client handling shared by the Redis-backed stores (votes.RedisVoteStore,
+events.RedisEventLog, presence.RedisPresence).
+"""
+
+
+class RedisStore:
+    """Base for the Redis-backed stores. The client is django-redis's "default"
+    connection, opened on first use, unless one is passed in (tests pass a
+    fakeredis client). Lua scripts are registered on first use too.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._scripts = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            from django_redis import get_redis_connection
+
+            self._client = get_redis_connection("default")
+        return self._client
+
+    def script(self, source: str):
+        "The registered script for some Lua source, callable with keys= and args=."
+        if source not in self._scripts:
+            self._scripts[source] = self.client.register_script(source)
+        return self._scripts[source]
@@ -0,0 +1,144 @@
+import json
+
+from django.db import transaction
+
+from poynter.points.models import Snapshot, Space
+
+"""
+Delta-encoded Snapshot history.
+
+Tickets are closed one after another through a session and each close used to
+store the whole vote dict of the space again. Instead, most Snapshot rows now
+hold only the tickets whose votes changed since the previous snapshot:
+
+    {"changed": {"8": {"rob": 3, "joe": 2}}, "removed": ["17"]}
+
+Every CHECKPOINT_EVERY-th row of a space is a full checkpoint in the original
+format (votes per ticket plus "averages"), so rebuilding any point in time
+reads at most CHECKPOINT_EVERY rows. Rows written before this format existed
+are checkpoints. Averages are not stored in deltas; they are recomputed from
+the votes on reconstruction.
+
+States returned here use JSON (string) ticket keys, as stored in the database.
+"""
+
+CHECKPOINT_EVERY = 10
+
+
+def _votes_only(votes_data: dict) -> dict:
+    "Votes per ticket in stored (JSON) form, without the computed averages."
+    data = json.loads(json.dumps(votes_data))
+    data.pop("averages", None)
+    return data
+
+
+def _with_averages(votes: dict) -> dict:
+    state = dict(votes)
+    state["averages"] = {
+        ticket: sum(ticket_votes.values()) / len(ticket_votes)
+        for ticket, ticket_votes in votes.items()
+        if ticket_votes
+    }
+    return state
+
+
+def _apply(votes: dict, row: Snapshot) -> dict:
+    "Votes after applying one snapshot row on top of `votes`."
+    if row.is_checkpoint:
+        return _votes_only(row.snapshot)
+    votes = dict(votes)
+    for ticket in row.snapshot.get("removed", []):
+        votes.pop(ticket, None)
+    votes.update(row.snapshot.get("changed", {}))
+    return votes
+
+
+def _diff(previous: dict, current: dict) -> dict:
+    return {
+        "changed": {
+            ticket: ticket_votes
+            for ticket, ticket_votes in current.items()
+            if previous.get(ticket) != ticket_votes
+        },
+        "removed": [ticket for ticket in previous if ticket not in current],
+    }
+
+
+def _history(space: Space, at=None):
+    """Rows needed to rebuild the state at `at` (default: now):
+    the latest checkpoint at or before then, and the deltas after it."""
+    rows = Snapshot.objects.filter(space=space)
+    if at is not None:
+        rows = rows.filter(created__lte=at)
+    checkpoint = rows.filter(is_checkpoint=True).order_by("-created", "-id").first()
+    if checkpoint is None:
+        return rows.order_by("created", "id")
+    return (
+        rows.filter(created__gte=checkpoint.created)
+        .exclude(created=checkpoint.created, id__lt=checkpoint.id)
+        .order_by("created", "id")
+    )
+
+
+def snapshot_state_at(space: Space, at=None) -> dict:
+    """Voting state of a space as of datetime `at` (default: latest), in the
+    same shape as ops.get_votes_for_space() but with string ticket keys."""
+    votes = {}
+    for row in _history(space, at):
+        votes = _apply(votes, row)
+    return _with_averages(votes)
+
+
+def save_snapshot(space: Space, votes_data: dict) -> Snapshot | None:
+    """Record the current votes (as from ops.get_votes_for_space()) for a space.
+    Writes a delta against the previous snapshot, or a full checkpoint every
+    CHECKPOINT_EVERY rows. Nothing is written if no votes changed.
+    """
+    current = _votes_only(votes_data)
+
+    with transaction.atomic():
+        rows = list(_history(space))
+        previous = {}
+        for row in rows:
+            previous = _apply(previous, row)
+
+        if rows and previous == current:
+            return None
+
+        if not rows or not rows[0].is_checkpoint or len(rows) >= CHECKPOINT_EVERY:
+            return Snapshot.objects.create(
+                space=space, snapshot=_with_averages(current), is_checkpoint=True
+            )
+        return Snapshot.objects.create(
+            space=space, snapshot=_diff(previous, current), is_checkpoint=False
+        )
+
+
+def compact_snapshots(space: Space, checkpoint_every: int = CHECKPOINT_EVERY) -> tuple:
+    """Rewrite a space's whole history in delta form: rows identical to the one
+    before them are deleted, the rest become deltas with a full checkpoint every
+    `checkpoint_every` rows. Timestamps are kept, so snapshot_state_at() answers
+    the same before and after. Returns (rows kept, rows deleted).
+    """
+    with transaction.atomic():
+        rows = list(Snapshot.objects.filter(space=space).order_by("created", "id"))
+
+        votes, previous = {}, None
+        kept, redundant = [], []
+        for row in rows:
+            votes = _apply(votes, row)
+            if previous is not None and votes == previous:
+                redundant.append(row.id)
+                continue
+
+            if len(kept) % checkpoint_every == 0:
+                row.snapshot, row.is_checkpoint = _with_averages(votes), True
+            else:
+                row.snapshot, row.is_checkpoint = _diff(previous, votes), False
+            kept.append(row)
+            previous = votes
+
+        Snapshot.objects.filter(id__in=redundant).delete()
+        Snapshot.objects.bulk_update(kept, ["snapshot", "is_checkpoint"])
+
+    return len(kept), len(redundant)
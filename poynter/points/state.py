@@ -0,0 +1,188 @@
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from poynter.points.models import Space, Ticket
+
+"""
+Cached per-space state shared by all HTMX partial views.
+
+A single moderator action triggers refreshes on every client, each of which
+would otherwise look up the same space, active ticket, tickets and members.
+Instead the partials read one SpaceState object from the cache, keyed by slug.
+
+Every function in ops.py, views.py and admin.py that changes a space, its
+tickets or its members must call invalidate_space_state() after writing.
+Changes made any other way (a shell, a migration) show once the cached state
+and then the version expire, so within twice SPACE_STATE_TTL.
+
+A read that misses the cache may load from the database just before a write and
+store its result just after the write's invalidation. So each cached state is
+stored with the space's state generation, read before loading and bumped by
+invalidate_space_state(), and is only used while that is still the generation.
+
+Users are cached with only their id and username (the moderator is the user
+whose id is space.moderator_id), not password hashes or emails.
+
+Functions prefixed with `a` are the same for async callers (views_htmx_async.py,
+BroadcastConsumer), using the async ORM and cache APIs.
+
+Each space also has a version number, bumped on every invalidation and on every
+vote change, which the partial views use as an ETag. It starts from the current
+time in ms, so a version lost from the cache never restarts below an old ETag.
+It expires after SPACE_STATE_TTL, and is only started for a space with a state
+generation, which exists only once the space has been loaded or written.
+"""
+
+SPACE_STATE_TTL = 300
+
+# The only User fields SpaceState holds, as it is shared through the cache
+CACHED_USER_FIELDS = ("id", "username")
+
+
+@dataclass
+class SpaceState:
+    space: Space
+    active_ticket: Ticket | None
+    current_tickets: list[Ticket]
+    members: list
+
+
+def _state_key(space_name: str) -> str:
+    return f"space_state:{space_name}"
+
+
+def _generation_key(space_name: str) -> str:
+    return f"space_state_generation:{space_name}"
+
+
+def _version_key(space_name: str) -> str:
+    return f"space_version:{space_name}"
+
+
+def _spaces():
+    "Spaces with their moderator, loading only CACHED_USER_FIELDS of any user."
+    space_fields = [field.name for field in Space._meta.concrete_fields]
+    moderator_fields = [f"moderator__{name}" for name in CACHED_USER_FIELDS]
+    return Space.objects.select_related("moderator").only(*space_fields, *moderator_fields)
+
+
+def load_space_state(space_name: str) -> SpaceState:
+    "Build a SpaceState from the database (three queries)."
+    space = get_object_or_404(_spaces(), slug=space_name)
+    current_tickets = list(space.ticket_set.filter(archived=False))
+    active_ticket = next((ticket for ticket in current_tickets if ticket.active), None)
+    members = list(space.members.only(*CACHED_USER_FIELDS))
+    return SpaceState(
+        space=space,
+        active_ticket=active_ticket,
+        current_tickets=current_tickets,
+        members=members,
+    )
+
+
+async def aload_space_state(space_name: str) -> SpaceState:
+    try:
+        space = await _spaces().aget(slug=space_name)
+    except Space.DoesNotExist:
+        raise Http404(f"No space {space_name}")
+    current_tickets = [ticket async for ticket in space.ticket_set.filter(archived=False)]
+    active_ticket = next((ticket for ticket in current_tickets if ticket.active), None)
+    members = [member async for member in space.members.only(*CACHED_USER_FIELDS)]
+    return SpaceState(
+        space=space,
+        active_ticket=active_ticket,
+        current_tickets=current_tickets,
+        members=members,
+    )
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def get_space_state(space_name: str) -> SpaceState:
+    "Read-through cache for SpaceState, checked against the state generation."
+    key, generation_key = _state_key(space_name), _generation_key(space_name)
+    cached = cache.get_many([key, generation_key])
+    generation = cached.get(generation_key)
+    if key in cached and generation is not None and cached[key][0] == generation:
+        return cached[key][1]
+
+    state = load_space_state(space_name)
+    if generation is None:
+        # If an invalidation created the generation meanwhile, this load may be stale
+        generation = _now_ms()
+        if not cache.add(generation_key, generation, SPACE_STATE_TTL):
+            return state
+    cache.set(key, (generation, state), SPACE_STATE_TTL)
+    return state
+
+
+async def aget_space_state(space_name: str) -> SpaceState:
+    key, generation_key = _state_key(space_name), _generation_key(space_name)
+    cached = await cache.aget_many([key, generation_key])
+    generation = cached.get(generation_key)
+    if key in cached and generation is not None and cached[key][0] == generation:
+        return cached[key][1]
+
+    state = await aload_space_state(space_name)
+    if generation is None:
+        generation = _now_ms()
+        if not await cache.aadd(generation_key, generation, SPACE_STATE_TTL):
+            return state
+    await cache.aset(key, (generation, state), SPACE_STATE_TTL)
+    return state
+
+
+def invalidate_space_state(space_name: str):
+    "Make cached state for a space unusable after any write to it."
+    generation_key = _generation_key(space_name)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        cache.add(generation_key, _now_ms(), SPACE_STATE_TTL)
+    bump_space_version(space_name)
+
+
+def get_space_version(space_name: str) -> int | None:
+    """Current version of a space (one cache read). None for a space that hasn't been
+    loaded (or doesn't exist), or if the cache can't hold it."""
+    key = _version_key(space_name)
+    generation_key = _generation_key(space_name)
+    cached = cache.get_many([key, generation_key])
+    if key not in cached and generation_key in cached:
+        # Start the version of a space known to exist
+        cache.add(key, _now_ms(), SPACE_STATE_TTL)
+        return cache.get(key)
+    return cached.get(key)
+
+
+async def aget_space_version(space_name: str) -> int | None:
+    key = _version_key(space_name)
+    generation_key = _generation_key(space_name)
+    cached = await cache.aget_many([key, generation_key])
+    if key not in cached and generation_key in cached:
+        await cache.aadd(key, _now_ms(), SPACE_STATE_TTL)
+        return await cache.aget(key)
+    return cached.get(key)
+
+
+def bump_space_version(space_name: str):
+    """Mark anything rendered for this space as stale. Called by invalidate_space_state()
+    and directly for changes that don't touch SpaceState, such as votes. A space
+    without a version has nothing rendered against one to mark."""
+    try:
+        cache.incr(_version_key(space_name))
+    except ValueError:
+        pass
+
+
+async def abump_space_version(space_name: str):
+    try:
+        await cache.aincr(_version_key(space_name))
+    except ValueError:
+        pass
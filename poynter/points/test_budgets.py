@@ -0,0 +1,128 @@
+import time
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from poynter.points import votes
+from poynter.points.models import Project, Space, Ticket
+
+"""
+Query and latency budgets for every view in points/urls.py, plus home.
+
+Each view is requested against seeded spaces of several sizes with a cold cache
+(test settings use DummyCache unless Redis is enabled), and must stay within a
+fixed number of queries at every size. A view that runs a query per member or
+per ticket passes on the small space and fails on the large one.
+
+Latency is recorded, not asserted, as CI timings are too noisy to gate on: it
+lands in the JUnit XML as a "latency_ms" property (pytest --junitxml).
+"""
+
+# Members (including the moderator) and current tickets per seeded space
+SPACE_SIZES = {"small": 1, "medium": 10, "large": 50}
+
+# Each case: url name, HTTP method, which ticket the URL takes (if any), POST data
+# and the most queries the request may run, whatever the space size.
+# Every authenticated request starts with 2 (session, user); SpaceState is 3 more.
+BUDGETS = [
+    ("points_home", "get", None, None, 4),
+    ("points:space", "get", None, None, 5),
+    ("points:add_ticket", "get", None, None, 2),
+    ("points:add_ticket", "post", None, {"url": "http://example.com/new"}, 7),
+    (
+        "points:bulk_add_tickets",
+        "post",
+        None,
+        {"urls": "http://example.com/a,A\nhttp://example.com/b,B"},
+        7,
+    ),
+    ("points:archive_tickets", "get", None, None, 9),
+    ("points:clear_space_cache", "get", None, None, 3),
+    ("points:display_widgets", "get", None, None, 5),
+    ("points:display_ticket_table", "get", None, None, 5),
+    ("points:display_ticket_control", "get", None, None, 5),
+    ("points:display_voting_row", "get", None, None, 5),
+    ("points:display_members", "get", None, None, 5),
+    ("points:display_moderator_tools", "get", None, None, 5),
+    ("points:tally_single", "post", None, "vote", 6),
+    ("points:rt_send_message", "post", None, {"message": "hi", "space_name": "x"}, 2),
+    ("points:join_leave_space", "get", None, None, 6),
+    ("points:open_close_space", "get", None, None, 15),
+    ("points:activate_ticket", "get", "inactive", None, 14),
+    ("points:open_close_ticket", "get", "active", None, 15),
+    ("points:boot_users", "get", None, None, 5),
+    ("points:bulk_moderate", "post", None, {"action": "reset_votes"}, 7),
+]
+
+
+@pytest.fixture(params=list(SPACE_SIZES))
+def seeded_space(request, db, monkeypatch):
+    """A space with SPACE_SIZES[size] members and tickets, every member voted on the
+    active one. Each other member moderates a space of their own, for the home page."""
+
+    size = SPACE_SIZES[request.param]
+    store = votes.LocalVoteStore()
+    monkeypatch.setattr(votes, "_vote_store", store)
+
+    moderator = User.objects.create_user(username="shacker")
+    users = User.objects.bulk_create(User(username=f"user{n}") for n in range(size - 1))
+    space = Space.objects.create(
+        project=Project.objects.create(name="Cosmos"), moderator=moderator, is_open=True
+    )
+    space.members.add(moderator, *users)
+    Ticket.objects.bulk_create(
+        Ticket(url=f"http://example.com/{n}", title=f"Ticket {n}", space=space, active=n == 0)
+        for n in range(size)
+    )
+    for user in users:
+        Space.objects.create(project=Project.objects.create(name=user.username), moderator=user)
+    active = space.ticket_set.get(active=True)
+    for member in [moderator, *users]:
+        store.record_vote(space.slug, active.id, member.username, 3)
+    return space
+
+
+# Views whose URL doesn't name the space
+UNSCOPED = {"points_home", "points:tally_single", "points:rt_send_message"}
+
+
+def _url(space: Space, name: str, ticket: str | None) -> str:
+    kwargs = {} if name in UNSCOPED else {"space_name": space.slug}
+    if ticket:
+        kwargs["ticket_id"] = space.ticket_set.filter(active=ticket == "active").first().id
+    return reverse(name, kwargs=kwargs)
+
+
+@pytest.mark.webtest
+@pytest.mark.parametrize(
+    "name, method, ticket, data, max_queries",
+    BUDGETS,
+    ids=[f"{name.split(':')[-1]}-{method}" for name, method, *_ in BUDGETS],
+)
+def test_view_query_budget(
+    seeded_space, client, record_property, name, method, ticket, data, max_queries
+):
+    """No view's query count may grow with the size of the space."""
+
+    # The small space has no inactive ticket to activate
+    if ticket == "inactive" and seeded_space.ticket_set.count() == 1:
+        Ticket.objects.create(url="http://example.com/extra", title="Extra", space=seeded_space)
+
+    url = _url(seeded_space, name, ticket)
+    if data == "vote":
+        active = seeded_space.ticket_set.get(active=True)
+        data = {"space": seeded_space.slug, "username": "shacker", "ticket": active.id, "number": 5}
+    client.force_login(seeded_space.moderator)
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = getattr(client, method)(url, data)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+    record_property("latency_ms", round(latency_ms, 2))
+    record_property("queries", len(queries))
+    assert response.status_code < 400
+    assert len(queries) <= max_queries, "\n".join(query["sql"] for query in queries)
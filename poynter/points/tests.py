@@ -1,4 +1,52 @@
+import asyncio
+import http.server
+import importlib
+import io
+import pickle
+import re
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import ANY
+
+import fakeredis
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from poynter.points import (
+    events,
+    ops,
+    presence,
+    routing,
+    snapshots,
+    titles,
+    transitions,
+    views_htmx,
+    views_htmx_async,
+    votes,
+    writebehind,
+)
+from poynter.points.debounce import RefreshDebouncer
+from poynter.points.forms import BulkTicketForm, TicketForm
+from poynter.points.imports import parse_ticket_rows
+from poynter.points.models import TITLE_PLACEHOLDER, Project, Snapshot, Space, Ticket, Vote
+from poynter.points.state import (
+    get_space_state,
+    get_space_version,
+    invalidate_space_state,
+    load_space_state,
+)
 
 
 @pytest.mark.django_db
@@ -6,3 +54,1308 @@ def test_simple():
     """Starter test"""
 
     assert 1 == 1
+
+
+@pytest.fixture
+def local_votes(db, monkeypatch):
+    "Route ops through a fresh in-process vote store (which reads the Vote table)."
+    store = votes.LocalVoteStore()
+    monkeypatch.setattr(votes, "_vote_store", store)
+    return store
+
+
+@pytest.mark.django_db
+def test_vote_override_and_averages(local_votes):
+    """Re-voting replaces a user's earlier choice; averages are per ticket."""
+
+    local_votes.record_vote("space", 8, "rob", 3)
+    local_votes.record_vote("space", 8, "joe", 2)
+    local_votes.record_vote("space", 8, "rob", 1)
+    local_votes.record_vote("space", 17, "erin", 8)
+
+    data = ops.get_votes_for_space("space")
+    assert data[8] == {"rob": 1, "joe": 2}
+    assert data["averages"] == {8: 1.5, 17: 8.0}
+
+    local_votes.clear_space("space")
+    assert ops.get_votes_for_space("space") == {"averages": {}}
+
+
+def test_revote_adjusts_aggregates(local_votes):
+    """Running aggregates follow re-votes, including a removed extreme."""
+
+    local_votes.record_vote("space", 8, "rob", 13)
+    local_votes.record_vote("space", 8, "joe", 2)
+    local_votes.record_vote("space", 8, "rob", 5)
+
+    aggregate = local_votes.get_ticket_aggregate("space", 8)
+    assert aggregate["count"] == 2
+    assert aggregate["average"] == 3.5
+    assert (aggregate["min"], aggregate["max"]) == (2, 5)
+    assert aggregate["histogram"] == {1: 0, 2: 1, 3: 0, 5: 1, 8: 0, 13: 0}
+
+
+def test_concurrent_votes_are_not_lost(local_votes):
+    """Simultaneous voters on the same ticket must all be recorded."""
+
+    def cast(n):
+        local_votes.record_vote("space", 8, f"user{n}", 5)
+
+    local_votes.get_ticket_votes("space", 8)  # Votes in the table loaded first
+
+    threads = [threading.Thread(target=cast, args=(n,)) for n in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(local_votes.get_ticket_votes("space", 8)) == 12
+
+
+def test_refresh_widgets_sends_one_batched_event():
+    """Several widgets are refreshed with a single group_send."""
+
+    channel_layer = get_channel_layer()
+    channel_name = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)("broadcast_space", channel_name)
+
+    ops.refresh_widgets("space", ["display_voting_row", "display_members"])
+
+    message = async_to_sync(channel_layer.receive)(channel_name)
+    assert message == {
+        "type": "batch_refresh",
+        "target_ids": ["display_voting_row", "display_members"],
+        "seq": ANY,
+    }
+    # Nothing else queued: the in-memory layer drops drained channels
+    assert channel_name not in channel_layer.channels
+
+
+def test_debounced_refreshes_collapse_within_window(settings, locmem_cache):
+    """A burst of refresh requests for one space yields one broadcast."""
+
+    settings.REFRESH_DEBOUNCE_MS = 50
+    flushed = []
+    debouncer = RefreshDebouncer(lambda space_name, names: flushed.append((space_name, names)))
+
+    for _ in range(15):
+        debouncer.request("space", ["display_ticket_table"])
+    debouncer.request("space", ["display_ticket_control"])
+    debouncer.request("other", ["display_ticket_table"])
+    time.sleep(0.2)
+
+    assert sorted(flushed) == [
+        ("other", ["display_ticket_table"]),
+        ("space", ["display_ticket_table", "display_ticket_control"]),
+    ]
+
+    # A new window opens once the previous one has been flushed
+    debouncer.request("space", ["display_ticket_table"])
+    time.sleep(0.2)
+    assert len(flushed) == 3
+
+
+def test_debounce_disabled_flushes_immediately(settings):
+    settings.REFRESH_DEBOUNCE_MS = 0
+    flushed = []
+    debouncer = RefreshDebouncer(lambda space_name, names: flushed.append(names))
+
+    debouncer.request("space", ["display_ticket_table"])
+    debouncer.request("space", ["display_ticket_table"])
+
+    assert flushed == [["display_ticket_table"], ["display_ticket_table"]]
+
+
+def test_titles_resolved_together_refresh_the_table_once(
+    space, settings, locmem_cache, monkeypatch
+):
+    """Background title fetches finishing within the window push the table once."""
+
+    settings.REFRESH_DEBOUNCE_MS = 50
+    flushed = []
+    monkeypatch.setattr(
+        ops, "_debouncer", RefreshDebouncer(lambda space_name, names: flushed.append(names))
+    )
+    monkeypatch.setattr(titles, "_fetch_or_fallback", lambda url: f"Title of {url}")
+    tickets = Ticket.objects.bulk_create(
+        Ticket(url=f"http://example.com/{n}", title=TITLE_PLACEHOLDER, space=space)
+        for n in range(3, 6)
+    )
+
+    for ticket in tickets:
+        titles.resolve_title(ticket.id)
+    time.sleep(0.2)
+
+    assert flushed == [["display_ticket_table"]]
+
+
+@pytest.fixture
+def space(db):
+    "A space with two tickets, the second one active."
+    moderator = User.objects.create_user(username="shacker")
+    project = Project.objects.create(name="Cosmos")
+    space = Space.objects.create(project=project, moderator=moderator, is_open=True)
+    Ticket.objects.create(url="http://example.com/1", title="First ticket", space=space)
+    Ticket.objects.create(
+        url="http://example.com/2", title="Second ticket", space=space, active=True
+    )
+    return space
+
+
+def test_shared_widgets_are_rendered_once_and_pushed(space, settings):
+    """The ticket table goes out as HTML; personalized widgets stay unicast."""
+
+    settings.BROADCAST_SHARED_WIDGETS = True
+    channel_layer = get_channel_layer()
+    channel_name = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(f"broadcast_{space.slug}", channel_name)
+
+    ops.refresh_widgets(space.slug, ["display_ticket_table", "display_members"])
+
+    html_update = async_to_sync(channel_layer.receive)(channel_name)
+    assert html_update["type"] == "broadcast_html_update"
+    assert html_update["target_element"] == "display_ticket_table"
+    assert "Second ticket" in html_update["html_content"]
+
+    refresh = async_to_sync(channel_layer.receive)(channel_name)
+    assert refresh == {"type": "batch_refresh", "target_ids": ["display_members"], "seq": ANY}
+
+
+async def _connect(space_name, user, since=None):
+    "Open a BroadcastConsumer socket as `user`, optionally resuming after event `since`."
+    path = f"ws/broadcast/{space_name}"
+    if since is not None:
+        path += f"?since={since}"
+    communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), path)
+    communicator.scope["user"] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sockets_from_other_origins_are_refused(space, settings):
+    """A page on another site can't open a socket with the user's cookies."""
+
+    settings.ALLOWED_HOSTS = ["poynter.example"]
+    from poynter.config import asgi
+
+    application = importlib.reload(asgi).application
+
+    async def connect(origin):
+        communicator = WebsocketCommunicator(
+            application, f"ws/broadcast/{space.slug}", headers=[(b"origin", origin)]
+        )
+        connected, _ = await communicator.connect()
+        if connected:
+            await communicator.disconnect()
+        return connected
+
+    assert not async_to_sync(connect)(b"https://evil.example")
+    assert async_to_sync(connect)(b"https://poynter.example")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_moderator_widgets_only_reach_moderator(space):
+    """Moderator-only widget refreshes don't reach other members' sockets."""
+
+    member = User.objects.create_user(username="rob")
+
+    async def scenario():
+        moderator_socket = await _connect(space.slug, space.moderator)
+        member_socket = await _connect(space.slug, member)
+
+        await sync_to_async(ops.refresh_widgets)(
+            space.slug, ["display_moderator_tools", "display_members"]
+        )
+
+        moderator_frames = [
+            await moderator_socket.receive_json_from(),
+            await moderator_socket.receive_json_from(),
+        ]
+        member_frames = [await member_socket.receive_json_from()]
+        assert await member_socket.receive_nothing()
+
+        await moderator_socket.disconnect()
+        await member_socket.disconnect()
+        return moderator_frames, member_frames
+
+    moderator_frames, member_frames = async_to_sync(scenario)()
+
+    assert {
+        "type": "batch_refresh",
+        "target_ids": ["display_members"],
+        "seq": ANY,
+    } in moderator_frames
+    # Not numbered: members would see a gap in their numbers
+    assert {
+        "type": "batch_refresh",
+        "target_ids": ["display_moderator_tools"],
+        "seq": None,
+    } in moderator_frames
+    assert member_frames == [
+        {"type": "batch_refresh", "target_ids": ["display_members"], "seq": ANY}
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_vote_over_websocket(space, local_votes):
+    """Members vote through their socket; votes not allowed are refused."""
+
+    member = User.objects.create_user(username="rob")
+    outsider = User.objects.create_user(username="erin")
+    space.members.add(member)
+    active = space.ticket_set.get(active=True)
+
+    async def scenario():
+        member_socket = await _connect(space.slug, member)
+        # rob coming online is marked in the members widget; erin isn't a member
+        assert await member_socket.receive_json_from() == {
+            "type": "member_presence",
+            "online": {"rob": True},
+            "seq": ANY,
+        }
+        outsider_socket = await _connect(space.slug, outsider)
+
+        await member_socket.send_json_to({"type": "vote", "ticket": active.id, "number": 5})
+        member_frames = [
+            await member_socket.receive_json_from(),
+            await member_socket.receive_json_from(),
+        ]
+
+        await outsider_socket.receive_json_from()  # member_voted for rob
+        await outsider_socket.send_json_to({"type": "vote", "ticket": active.id, "number": 3})
+        outsider_reply = await outsider_socket.receive_json_from()
+
+        await member_socket.send_json_to({"type": "vote", "ticket": active.id, "number": 4})
+        invalid_reply = await member_socket.receive_json_from()
+
+        await member_socket.disconnect()
+        await outsider_socket.disconnect()
+        return member_frames, outsider_reply, invalid_reply
+
+    member_frames, outsider_reply, invalid_reply = async_to_sync(scenario)()
+
+    assert {"type": "vote_ack", "ticket": active.id, "number": 5} in member_frames
+    assert {
+        "type": "member_voted",
+        "ticket": active.id,
+        "username": "rob",
+        "seq": ANY,
+    } in member_frames
+    assert outsider_reply["type"] == "vote_error"
+    assert invalid_reply["type"] == "vote_error"
+    assert local_votes.get_ticket_votes(space.slug, active.id) == {"rob": 5}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_closing_ticket_sends_tallies_instead_of_members_refresh(space, local_votes, rf):
+    active = space.ticket_set.get(active=True)
+    local_votes.record_vote(space.slug, active.id, "joe", 3)
+    local_votes.record_vote(space.slug, active.id, "rob", 8)
+    request = rf.get("/")
+    request.user = space.moderator
+
+    async def scenario():
+        socket = await _connect(space.slug, space.moderator)
+        await sync_to_async(ops.open_close_ticket)(request, space.slug, active.id)
+        frames = [await socket.receive_json_from() for _ in range(3)]
+        assert await socket.receive_nothing()
+        await socket.disconnect()
+        return frames
+
+    frames = async_to_sync(scenario)()
+
+    assert [frame["type"] for frame in frames].count("html_update") == 1  # ticket table
+    assert {"type": "batch_refresh", "target_ids": ["display_voting_row"], "seq": ANY} in frames
+    assert {
+        "type": "ticket_tallies",
+        "ticket": active.id,
+        "votes": {"joe": 3, "rob": 8},
+        "aggregate": {"count": 2, "average": 5.5, "min": 3, "max": 8},
+        "seq": ANY,
+    } in frames
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    "Real cache semantics for tests that depend on caching (test settings use DummyCache)."
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    yield
+    cache.clear()
+
+
+def test_space_state_is_cached_and_invalidated_by_ops(
+    space, locmem_cache, rf, django_assert_num_queries
+):
+    """Partials read state from cache; mutating ops drop it."""
+
+    state = get_space_state(space.slug)
+    assert state.active_ticket.title == "Second ticket"
+    with django_assert_num_queries(0):
+        get_space_state(space.slug)
+
+    first = state.current_tickets[0]
+    request = rf.get("/")
+    request.user = space.moderator
+    ops.activate_ticket(request, space.slug, first.id)
+
+    assert get_space_state(space.slug).active_ticket == first
+
+
+@pytest.mark.parametrize("primed", [False, True], ids=["no-generation", "generation"])
+def test_state_loaded_before_a_write_is_not_served_after_it(
+    space, locmem_cache, monkeypatch, primed
+):
+    """A cache fill racing a write and its invalidation can't bring back the old state."""
+
+    if primed:
+        invalidate_space_state(space.slug)
+
+    def load_then_write(space_name):
+        state = load_space_state(space_name)
+        space.ticket_set.update(title="Renamed")
+        invalidate_space_state(space_name)
+        return state
+
+    monkeypatch.setattr("poynter.points.state.load_space_state", load_then_write)
+    assert get_space_state(space.slug).current_tickets[0].title == "First ticket"
+    monkeypatch.undo()
+
+    assert {ticket.title for ticket in get_space_state(space.slug).current_tickets} == {"Renamed"}
+
+
+def test_cached_state_holds_no_user_secrets(space, locmem_cache):
+    space.moderator.email = "shacker@example.com"
+    space.moderator.set_password("hunter2")
+    space.moderator.save()
+    space.members.add(space.moderator)
+
+    state = get_space_state(space.slug)
+    cached = pickle.dumps(state)
+    assert space.moderator.password.encode() not in cached
+    assert b"shacker@example.com" not in cached
+    assert str(state.space.moderator) == "shacker"
+    assert state.members == [space.moderator]
+
+
+def test_partials_answer_304_until_space_changes(space, locmem_cache, local_votes, client):
+    """An unchanged space version is answered with 304 and no rendering."""
+
+    space.members.add(space.moderator)
+    local_votes.get_space_votes(space.slug)  # Table votes loaded, as by the space page
+    client.force_login(space.moderator)
+    url = reverse("points:display_members", args=[space.slug])
+    # Versions start once the space has been loaded, as by the page the partials are on
+    assert client.get(url).status_code == 200
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    active = get_space_state(space.slug).active_ticket
+    client.post(
+        reverse("points:tally_single"),
+        {"space": space.slug, "username": "shacker", "ticket": active.id, "number": 5},
+    )
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+def test_space_versions_only_start_for_existing_spaces(space, locmem_cache, client):
+    client.force_login(space.moderator)
+    response = client.get(reverse("points:display_members", args=["nope"]))
+    assert response.status_code == 404
+    assert not response.has_header("ETag")
+    assert cache.get("space_version:nope") is None
+    assert get_space_version(space.slug) is None
+
+    get_space_state(space.slug)
+    assert get_space_version(space.slug) is not None
+
+
+def test_admin_edits_invalidate_space_state(space, locmem_cache, admin_client):
+    """An edit in the admin shows on the next refresh instead of answering 304."""
+
+    ticket = space.ticket_set.get(active=False)
+    get_space_state(space.slug)
+    version = get_space_version(space.slug)
+
+    response = admin_client.post(
+        reverse("admin:points_ticket_change", args=[ticket.id]),
+        {"url": ticket.url, "title": "Edited", "space": space.id, "active": "false"},
+    )
+    assert response.status_code == 302
+    assert get_space_version(space.slug) > version
+    assert get_space_state(space.slug).current_tickets[0].title == "Edited"
+
+    version = get_space_version(space.slug)
+    admin_client.post(
+        reverse("admin:points_ticket_changelist"),
+        {"action": "delete_selected", "_selected_action": [ticket.id], "post": "yes"},
+    )
+    assert get_space_version(space.slug) > version
+    assert len(get_space_state(space.slug).current_tickets) == 1
+
+
+def test_display_widgets_renders_all_widgets_in_one_request(
+    space, local_votes, client, django_assert_num_queries
+):
+    """Page load draws every widget with one request and one state load."""
+
+    member = User.objects.create_user(username="rob")
+    space.members.add(member)
+    local_votes.get_space_votes(space.slug)  # Table votes loaded, as by the space page
+    url = reverse("points:display_widgets", args=[space.slug])
+
+    client.force_login(space.moderator)
+    with django_assert_num_queries(5):  # session, user, then the three SpaceState queries
+        response = client.get(url)
+    html = response.content.decode()
+    for name in views_htmx.WIDGETS:
+        assert f'<div id="{name}" hx-swap-oob="innerHTML">' in html
+    assert "Second ticket" in html
+
+    client.force_login(member)
+    html = client.get(url, {"widgets": "display_members,display_moderator_tools"}).content.decode()
+    assert 'id="display_members"' in html
+    assert "display_moderator_tools" not in html
+
+
+def test_bulk_moderation_is_set_based(space, local_votes, client):
+    """Booting users and resetting votes take the same queries for one target or many."""
+
+    users = User.objects.bulk_create(User(username=f"user{n}") for n in range(5))
+    space.members.add(space.moderator, *users)
+    second = space.ticket_set.get(active=True)
+    for user in users:
+        local_votes.record_vote(space.slug, second.id, user.username, 3)
+    Vote.objects.create(ticket=second, username="user0", choice=3)
+    client.force_login(space.moderator)
+    url = reverse("points:bulk_moderate", args=[space.slug])
+
+    with CaptureQueriesContext(connection) as one:
+        response = client.post(url, {"action": "boot_users", "targets": ["user0"]})
+    assert response.status_code == 204
+    with CaptureQueriesContext(connection) as many:
+        client.post(url, {"action": "boot_users", "targets": ["user1", "user2", "user3"]})
+    assert len(many) == len(one)
+    assert sorted(space.members.values_list("username", flat=True)) == ["shacker", "user4"]
+
+    client.post(url, {"action": "reset_votes", "targets": [second.id]})
+    assert local_votes.get_ticket_votes(space.slug, second.id) == {}
+    assert not Vote.objects.exists()
+
+    client.post(url, {"action": "close_tickets"})
+    assert set(space.ticket_set.values_list("closed", flat=True)) == {True}
+
+    assert client.post(url, {"action": "drop_tables"}).status_code == 400
+    client.force_login(users[4])
+    assert client.post(url, {"action": "archive_tickets"}).status_code == 403
+    assert not space.ticket_set.filter(archived=True).exists()
+
+
+def test_transitions_update_once_and_return_new_state(space, django_assert_num_queries):
+    """Transitions are one UPDATE each, and the database keeps one active ticket per space."""
+
+    first, second = space.ticket_set.all()
+    with django_assert_num_queries(1):
+        assert transitions.set_ticket_closed(space.id, second.id) is True
+    with django_assert_num_queries(1):
+        assert transitions.set_space_open(space.id) is False
+
+    # Activating a closed ticket reopens it and deactivates the other
+    assert transitions.set_ticket_closed(space.id, first.id) is True
+    assert transitions.set_ticket_active(space.id, first.id) is True
+    assert list(space.ticket_set.filter(active=True)) == [first]
+    assert not space.ticket_set.get(id=first.id).closed
+    assert transitions.set_ticket_active(space.id, first.id) is False
+    assert not space.ticket_set.filter(active=True).exists()
+
+    # Legacy rows can have NULL for active: activating still reopens them
+    space.ticket_set.filter(id=first.id).update(active=None, closed=True)
+    assert transitions.set_ticket_active(space.id, first.id) is True
+    assert not space.ticket_set.get(id=first.id).closed
+    assert transitions.set_ticket_active(space.id, first.id) is False
+
+    other = Space.objects.create(
+        project=Project.objects.create(name="Other"), moderator=space.moderator
+    )
+    assert transitions.set_ticket_active(other.id, first.id) is None
+    assert transitions.set_ticket_active(other.id, first.id, False) is None
+
+    space.ticket_set.filter(id=second.id).update(active=True)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        space.ticket_set.filter(id=first.id).update(active=True)
+
+    form = TicketForm(
+        {"url": first.url, "title": first.title, "space": space.id, "active": "true"},
+        instance=first,
+    )
+    assert not form.is_valid()
+    assert "Another ticket is already listed as active" in str(form.errors)
+
+
+def test_repeated_moderator_clicks_set_the_same_state(space, client):
+    """Links carry the state they set, so a double click doesn't flip it back."""
+
+    first, second = space.ticket_set.order_by("id")
+    client.force_login(space.moderator)
+
+    def click(name, *args, **params):
+        response = client.get(reverse(f"points:{name}", args=[space.slug, *args]), params)
+        assert response.status_code == 204
+
+    for _ in range(2):
+        click("open_close_ticket", second.id, closed=1)
+    assert space.ticket_set.get(id=second.id).closed
+
+    # Activating the ticket that already is doesn't reopen it
+    click("activate_ticket", second.id, active=1)
+    assert space.ticket_set.get(id=second.id).closed
+    for _ in range(2):
+        click("activate_ticket", first.id, active=1)
+    assert list(space.ticket_set.filter(active=True)) == [first]
+    for _ in range(2):
+        click("activate_ticket", first.id, active=0)
+    assert not space.ticket_set.filter(active=True).exists()
+
+    for _ in range(2):
+        click("open_close_space", open=0)
+    space.refresh_from_db()
+    assert not space.is_open
+
+    url = reverse("points:open_close_space", args=[space.slug])
+    assert client.get(url, {"open": "yes"}).status_code == 400
+
+    # Links to the moderator panel carry the state to set
+    html = client.get(reverse("points:display_ticket_control", args=[space.slug])).content
+    assert f"{first.id}?active=1".encode() in html
+    assert f"{first.id}?closed=1".encode() in html
+    assert f"{second.id}?closed=0".encode() in html
+
+
+@pytest.fixture
+def ticket_server():
+    "Local stand-in for the ticket system; serves a titled page at any path."
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = f"<html><head><title>Ticket {self.path}</title></head></html>".encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_ticket_save_defers_title_fetch(space, django_capture_on_commit_callbacks):
+    """Saving without a title stores a placeholder and queues the fetch."""
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        ticket = Ticket.objects.create(url="http://127.0.0.1:9/unreachable", space=space)
+
+    assert ticket.title == TITLE_PLACEHOLDER
+    assert len(callbacks) == 1
+
+
+def test_resolve_title_from_ticket_server(space, ticket_server):
+    """The background resolver stores the fetched title and refreshes the table."""
+
+    channel_layer = get_channel_layer()
+    channel_name = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(f"broadcast_{space.slug}", channel_name)
+    ticket = Ticket.objects.create(url=f"{ticket_server}/PROJ-1", space=space)
+
+    assert titles.resolve_title(ticket.id) == "Ticket /PROJ-1"
+
+    ticket.refresh_from_db()
+    assert ticket.title == "Ticket /PROJ-1"
+    message = async_to_sync(channel_layer.receive)(channel_name)
+    assert "Ticket /PROJ-1" in message["html_content"]
+
+    # Already resolved: nothing more to do
+    assert titles.resolve_title(ticket.id) is None
+
+
+def test_resolve_title_falls_back_to_url(space):
+    ticket = Ticket.objects.create(url="http://127.0.0.1:9/PROJ-2", space=space)
+
+    assert titles.resolve_title(ticket.id, refresh=False) == "http://127.0.0.1:9/PROJ-2"
+
+
+def test_parse_ticket_rows():
+    rows = parse_ticket_rows("url,title\nhttp://x.com/1\n\nhttp://x.com/2, Named ticket\n")
+    assert rows == [("http://x.com/1", ""), ("http://x.com/2", "Named ticket")]
+
+    with pytest.raises(ValidationError):
+        parse_ticket_rows("http://x.com/1\nnot a url")
+
+
+def test_bulk_ticket_form_reports_files_that_are_not_utf8():
+    csv_file = SimpleUploadedFile("tickets.csv", "http://x.com/1,Café\n".encode("latin-1"))
+    form = BulkTicketForm({"urls": ""}, {"csv_file": csv_file})
+    assert not form.is_valid()
+    assert "UTF-8" in form.errors["csv_file"][0]
+
+    csv_file = SimpleUploadedFile("tickets.csv", "http://x.com/1,Café\n".encode("utf-8-sig"))
+    form = BulkTicketForm({"urls": ""}, {"csv_file": csv_file})
+    assert form.is_valid()
+    assert form.cleaned_data["rows"] == [("http://x.com/1", "Café")]
+
+
+def test_import_tickets_command_resolves_titles_and_refreshes_once(space, ticket_server, tmp_path):
+    """Bulk import inserts everything, fetches titles concurrently, refreshes once."""
+
+    channel_layer = get_channel_layer()
+    channel_name = async_to_sync(channel_layer.new_channel)()
+    async_to_sync(channel_layer.group_add)(f"broadcast_{space.slug}", channel_name)
+    csv_file = tmp_path / "sprint.csv"
+    csv_file.write_text(
+        "\n".join(f"{ticket_server}/PROJ-{n}" for n in range(10)) + "\nhttp://x.com/9,Named\n"
+    )
+
+    call_command("import_tickets", space.slug, str(csv_file), stdout=io.StringIO())
+
+    titles_by_url = dict(space.ticket_set.values_list("url", "title"))
+    assert titles_by_url[f"{ticket_server}/PROJ-7"] == "Ticket /PROJ-7"
+    assert titles_by_url["http://x.com/9"] == "Named"
+    assert TITLE_PLACEHOLDER not in titles_by_url.values()
+
+    message = async_to_sync(channel_layer.receive)(channel_name)
+    assert message["target_element"] == "display_ticket_table"
+    assert channel_name not in channel_layer.channels
+
+
+@pytest.mark.django_db(transaction=True)
+def test_resolve_titles_reports_only_titles_it_wrote(space, ticket_server, monkeypatch):
+    """A title entered while fetching is kept, and not reported as resolved."""
+
+    tickets = Ticket.objects.bulk_create(
+        Ticket(url=f"{ticket_server}/PROJ-{n}", title=TITLE_PLACEHOLDER, space=space)
+        for n in (1, 2)
+    )
+    fetch = titles._fetch_or_fallback
+
+    def fetch_while_moderator_edits(url):
+        Ticket.objects.filter(pk=tickets[0].pk).update(title="Entered by hand")
+        return fetch(url)
+
+    monkeypatch.setattr(titles, "_fetch_or_fallback", fetch_while_moderator_edits)
+    resolved = titles.resolve_titles(space.slug, [ticket.pk for ticket in tickets])
+
+    assert resolved == {tickets[1].pk: "Ticket /PROJ-2"}
+    assert dict(space.ticket_set.values_list("pk", "title"))[tickets[0].pk] == "Entered by hand"
+
+
+@pytest.mark.django_db
+def test_snapshots_store_deltas_and_reconstruct(space, monkeypatch):
+    monkeypatch.setattr(snapshots, "CHECKPOINT_EVERY", 3)
+    first, second = space.ticket_set.order_by("id")
+    states = [
+        {first.id: {"joe": 3}},
+        {first.id: {"joe": 3, "rob": 5}},
+        {first.id: {"joe": 3, "rob": 5}, second.id: {"joe": 8}},
+        {second.id: {"joe": 8}},
+    ]
+    for state in states:
+        snapshots.save_snapshot(space, state)
+    # Nothing changed: no row
+    assert snapshots.save_snapshot(space, states[-1]) is None
+
+    rows = list(Snapshot.objects.filter(space=space).order_by("id"))
+    assert [row.is_checkpoint for row in rows] == [True, False, False, True]
+    assert rows[2].snapshot == {"changed": {str(second.id): {"joe": 8}}, "removed": []}
+
+    for row, state in zip(rows, states):
+        rebuilt = snapshots.snapshot_state_at(space, row.created)
+        assert rebuilt.pop("averages") == {
+            str(tid): sum(v.values()) / len(v) for tid, v in state.items()
+        }
+        assert rebuilt == {str(tid): v for tid, v in state.items()}
+
+
+@pytest.mark.django_db
+def test_compact_snapshots_command(space):
+    first = space.ticket_set.first()
+    for state in [{first.id: {"joe": 3}}, {first.id: {"joe": 3}}, {first.id: {"joe": 5}}]:
+        Snapshot.objects.create(space=space, snapshot=state)
+    before = snapshots.snapshot_state_at(space)
+
+    call_command("compact_snapshots", stdout=io.StringIO())
+
+    rows = list(Snapshot.objects.filter(space=space).order_by("id"))
+    assert [row.is_checkpoint for row in rows] == [True, False]
+    assert rows[1].snapshot == {"changed": {str(first.id): {"joe": 5}}, "removed": []}
+    assert snapshots.snapshot_state_at(space) == before
+
+
+def test_votes_are_persisted_and_restored_after_expiry(
+    space, monkeypatch, rf, django_assert_num_queries
+):
+    """Votes expired from Redis come back from the table, which is only read for them."""
+
+    store = votes.RedisVoteStore(client=fakeredis.FakeStrictRedis())
+    monkeypatch.setattr(votes, "_vote_store", store)
+    space.members.add(space.moderator)
+    first, second = space.ticket_set.order_by("id")
+    for ticket, username, number in [
+        (first, "joe", 3),
+        (first, "rob", 5),
+        (first, "joe", 8),
+        (second, "shacker", 1),
+    ]:
+        request = rf.post(
+            "/", {"space": space.slug, "username": username, "ticket": ticket.id, "number": number}
+        )
+        ops.tally_single(request)
+
+    assert Vote.objects.count() == 3
+    ops.get_votes_for_space(space.slug)
+    with django_assert_num_queries(0):
+        ops.get_votes_for_space(space.slug)
+
+    # One ticket's votes expired: the table is read for that ticket only
+    store.client.delete(
+        store._ticket_key(space.slug, first.id), store._aggregate_key(space.slug, first.id)
+    )
+    with django_assert_num_queries(1):
+        data = ops.get_votes_for_space(space.slug)
+    assert data == {
+        first.id: {"joe": 8, "rob": 5},
+        second.id: {"shacker": 1},
+        "averages": {first.id: 6.5, second.id: 1},
+    }
+
+    # The whole space expired: the members widget reads its votes back too
+    store.client.flushall()
+    state = get_space_state(space.slug)
+    assert views_htmx.members_context(state)["members"] == {space.moderator: 1}
+    assert store.get_ticket_aggregate(space.slug, first.id)["count"] == 2
+
+    # Expired, but with nothing in the table: the ticket is dropped from the space
+    Vote.objects.filter(ticket=first).delete()
+    store.client.delete(
+        store._ticket_key(space.slug, first.id), store._aggregate_key(space.slug, first.id)
+    )
+    assert list(store.get_space_votes(space.slug)) == [second.id]
+    with django_assert_num_queries(0):
+        assert store.get_ticket_votes(space.slug, first.id) == {}
+
+
+def test_local_votes_are_restored_after_a_restart(
+    space, monkeypatch, rf, django_assert_num_queries
+):
+    """A new in-process store reads a space's votes back from the table, once."""
+
+    monkeypatch.setattr(votes, "_vote_store", votes.LocalVoteStore())
+    space.members.add(space.moderator)
+    first, second = space.ticket_set.order_by("id")
+    for ticket, username, number in [(first, "joe", 3), (first, "rob", 5), (second, "shacker", 1)]:
+        request = rf.post(
+            "/", {"space": space.slug, "username": username, "ticket": ticket.id, "number": number}
+        )
+        ops.tally_single(request)
+
+    # Restart: the new store is empty until the first read of the space
+    store = votes.LocalVoteStore()
+    monkeypatch.setattr(votes, "_vote_store", store)
+    store.record_vote(space.slug, first.id, "joe", 8)  # Newer than the table: kept
+    with django_assert_num_queries(0):
+        data = ops.get_votes_for_space(space.slug)
+    assert data == {
+        first.id: {"joe": 8, "rob": 5},
+        second.id: {"shacker": 1},
+        "averages": {first.id: 6.5, second.id: 1},
+    }
+    assert store.get_ticket_aggregate(space.slug, first.id)["count"] == 2
+    state = get_space_state(space.slug)
+    assert views_htmx.members_context(state)["members"] == {space.moderator: 1}
+
+    # A cleared space isn't read back
+    Vote.objects.filter(ticket__space=space).delete()
+    store = votes.LocalVoteStore()
+    store.clear_space(space.slug)
+    with django_assert_num_queries(0):
+        assert store.get_space_votes(space.slug) == {}
+
+
+def test_write_behind_retries_a_failed_batch(settings):
+    """A batch that can't be written is kept and written with the next one."""
+
+    settings.VOTE_FLUSH_MS = 50
+    batches = []
+
+    def write(votes):
+        if not batches:
+            batches.append(None)
+            raise DatabaseError("database is down")
+        batches.append(votes)
+
+    writer = writebehind.VoteWriteBehind(write)
+    writer.add("space", 8, "joe", 3)
+    writer.add("space", 8, "rob", 5)
+    time.sleep(0.3)
+
+    assert batches == [None, {("space", 8, "joe"): 3, ("space", 8, "rob"): 5}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_write_behind_drops_votes_the_database_rejects(space, settings):
+    """A vote that can never be written (its ticket is gone) doesn't hold back the rest."""
+
+    settings.VOTE_FLUSH_MS = 1000
+    active = space.ticket_set.get(active=True)
+    writer = writebehind.VoteWriteBehind(writebehind.write_votes)
+    writer.add(space.slug, 999999, "joe", 3)
+    writer.add(space.slug, active.id, "rob", 5)
+    writer.flush()
+
+    assert list(Vote.objects.values_list("ticket_id", "username", "choice")) == [
+        (active.id, "rob", 5)
+    ]
+    assert not writer._pending
+
+
+def test_tally_single_refuses_tickets_of_other_spaces(space, local_votes, client):
+    client.force_login(space.moderator)
+    url = reverse("points:tally_single")
+    vote = {"space": space.slug, "username": "joe", "ticket": 999999, "number": 5}
+    assert client.post(url, vote).status_code == 400
+    assert client.post(url, vote | {"ticket": "x"}).status_code == 400
+    active = space.ticket_set.get(active=True)
+    assert client.post(url, vote | {"ticket": active.id, "number": 4}).status_code == 400
+    assert local_votes.get_space_votes(space.slug) == {}
+
+    assert client.post(url, vote | {"ticket": active.id}).status_code == 204
+    assert local_votes.get_space_votes(space.slug) == {active.id: {"joe": 5}}
+
+
+def test_write_behind_batches_votes(settings):
+    """Votes within one interval are written together, latest choice wins."""
+
+    settings.VOTE_FLUSH_MS = 50
+    batches = []
+    writer = writebehind.VoteWriteBehind(batches.append)
+
+    writer.add("space", 8, "joe", 3)
+    writer.add("space", 8, "rob", 5)
+    writer.add("space", 8, "joe", 2)
+    writer.add("other", 9, "joe", 1)
+    writer.discard_space("other")
+    assert batches == []
+
+    time.sleep(0.2)
+    assert batches == [{("space", 8, "joe"): 2, ("space", 8, "rob"): 5}]
+
+
+@pytest.fixture(params=list(votes.VOTE_STORES))
+def vote_store(request, space):
+    "Each vote store backend, Redis emulated by fakeredis."
+    if request.param == "redis":
+        return votes.RedisVoteStore(client=fakeredis.FakeStrictRedis())
+    return votes.VOTE_STORES[request.param]()
+
+
+def test_vote_store_conformance(vote_store, space):
+    """Every backend stores, overwrites, aggregates and clears votes the same way."""
+
+    first, second = space.ticket_set.order_by("id").values_list("id", flat=True)
+    assert vote_store.get_space_votes(space.slug) == {}
+    assert vote_store.get_ticket_aggregate(space.slug, first)["count"] == 0
+
+    vote_store.record_vote(space.slug, first, "joe", 13)
+    vote_store.record_vote(space.slug, first, "rob", 2)
+    vote_store.record_vote(space.slug, first, "joe", 5)
+    vote_store.record_vote(space.slug, second, "joe", 8)
+
+    assert vote_store.get_ticket_votes(space.slug, first) == {"joe": 5, "rob": 2}
+    assert vote_store.get_space_votes(space.slug) == {
+        first: {"joe": 5, "rob": 2},
+        second: {"joe": 8},
+    }
+    aggregate = vote_store.get_ticket_aggregate(space.slug, first)
+    assert (aggregate["count"], aggregate["sum"], aggregate["average"]) == (2, 7, 3.5)
+    assert (aggregate["min"], aggregate["max"]) == (2, 5)
+    assert aggregate["histogram"][13] == 0
+    assert vote_store.get_space_aggregates(space.slug)[second]["average"] == 8
+
+    vote_store.clear_tickets(space.slug, [second])
+    assert list(vote_store.get_space_votes(space.slug)) == [first]
+    assert list(vote_store.get_space_aggregates(space.slug)) == [first]
+
+    vote_store.clear_space(space.slug)
+    assert vote_store.get_space_votes(space.slug) == {}
+    assert vote_store.get_space_aggregates(space.slug) == {}
+
+
+@pytest.mark.django_db
+def test_benchmark_vote_stores_command():
+    out = io.StringIO()
+    call_command("benchmark_vote_stores", "--votes", "50", "--reads", "5", stdout=out)
+    lines = out.getvalue().splitlines()
+    assert [line.split()[0] for line in lines[1:4]] == ["redis", "local", "database"]
+    assert lines[4] == "redis: emulated by fakeredis, as REDIS_ENABLED is off"
+    assert not Space.objects.exists()
+
+
+@pytest.fixture(params=["local", "redis"])
+def event_log(request):
+    "Each event log backend, Redis emulated by fakeredis."
+    if request.param == "redis":
+        return events.RedisEventLog(client=fakeredis.FakeStrictRedis())
+    return events.LocalEventLog()
+
+
+def test_event_log_replays_missed_widgets(event_log):
+    assert event_log.latest("space") == 0
+    assert event_log.record(
+        "space", [["display_members"], ["display_voting_row", "display_members"]]
+    ) == [1, 2]
+    assert event_log.record("space", [["display_ticket_table"]]) == [3]
+    assert event_log.latest("space") == 3
+    assert event_log.latest("other") == 0
+
+    assert event_log.since("space", 3) == (3, [])
+    assert event_log.since("space", 1) == (
+        3,
+        ["display_voting_row", "display_members", "display_ticket_table"],
+    )
+    # Event 3 arrived before event 2
+    assert event_log.since("space", 1, applied={3}) == (
+        3,
+        ["display_voting_row", "display_members"],
+    )
+    # Counter restarted since the client last saw it
+    assert event_log.since("space", 7) == (3, None)
+
+
+def test_event_log_reports_events_lost_from_buffer(event_log, monkeypatch):
+    monkeypatch.setattr(events, "EVENT_BUFFER_SIZE", 2)
+    event_log.record("space", [["display_members"]] * 2)
+    event_log.record("space", [["display_voting_row"]])
+
+    assert event_log.since("space", 1) == (3, ["display_members", "display_voting_row"])
+    assert event_log.since("space", 0) == (3, None)
+
+
+def test_redis_event_log_is_shared_between_processes():
+    server = fakeredis.FakeServer()
+    first = events.RedisEventLog(client=fakeredis.FakeStrictRedis(server=server))
+    second = events.RedisEventLog(client=fakeredis.FakeStrictRedis(server=server))
+
+    assert first.record("space", [["display_members"]]) == [1]
+    assert second.record("space", [["display_voting_row"], ["display_members"]]) == [2, 3]
+    assert first.since("space", 0) == (3, ["display_members", "display_voting_row"])
+    # Buffers of idle spaces expire; the counter doesn't
+    seq_key, buffer_key = first._keys("space")
+    assert 0 < first.client.ttl(buffer_key) <= events.EVENT_BUFFER_TTL
+    assert first.client.ttl(seq_key) == -1
+
+
+@pytest.fixture(params=["local", "redis"])
+def presence_tracker(request):
+    "Each presence backend, Redis emulated by fakeredis."
+    if request.param == "redis":
+        return presence.RedisPresence(client=fakeredis.FakeStrictRedis())
+    return presence.LocalPresence()
+
+
+def test_presence_tracks_sockets_and_prunes_dead_ones(presence_tracker, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(presence, "time", SimpleNamespace(time=lambda: clock[0]))
+
+    assert presence_tracker.connect("space", "joe", "socket1") == {"joe": True}
+    assert not presence_tracker.connect("space", "joe", "socket2")  # second tab
+    assert presence_tracker.connect("space", "rob", "socket3")
+    assert presence_tracker.online("space") == {"joe", "rob"}
+
+    assert not presence_tracker.disconnect("space", "joe", "socket1")
+    assert presence_tracker.online("space") == {"joe", "rob"}
+
+    # rob's socket died without disconnecting; joe keeps sending heartbeats
+    clock[0] += presence.PRESENCE_TTL - 1
+    assert not presence_tracker.heartbeat("space", "joe", "socket2")
+    clock[0] += 2
+    assert presence_tracker.online("space") == {"joe"}
+    assert presence_tracker.heartbeat("space", "joe", "socket2") == {"rob": False}
+    assert presence_tracker.disconnect("space", "joe", "socket2") == {"joe": False}
+    assert presence_tracker.online("space") == set()
+    assert presence_tracker.online("other") == set()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_timed_out_members_are_reported_offline(space, locmem_cache, monkeypatch):
+    """Members whose sockets stop sending heartbeats go offline for everyone,
+    and partials cached before then are not served with a 304."""
+    clock = [1000.0]
+    monkeypatch.setattr(presence, "time", SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(presence, "_presence", presence.LocalPresence())
+    joe, rob = User.objects.create_user(username="joe"), User.objects.create_user(username="rob")
+    space.members.add(joe, rob)
+
+    async def scenario():
+        joe_socket = await _connect(space.slug, joe)
+        rob_socket = await _connect(space.slug, rob)  # Never heard from again
+        arrivals = [await joe_socket.receive_json_from() for _ in range(2)]
+        version = await sync_to_async(get_space_version)(space.slug)
+
+        clock[0] += presence.PRESENCE_TTL - 1
+        await joe_socket.send_json_to({"type": "heartbeat"})
+        assert await joe_socket.receive_nothing()
+        clock[0] += 2
+        await joe_socket.send_json_to({"type": "heartbeat"})
+        departure = await joe_socket.receive_json_from()
+        assert await sync_to_async(get_space_version)(space.slug) != version
+        await joe_socket.disconnect()
+        await rob_socket.disconnect()
+        return arrivals, departure
+
+    arrivals, departure = async_to_sync(scenario)()
+    assert [frame["online"] for frame in arrivals] == [{"joe": True}, {"rob": True}]
+    assert departure == {"type": "member_presence", "online": {"rob": False}, "seq": ANY}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reconnecting_socket_resumes_from_last_seq(space, monkeypatch):
+    monkeypatch.setattr(events, "_event_log", events.LocalEventLog())
+    ops.refresh_widgets(space.slug, ["display_voting_row"])
+    ops.refresh_widgets(space.slug, ["display_members"])
+
+    async def scenario():
+        socket = await _connect(space.slug, space.moderator, since=1)
+        resume = await socket.receive_json_from()
+        await socket.disconnect()
+        return resume
+
+    # The moderator's own widgets aren't in the log, so a reconnecting moderator redraws them
+    assert async_to_sync(scenario)() == {
+        "type": "resume",
+        "seq": 2,
+        "target_ids": ["display_members", "display_moderator_tools", "display_ticket_control"],
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_socket_asks_for_events_that_arrive_out_of_order(space, monkeypatch):
+    """Events are numbered before they are sent, so a later event can overtake an
+    earlier one sent by another process. A client that applies event 3 while 1 and 2
+    are missing asks for what it missed, and hears only about their widgets."""
+    monkeypatch.setattr(events, "_event_log", events.LocalEventLog())
+    member = User.objects.create_user(username="rob")
+
+    async def scenario():
+        moderator_socket = await _connect(space.slug, space.moderator, since=0)
+        member_socket = await _connect(space.slug, member, since=0)
+        for socket in (moderator_socket, member_socket):
+            assert (await socket.receive_json_from())["type"] == "resume"
+
+        # Events 1 and 2 are still on their way from another worker when event 3 arrives
+        await sync_to_async(events.get_event_log().record)(
+            space.slug, [["display_voting_row"], ["display_ticket_table"]]
+        )
+        await sync_to_async(ops.refresh_widgets)(space.slug, ["display_members"])
+
+        replies = []
+        for socket in (moderator_socket, member_socket):
+            event = await socket.receive_json_from()
+            assert event == {"type": "batch_refresh", "target_ids": ["display_members"], "seq": 3}
+            await socket.send_json_to({"type": "resume", "since": 0, "applied": [3]})
+            replies.append(await socket.receive_json_from())
+            await socket.disconnect()
+        return replies
+
+    replies = async_to_sync(scenario)()
+    assert replies == 2 * [
+        {"type": "resume", "seq": 3, "target_ids": ["display_voting_row", "display_ticket_table"]}
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_partials_command():
+    out = io.StringIO()
+    call_command("benchmark_partials", "--requests", "10", "--concurrency", "5", stdout=out)
+    assert out.getvalue().splitlines()[1].split()[0] == "display_members"
+    assert not Space.objects.exists()
+    assert not User.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_session_command():
+    out = io.StringIO()
+    call_command(
+        "load_session",
+        "--spaces",
+        "2",
+        "--members",
+        "2",
+        "--tickets",
+        "1",
+        "--think-ms",
+        "0",
+        stdout=out,
+    )
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("2 spaces x 2 members x 1 tickets: 4 votes")
+    assert lines[-1].startswith("per vote: ")
+    assert not Space.objects.exists()
+    assert not User.objects.exists()
+    # The query counter is gone again
+    assert not connection.execute_wrappers
+
+
+def test_simulated_member_applies_events_out_of_order(space):
+    from poynter.points.management.commands.load_session import Counters, SimulatedMember
+
+    voted = []
+    tracker = SimpleNamespace(
+        received=lambda space_name, ticket_id, username: voted.append(username)
+    )
+    member = SimulatedMember(space, space.moderator, Counters(), tracker)
+
+    async def scenario():
+        for seq, username in [(2, "rob"), (1, "joe"), (2, "rob"), (4, "ann")]:
+            member.handle({"type": "member_voted", "ticket": 1, "username": username, "seq": seq})
+        # Event 3 is missing, so the member will ask for it
+        assert (member.applied_through, member.applied_above) == (2, {4})
+        assert member.gap_check is not None
+        member.handle({"type": "resume", "seq": 4, "target_ids": []})
+        await asyncio.sleep(0)
+
+    async_to_sync(scenario)()
+    assert voted == ["rob", "joe", "ann"]
+    assert (member.applied_through, member.applied_above, member.gap_check) == (4, set(), None)
+
+
+def strip_csrf(html: str) -> str:
+    return re.sub(r'name="csrfmiddlewaretoken" value="\w+"', "", html)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_partials_match_sync(space, local_votes, rf):
+    active = space.ticket_set.get(active=True)
+    space.members.add(space.moderator)
+    local_votes.record_vote(space.slug, active.id, "shacker", 5)
+
+    async def auser():
+        return space.moderator
+
+    for name in views_htmx.WIDGETS:
+        request = rf.get("/")
+        request.user, request.auser = space.moderator, auser
+        sync_html = getattr(views_htmx, name)(request, space.slug).content.decode()
+
+        async_response = async_to_sync(getattr(views_htmx_async, name))(request, space.slug)
+        # CSRF tokens are masked differently on every render
+        assert strip_csrf(async_response.content.decode()) == strip_csrf(sync_html)
+        assert "no-cache" in async_response["Cache-Control"]
+
+
+def test_serve_asgi_worker_status(tmp_path, monkeypatch):
+    from daphne.http_protocol import WebRequest
+    from daphne.ws_protocol import WebSocketProtocol
+
+    from poynter.points.management.commands import serve_asgi
+
+    monkeypatch.setattr(serve_asgi, "status_dir", lambda port: tmp_path)
+    server = serve_asgi.WorkerServer(
+        application=None, fileno=3, status_path=tmp_path / "1.json", drain_seconds=0
+    )
+    server.connections = {
+        WebSocketProtocol(): {"connected": 0},
+        WebSocketProtocol(): {"connected": 0, "disconnected": 1},
+        WebRequest.__new__(WebRequest): {"connected": 0},
+    }
+    assert server.counts() == {"websockets": 1, "http": 1}
+
+    # Draining, so no follow-up write is scheduled on the reactor
+    server.draining = True
+    server.write_status()
+    out = io.StringIO()
+    call_command("serve_asgi", "--status", "--port", "8000", stdout=out)
+    lines = out.getvalue().splitlines()
+    assert lines[1].split()[1:] == ["1", "1", "draining"]
+    assert lines[-1].split() == ["total", "1", "1"]
+
+
+def test_serve_asgi_workers_need_shared_state(settings, tmp_path, monkeypatch):
+    from poynter.points.management.commands import serve_asgi
+
+    command = serve_asgi.Command()
+    monkeypatch.setattr(serve_asgi.os, "sched_getaffinity", lambda pid: set(range(16)))
+    monkeypatch.setattr(serve_asgi, "CGROUP_CPU_MAX", tmp_path / "cpu.max")
+    monkeypatch.setattr(serve_asgi, "CGROUP_V1_CPU", tmp_path)
+    settings.ASGI_WORKERS = 0
+
+    # Without Redis each process would keep its own votes, events and presence
+    settings.REDIS_ENABLED = False
+    assert command.worker_count(None) == 1
+    assert command.worker_count(1) == 1
+    with pytest.raises(CommandError, match="REDIS_ENABLED"):
+        command.worker_count(4)
+    settings.ASGI_WORKERS = 4
+    with pytest.raises(CommandError, match="REDIS_ENABLED"):
+        command.worker_count(None)
+
+    settings.REDIS_ENABLED = True
+    settings.VOTE_STORE = "local"
+    with pytest.raises(CommandError, match="VOTE_STORE"):
+        command.worker_count(None)
+
+    settings.VOTE_STORE = ""
+    assert command.worker_count(None) == 4
+    settings.ASGI_WORKERS = 0
+    assert command.worker_count(None) == 16
+    # Containers get a CPU quota on a host with more cores
+    (tmp_path / "cpu.max").write_text("250000 100000\n")
+    assert command.worker_count(None) == 3
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert command.worker_count(None) == 16
+    with pytest.raises(CommandError):
+        command.worker_count(0)
+
+
+def test_redis_layout_shares_one_config():
+    from poynter.config.config import AppConfig
+    from poynter.config.redis_layout import (
+        cache_settings,
+        channel_layer_settings,
+        describe_pools,
+    )
+
+    config = AppConfig(
+        REDIS_URL="redis://:pw@ignored:6379",
+        REDIS_SENTINELS=["sentinel1:26379", "sentinel2:26379"],
+        REDIS_SENTINEL_MASTER="poynter",
+    )
+    cache = cache_settings(config)
+    assert cache["LOCATION"] == "redis://:pw@poynter/0"
+    assert cache["OPTIONS"]["SENTINELS"] == [("sentinel1", 26379), ("sentinel2", 26379)]
+    (host,) = channel_layer_settings(config)["CONFIG"]["hosts"]
+    assert host["master_name"] == "poynter"
+    assert host["sentinels"] == cache["OPTIONS"]["SENTINELS"]
+
+    config = AppConfig(REDIS_CHANNEL_URLS=["redis://a:6379/1", "redis://b:6379/1"])
+    layers = {"default": channel_layer_settings(config)}
+    report = describe_pools({"default": cache_settings(config)}, layers)
+    assert (
+        report[1]
+        == "channel layer: groups sharded across 2 hosts, one pool per host and event loop"
+    )
+    assert report[-1].startswith(
+        f"up to {config.REDIS_MAX_CONNECTIONS + 2 * config.REDIS_CHANNEL_MAX_CONNECTIONS} "
+    )
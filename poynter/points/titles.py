@@ -0,0 +1,151 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from poynter.points.models import TITLE_PLACEHOLDER, Ticket
+from poynter.points.ops import refresh_widgets, refresh_widgets_debounced
+from poynter.points.state import invalidate_space_state
+
+log = logging.getLogger(__name__)
+
+"""
+Background resolution of ticket titles from their URLs.
+
+Ticket.save() stores TITLE_PLACEHOLDER and queues the ticket here instead of
+fetching inline, so neither add_ticket nor the admin holds a worker while the
+remote system responds. A small thread pool does the fetching; each worker
+thread keeps its own requests.Session so connections to the ticket system are
+reused between fetches. When a title lands, the ticket table is refreshed.
+"""
+
+FETCH_TIMEOUT = 15
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.TITLE_FETCH_WORKERS, thread_name_prefix="title-fetch"
+)
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    "One HTTP session per worker thread, reused across fetches."
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def extract_title(text: str) -> str:
+    "Contents of the page's <title> tag, or empty string if there isn't one."
+    start = text.find("<title>")
+    end = text.find("</title>", start)
+    if start == -1 or end == -1:
+        return ""
+    return text[start + 7 : end].strip()[:120]
+
+
+def fetch_title(url: str, session: requests.Session | None = None) -> str:
+    "Fetch a page and return its title."
+    page = (session or _session()).get(url, timeout=FETCH_TIMEOUT)
+    return extract_title(page.text)
+
+
+def _fetch_or_fallback(url: str) -> str:
+    """Title for a URL. If the remote system can't be reached, fall back to the URL
+    so the moderator can see which ticket it is and enter the title manually."""
+    try:
+        title = fetch_title(url)
+    except requests.RequestException as e:
+        log.warning(f"Could not fetch title for {url}: {e}")
+        title = ""
+    return title or url[:120]
+
+
+def resolve_title(ticket_id: int, refresh: bool = True) -> str | None:
+    """Fetch and store the title for a ticket still showing the placeholder.
+    With refresh=False the caller is responsible for invalidating state and
+    refreshing the ticket table.
+    Returns the stored title, or None if there was nothing to do.
+    """
+    ticket = Ticket.objects.select_related("space").filter(pk=ticket_id).first()
+    if ticket is None or ticket.title != TITLE_PLACEHOLDER:
+        return None
+
+    title = _fetch_or_fallback(ticket.url)
+
+    # Only replace the placeholder, never a title entered in the meantime
+    updated = Ticket.objects.filter(pk=ticket_id, title=TITLE_PLACEHOLDER).update(title=title)
+    if not updated:
+        return None
+
+    if refresh:
+        invalidate_space_state(ticket.space.slug)
+        refresh_widgets_debounced(ticket.space.slug, ["display_ticket_table"])
+    return title
+
+
+def resolve_titles(space_name: str, ticket_ids: list) -> dict:
+    """Resolve many placeholder titles at once, e.g. after a bulk import.
+    Fetches run concurrently on at most TITLE_FETCH_WORKERS threads; results are
+    written with one bulk_update and announced with a single table refresh.
+    Returns {ticket_id: title} for the tickets whose titles were written.
+    """
+    tickets = list(Ticket.objects.filter(pk__in=ticket_ids, title=TITLE_PLACEHOLDER))
+    if not tickets:
+        return {}
+
+    # Threads only do HTTP; all database work stays on this thread
+    workers = min(settings.TITLE_FETCH_WORKERS, len(tickets))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="title-bulk") as pool:
+        fetched = list(pool.map(_fetch_or_fallback, [ticket.url for ticket in tickets]))
+
+    for ticket, title in zip(tickets, fetched):
+        ticket.title = title
+    with transaction.atomic():
+        # Only tickets still showing the placeholder: never a title entered while we
+        # were fetching. Locked so none can be edited between this read and the write.
+        pending = Ticket.objects.select_for_update().filter(
+            pk__in=[ticket.pk for ticket in tickets], title=TITLE_PLACEHOLDER
+        )
+        pending = set(pending.values_list("pk", flat=True))
+        tickets = [ticket for ticket in tickets if ticket.pk in pending]
+        Ticket.objects.bulk_update(tickets, ["title"])
+    if not tickets:
+        return {}
+
+    invalidate_space_state(space_name)
+    refresh_widgets(space_name, ["display_ticket_table"])
+    return {ticket.id: ticket.title for ticket in tickets}
+
+
+def _resolve_in_background(ticket_id: int):
+    try:
+        resolve_title(ticket_id)
+    except Exception:
+        log.exception(f"Title resolution failed for ticket {ticket_id}")
+    finally:
+        # Pool threads outlive requests, so clean up their DB connections like a request would
+        close_old_connections()
+
+
+def _resolve_many_in_background(space_name: str, ticket_ids: list):
+    try:
+        resolve_titles(space_name, ticket_ids)
+    except Exception:
+        log.exception(f"Bulk title resolution failed for {space_name}")
+    finally:
+        close_old_connections()
+
+
+def queue_title_fetch(ticket_id: int):
+    "Resolve a ticket's title in the background once the current transaction commits."
+    transaction.on_commit(lambda: _executor.submit(_resolve_in_background, ticket_id))
+
+
+def queue_bulk_title_fetch(space_name: str, ticket_ids: list):
+    "Background resolve_titles() for a batch, once the current transaction commits."
+    transaction.on_commit(
+        lambda: _executor.submit(_resolve_many_in_background, space_name, ticket_ids)
+    )
@@ -0,0 +1,98 @@
+from django.db import connection, transaction
+
+from poynter.points.models import Space, Ticket
+
+"""
+State transitions for tickets and spaces, each applied by the database in one
+conditional UPDATE that returns the new state (UPDATE ... RETURNING, supported
+by PostgreSQL and SQLite 3.35+). Nothing is read first, so a transition costs
+one round trip.
+
+Each takes the state to set, which the moderator's links send with the state
+they want (?open=1), so a double click or a retried request writes the same
+value twice instead of flipping back. None flips the current state instead.
+
+Every function returns the new state, or None if the row doesn't exist in that
+space (which callers turn into a 404).
+
+Making a ticket active also deactivates the space's current active ticket. The
+Ticket constraint "one_active_ticket_per_space" guarantees there is at most one.
+"""
+
+
+def _update_returning(model, assignments: str, where: str, column: str, params: list):
+    """Run one UPDATE on model's table and return the new value of column from the
+    (single) matching row, or None if no row matched."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    # Only table/column names are interpolated; values are always params
+    sql = f"UPDATE {table} SET {assignments} WHERE {where} RETURNING {column}"  # noqa: S608
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return None if row is None else bool(row[0])
+
+
+def _assignment(column: str, value: bool | None) -> tuple:
+    "SET clause and params writing `value` to a boolean column, or flipping it if None."
+    if value is None:
+        return f"{column} = NOT {column}", []
+    return f"{column} = %s", [value]
+
+
+def set_space_open(space_id: int, is_open: bool | None = None) -> bool | None:
+    "Open or close a space (None: whichever it isn't). Returns is_open."
+    assignment, params = _assignment("is_open", is_open)
+    return _update_returning(Space, assignment, "id = %s", "is_open", params + [space_id])
+
+
+def set_ticket_closed(space_id: int, ticket_id: int, closed: bool | None = None) -> bool | None:
+    "Close or reopen a ticket (None: whichever it isn't). Returns closed."
+    assignment, params = _assignment("closed", closed)
+    return _update_returning(
+        Ticket, assignment, "id = %s AND space_id = %s", "closed", params + [ticket_id, space_id]
+    )
+
+
+def set_ticket_active(space_id: int, ticket_id: int, active: bool | None = None) -> bool | None:
+    """Make a ticket the space's active ticket, reopening it for voting unless it
+    already was, or deactivate it (None: whichever it isn't). Archived tickets
+    can't be activated. Returns active."""
+
+    with transaction.atomic():
+        # Queue concurrent activations in this space behind one another, so the
+        # second one deactivates the ticket the first one activated
+        list(Space.objects.select_for_update().filter(id=space_id).values_list("id"))
+
+        # Deactivating: a single UPDATE, only of an active ticket when flipping
+        if active is False:
+            return _update_returning(
+                Ticket,
+                "active = %s",
+                "id = %s AND space_id = %s",
+                "active",
+                [False, ticket_id, space_id],
+            )
+        if active is None:
+            deactivated = _update_returning(
+                Ticket,
+                "active = %s",
+                "id = %s AND space_id = %s AND active = %s",
+                "active",
+                [False, ticket_id, space_id, True],
+            )
+            if deactivated is not None:
+                return deactivated
+
+        # Activating: the current active ticket makes way first, as the constraint
+        # is checked row by row. A ticket that already was active stays closed if it is;
+        # rows from before active had a default hold NULL, which counts as inactive.
+        Ticket.objects.filter(space_id=space_id, active=True).exclude(id=ticket_id).update(
+            active=False
+        )
+        return _update_returning(
+            Ticket,
+            "active = %s, closed = closed AND COALESCE(active, %s)",
+            "id = %s AND space_id = %s AND archived = %s",
+            "active",
+            [True, False, ticket_id, space_id, False],
+        )
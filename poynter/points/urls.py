@@ -1,38 +1,44 @@
+from django.conf import settings
 from django.urls import path
 
-from poynter.points import ops, views, views_htmx
+from poynter.points import ops, views, views_htmx, views_htmx_async
+
+# Same partials, sync or async (see views_htmx_async.py)
+partials = views_htmx_async if settings.ASYNC_VIEWS else views_htmx
 
 app_name = "points"
 
 urlpatterns = [
     path("add_ticket/<str:space_name>", views.add_ticket, name="add_ticket"),
+    path("bulk_add_tickets/<str:space_name>", views.bulk_add_tickets, name="bulk_add_tickets"),
     path("archive_tickets/<str:space_name>", views.archive_tickets, name="archive_tickets"),
     path("clear_space_cache/<str:space_name>", views.clear_space_cache, name="clear_space_cache"),
     path("space/<str:space_name>", views.space, name="space"),
     # HTMX views
+    path("display_widgets/<str:space_name>", partials.display_widgets, name="display_widgets"),
     path(
         "display_ticket_table/<str:space_name>",
-        views_htmx.display_ticket_table,
+        partials.display_ticket_table,
         name="display_ticket_table",
     ),
     path(
         "display_ticket_control/<str:space_name>",
-        views_htmx.display_ticket_control,
+        partials.display_ticket_control,
         name="display_ticket_control",
     ),
     path(
         "display_voting_row/<str:space_name>",
-        views_htmx.display_voting_row,
+        partials.display_voting_row,
         name="display_voting_row",
     ),
     path(
         "display_members/<str:space_name>",
-        views_htmx.display_members,
+        partials.display_members,
         name="display_members",
     ),
     path(
         "display_moderator_tools/<str:space_name>",
-        views_htmx.display_moderator_tools,
+        partials.display_moderator_tools,
         name="display_moderator_tools",
     ),
     # From OPS
@@ -51,4 +57,5 @@ urlpatterns = [
         name="open_close_ticket",
     ),
     path("boot_users/<str:space_name>", ops.boot_users, name="boot_users"),
+    path("bulk_moderate/<str:space_name>", ops.bulk_moderate, name="bulk_moderate"),
 ]
@@ -1,37 +1,39 @@
-from django.core.cache import cache
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 
-from poynter.points.forms import AddTicketForm
-from poynter.points.models import Project, Space, Ticket
-from poynter.points.ops import refresh_widgets
+from poynter.points.events import get_event_log
+from poynter.points.forms import AddTicketForm, BulkTicketForm
+from poynter.points.imports import import_tickets
+from poynter.points.models import TITLE_PLACEHOLDER, Project, Space, Vote
+from poynter.points.ops import apply_bulk, refresh_widgets
+from poynter.points.presence import HEARTBEAT_SECONDS
+from poynter.points.state import bump_space_version, get_space_state, invalidate_space_state
+from poynter.points.titles import queue_bulk_title_fetch
+from poynter.points.votes import get_vote_store
+from poynter.points.writebehind import discard_queued_votes
 
 
 def home(request):
     "List spaces - projects and their pointing moderators"
-    projects = Project.objects.all()
+    spaces = Space.objects.select_related("moderator")
+    projects = Project.objects.prefetch_related(Prefetch("space_set", queryset=spaces))
     return render(request, "points/home.html", {"projects": projects})
 
 
 def space(request, space_name: str):
     "Detail view for a voting space has permanent URL for a moderator and project."
-    space = get_object_or_404(Space, slug=space_name)
-
-    # Can we remove this?
-    try:
-        active_ticket = space.ticket_set.get(active=True)
-    except Ticket.DoesNotExist:
-        active_ticket = None
-
-    # current_tickets = space.ticket_set.filter(archived=False)
+    state = get_space_state(space_name)
 
     return render(
         request,
         "points/space.html",
         {
-            "active_ticket": active_ticket,
-            # "current_tickets": current_tickets,
-            "space": space,
+            "active_ticket": state.active_ticket,
+            "space": state.space,
             "host": request.get_host(),
+            # Widgets are drawn as of this event; the socket resumes from here
+            "event_seq": get_event_log().latest(space_name),
+            "heartbeat_seconds": HEARTBEAT_SECONDS,
         },
     )
 
@@ -42,8 +44,7 @@ def archive_tickets(request, space_name: str):
     """
 
     space = get_object_or_404(Space, slug=space_name)
-    tickets = Ticket.objects.filter(space=space, archived=False)
-    tickets.update(archived=True, active=False)
+    apply_bulk(space, "archive_tickets")
 
     return redirect(reverse("points:space", kwargs={"space_name": space.slug}))
 
@@ -51,7 +52,10 @@ def archive_tickets(request, space_name: str):
 def clear_space_cache(request, space_name: str):
     "Allow moderator to refresh a space cache."
 
-    cache.delete(space_name)
+    get_vote_store().clear_space(space_name)
+    discard_queued_votes(space_name)
+    Vote.objects.filter(ticket__space__slug=space_name).delete()
+    bump_space_version(space_name)
 
     return redirect(reverse("points:space", kwargs={"space_name": space_name}))
 
@@ -66,6 +70,7 @@ def add_ticket(request, space_name: str):
             ticket = form.save(commit=False)
             ticket.space = space
             ticket.save()
+            invalidate_space_state(space_name)
 
             # Update everyone else's display
             refresh_widgets(space_name, ["display_ticket_table"])
@@ -76,3 +81,29 @@ def add_ticket(request, space_name: str):
         form = AddTicketForm()
 
     return render(request, "points/add_ticket.html", {"form": form, "space_name": space_name})
+
+
+def bulk_add_tickets(request, space_name: str):
+    """Allow moderator to add many tickets to a space at once.
+    Tickets are inserted together; missing titles are fetched in the background
+    and everyone's ticket table is refreshed once when they are all in.
+    """
+
+    if request.method == "POST":
+        space = get_object_or_404(Space, slug=space_name)
+        form = BulkTicketForm(request.POST, request.FILES)
+        if form.is_valid():
+            tickets = import_tickets(space, form.cleaned_data["rows"])
+
+            pending = [ticket.id for ticket in tickets if ticket.title == TITLE_PLACEHOLDER]
+            if pending:
+                queue_bulk_title_fetch(space_name, pending)
+            else:
+                refresh_widgets(space_name, ["display_ticket_table"])
+
+            return redirect(reverse("points:space", kwargs={"space_name": space_name}))
+
+    else:
+        form = BulkTicketForm()
+
+    return render(request, "points/bulk_add_tickets.html", {"form": form, "space_name": space_name})
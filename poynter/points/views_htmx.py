@@ -1,109 +1,198 @@
-from django.shortcuts import get_object_or_404, render
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
-from poynter.points.models import Space, Ticket
-from poynter.points.ops import get_votes_for_space
+from poynter.points.presence import get_presence
+from poynter.points.state import SpaceState, get_space_state, get_space_version
+from poynter.points.votes import VOTE_CHOICES, get_vote_store
 
 """ These are HTMX "partial views" that just render HTML for one portion of a view.
 These are triggered for re/generation on page load or when calling ops.refresh_widgets().
+All of them read the space through the cached SpaceState (see state.py).
 """
 
 
+def space_version_etag(request, space_name: str) -> str | None:
+    "ETag for a partial: space version plus user, since most partials are personalized."
+    version = get_space_version(space_name)
+    if version is None:
+        return None
+    return f"{version}-{request.user.pk}"
+
+
+def versioned_partial(view):
+    """Conditional GET support: when the client's If-None-Match still matches the space
+    version, answer 304 without touching the database or rendering. no-cache makes the
+    browser revalidate on every refresh instead of reusing its copy blindly.
+    """
+    return cache_control(private=True, no_cache=True)(condition(etag_func=space_version_etag)(view))
+
+
+def ticket_table_context(state: SpaceState) -> dict:
+    "Context for the ticket table, which has no per-user content."
+    return {"space": state.space, "current_tickets": state.current_tickets}
+
+
+@versioned_partial
 def display_ticket_table(request, space_name: str):
     "HTMX view returns appropriate ticket list for given user in this space."
     "Updates in real time as moderator makes changes."
-    space = get_object_or_404(Space, slug=space_name)
-    current_tickets = space.ticket_set.filter(archived=False)
-    ctx = {"space": space, "current_tickets": current_tickets}
+    ctx = ticket_table_context(get_space_state(space_name))
 
     return render(request, "points/htmx/display_ticket_table.html", ctx)
 
 
+def render_ticket_table(space_name: str) -> str:
+    "Ticket table HTML as pushed to every member at once by ops.refresh_widgets()."
+    return render_to_string(
+        "points/htmx/display_ticket_table.html", ticket_table_context(get_space_state(space_name))
+    )
+
+
+@versioned_partial
 def display_ticket_control(request, space_name: str):
     "Display ticket table control links for moderator only."
     "These controls rendered in a separate table to avoid complex "
     "content filtering (permissions) over async broadcast."
-    space = get_object_or_404(Space, slug=space_name)
-    current_tickets = space.ticket_set.filter(archived=False)
-    ctx = {"space": space, "current_tickets": current_tickets}
+    ctx = ticket_control_context(get_space_state(space_name))
 
     return render(request, "points/htmx/display_ticket_control.html", ctx)
 
 
+def ticket_control_context(state: SpaceState) -> dict:
+    return {"space": state.space, "current_tickets": state.current_tickets}
+
+
+@versioned_partial
 def display_voting_row(request, space_name: str):
     """HTMX view displays voting buttons to voting members
     when space is open and an active ticket exists.
     """
 
-    space = get_object_or_404(Space, slug=space_name)
-    numbers = [(1, "One"), (2, "Two"), (3, "Three"), (5, "Five"), (8, "Eight"), (13, "Thirteen")]
+    ctx = voting_row_context(get_space_state(space_name))
 
-    try:
-        active_ticket = space.ticket_set.get(active=True)
-    except Ticket.DoesNotExist:
-        active_ticket = None
+    return render(request, "points/htmx/display_voting_row.html", ctx)
 
-    return render(
-        request,
-        "points/htmx/display_voting_row.html",
-        {"active_ticket": active_ticket, "space": space, "numbers": numbers},
-    )
+
+def voting_row_context(state: SpaceState) -> dict:
+    numbers = VOTE_CHOICES
+    return {
+        "active_ticket": state.active_ticket,
+        "space": state.space,
+        "space_members": state.members,
+        "numbers": numbers,
+    }
 
 
+@versioned_partial
 def display_moderator_tools(request, space_name: str):
     """HTMX view displays various controls to the moderator,
     which must be sensitive to the current state.
     """
 
-    space = get_object_or_404(Space, slug=space_name)
-    try:
-        active_ticket = space.ticket_set.get(active=True)
-    except Ticket.DoesNotExist:
-        active_ticket = None
+    ctx = moderator_tools_context(get_space_state(space_name))
 
-    return render(
-        request,
-        "points/htmx/display_moderator_tools.html",
-        {
-            "space": space,
-            "active_ticket": active_ticket,
-        },
-    )
+    return render(request, "points/htmx/display_moderator_tools.html", ctx)
+
+
+def moderator_tools_context(state: SpaceState) -> dict:
+    return {
+        "space": state.space,
+        "space_members": state.members,
+        "active_ticket": state.active_ticket,
+    }
 
 
+@versioned_partial
 def display_members(request, space_name: str):
     """HTMX view displays list of currently active space members
-    (and their votes, once voting is closed). Tallies are stored in cache
+    (and their votes, once voting is closed), marking those who have the
+    space open (presence.py). Tallies are stored in cache
     until voting is closed, then copied to Snapshot.
     """
 
-    space = get_object_or_404(Space, slug=space_name)
+    ctx = members_context(get_space_state(space_name))
 
-    try:
-        active_ticket = space.ticket_set.get(active=True)
-    except Ticket.DoesNotExist:
-        active_ticket = None
+    return render(request, "points/htmx/display_members.html", ctx)
+
+
+def members_context(state: SpaceState) -> dict:
+    space_name = state.space.slug
+    active_ticket = state.active_ticket
 
     # Space members and their voting status
     # {"joe": 13, "erin": 5}
-    tallies = get_votes_for_space(space_name)
     members = {}
+    aggregate = None
     if active_ticket:
-        for member in space.members.all():
-            member_vote = None
-            if member.username in tallies.get(active_ticket.id, {}).keys():
-                member_vote = tallies[active_ticket.id][member.username]
-            members[member] = member_vote
+        tallies = get_vote_store().get_ticket_votes(space_name, active_ticket.id)
+        if active_ticket.closed:
+            aggregate = get_vote_store().get_ticket_aggregate(space_name, active_ticket.id)
+        for member in state.members:
+            members[member] = tallies.get(member.username)
     else:
         # Still need to show members list when no active ticket
-        for member in space.members.all():
+        for member in state.members:
             members[member] = None
 
-    return render(
-        request,
-        "points/htmx/display_members.html",
-        {
-            "active_ticket": active_ticket,
-            "space": space,
-            "members": members,
-        },
-    )
+    return {
+        "active_ticket": active_ticket,
+        "space": state.space,
+        "space_members": state.members,
+        "members": members,
+        # Usernames with the space open right now
+        "online": get_presence().online(space_name),
+        "aggregate": aggregate,
+    }
+
+
+# Widgets whose HTML is identical for every member of a space. These can be rendered
+# once per change and pushed to the whole group rather than re-fetched by each client.
+SHARED_WIDGETS = {
+    "display_ticket_table": render_ticket_table,
+}
+
+# Widgets that only exist in the moderator's DOM. Refreshes for these go to the
+# moderator group only, so other members' sockets don't receive frames they ignore.
+MODERATOR_WIDGETS = {"display_moderator_tools", "display_ticket_control"}
+
+# Every widget by element id: its template and context function.
+WIDGETS = {
+    "display_voting_row": ("points/htmx/display_voting_row.html", voting_row_context),
+    "display_ticket_table": ("points/htmx/display_ticket_table.html", ticket_table_context),
+    "display_ticket_control": ("points/htmx/display_ticket_control.html", ticket_control_context),
+    "display_members": ("points/htmx/display_members.html", members_context),
+    "display_moderator_tools": (
+        "points/htmx/display_moderator_tools.html",
+        moderator_tools_context,
+    ),
+}
+
+
+@versioned_partial
+def display_widgets(request, space_name: str):
+    """HTMX view renders several widgets in one response, as out-of-band swaps into
+    the elements of the same ids. Used for page load, and by space.html whenever more
+    than one widget needs redrawing at once, e.g. after reconnecting.
+    ?widgets=display_members,display_voting_row picks widgets; default is all.
+    Every widget is rendered from the same SpaceState; moderator widgets only
+    for the moderator.
+    """
+
+    state = get_space_state(space_name)
+    names = request.GET.get("widgets")
+    names = names.split(",") if names else list(WIDGETS)
+    if request.user != state.space.moderator:
+        names = [name for name in names if name not in MODERATOR_WIDGETS]
+
+    fragments = []
+    for name in names:
+        if name not in WIDGETS:
+            continue
+        template, context = WIDGETS[name]
+        html = render_to_string(template, context(state), request=request)
+        fragments.append(f'<div id="{name}" hx-swap-oob="innerHTML">{html}</div>')
+
+    return HttpResponse("\n".join(fragments))
@@ -0,0 +1,131 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from poynter.points.state import aget_space_state, aget_space_version
+from poynter.points.views_htmx import (
+    MODERATOR_WIDGETS,
+    WIDGETS,
+    members_context,
+    moderator_tools_context,
+    ticket_control_context,
+    ticket_table_context,
+    voting_row_context,
+)
+
+"""
+Async versions of the HTMX partial views in views_htmx.py, served when
+settings.ASYNC_VIEWS is on (see urls.py). Under daphne these run on the event
+loop, so a burst of refreshes from every client in a space doesn't queue for
+the sync thread pool. They share context functions and templates with the sync
+views; state comes from the async ORM and cache APIs (state.aget_space_state()).
+
+Vote store and presence reads stay synchronous (the Redis client is blocking),
+so the members widget context is built in a worker thread.
+"""
+
+
+def async_versioned_partial(view):
+    """Async counterpart of views_htmx.versioned_partial(): same ETag and
+    Cache-Control, and resolves request.user once so templates can use it."""
+
+    @wraps(view)
+    async def wrapper(request, space_name: str):
+        # Sync middleware (LoginRequiredMiddleware) may already have loaded the user
+        request.user = getattr(request, "_cached_user", None) or await request.auser()
+
+        etag = None
+        version = await aget_space_version(space_name)
+        if version is not None:
+            etag = quote_etag(f"{version}-{request.user.pk}")
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+
+        response = await view(request, space_name)
+        if etag and request.method in ("GET", "HEAD"):
+            response.headers.setdefault("ETag", etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
+
+
+# Context functions that read the vote store or presence, run off the event loop
+_BLOCKING_CONTEXTS = {members_context}
+
+
+async def widget_context(name: str, state) -> dict:
+    template, context = WIDGETS[name]
+    if context in _BLOCKING_CONTEXTS:
+        return await sync_to_async(context, thread_sensitive=False)(state)
+    return context(state)
+
+
+@async_versioned_partial
+async def display_ticket_table(request, space_name: str):
+    "Async views_htmx.display_ticket_table()."
+    ctx = ticket_table_context(await aget_space_state(space_name))
+
+    return render(request, "points/htmx/display_ticket_table.html", ctx)
+
+
+@async_versioned_partial
+async def display_ticket_control(request, space_name: str):
+    "Async views_htmx.display_ticket_control()."
+    ctx = ticket_control_context(await aget_space_state(space_name))
+
+    return render(request, "points/htmx/display_ticket_control.html", ctx)
+
+
+@async_versioned_partial
+async def display_voting_row(request, space_name: str):
+    "Async views_htmx.display_voting_row()."
+    ctx = voting_row_context(await aget_space_state(space_name))
+
+    return render(request, "points/htmx/display_voting_row.html", ctx)
+
+
+@async_versioned_partial
+async def display_moderator_tools(request, space_name: str):
+    "Async views_htmx.display_moderator_tools()."
+    ctx = moderator_tools_context(await aget_space_state(space_name))
+
+    return render(request, "points/htmx/display_moderator_tools.html", ctx)
+
+
+@async_versioned_partial
+async def display_members(request, space_name: str):
+    "Async views_htmx.display_members()."
+    ctx = await sync_to_async(members_context, thread_sensitive=False)(
+        await aget_space_state(space_name)
+    )
+
+    return render(request, "points/htmx/display_members.html", ctx)
+
+
+@async_versioned_partial
+async def display_widgets(request, space_name: str):
+    "Async views_htmx.display_widgets()."
+
+    state = await aget_space_state(space_name)
+    names = request.GET.get("widgets")
+    names = names.split(",") if names else list(WIDGETS)
+    if request.user != state.space.moderator:
+        names = [name for name in names if name not in MODERATOR_WIDGETS]
+
+    fragments = []
+    for name in names:
+        if name not in WIDGETS:
+            continue
+        template, _ = WIDGETS[name]
+        html = render_to_string(template, await widget_context(name, state), request=request)
+        fragments.append(f'<div id="{name}" hx-swap-oob="innerHTML">{html}</div>')
+
+    return HttpResponse("\n".join(fragments))
@@ -0,0 +1,454 @@
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count
+
+from poynter.points.models import Vote
+from poynter.points.redis_store import RedisStore
+from poynter.points.writebehind import write_votes
+
+"""
+Vote storage. Each vote is written as one field of one record per ticket, so
+concurrent voters never read-modify-write a shared object and a vote costs the
+same no matter how many tickets or votes a space holds.
+
+Alongside the votes, each ticket keeps running aggregates (count, sum and a
+histogram over VOTE_CHOICES) updated at vote time, so averages and
+distributions are read in O(1) per ticket instead of recomputed from all votes.
+A re-vote moves the user's count from the old choice to the new one.
+
+Three interchangeable stores implement VoteStore; settings.VOTE_STORE picks one:
+
+    redis     RedisVoteStore, shared by all processes, votes expire after VOTE_TTL
+    local     LocalVoteStore, in-process, for a single dev server, loaded from the
+              Vote table on first use of a space
+    database  DatabaseVoteStore, the Vote table, durable but a query per operation
+
+Redis layout (keys pass through cache.make_key so they share REDIS_PREFIX):
+
+    votes:<space_name>               set of ticket IDs with votes in this space,
+                                     plus RESTORED once restored (see below)
+    votes:<space_name>:<ticket>      hash of {username: choice}
+    votes:<space_name>:<ticket>:agg  hash of {count, sum, h:<choice>: n}
+
+Redis votes expire, so RedisVoteStore reads restore expired ones from the Vote
+table (the write-behind copy, writebehind.py), and only those: a ticket still
+listed in the space set but whose hash is gone, and, once per lifetime of the
+space set, the tickets missing from it, which may have expired along with it.
+"""
+
+# Keep votes for one hour unless reset by moderator
+VOTE_TTL = 3600
+
+# Fibonacci choices offered in the voting row
+VOTE_CHOICES = [(1, "One"), (2, "Two"), (3, "Three"), (5, "Five"), (8, "Eight"), (13, "Thirteen")]
+
+# Record a vote and adjust the ticket's aggregates atomically, in one round trip.
+# KEYS: ticket hash, aggregate hash, space set.
+# ARGV: username, choice, ttl, ticket_id, "1" to keep a vote the user already has
+RECORD_VOTE_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if old and ARGV[5] == '1' then
+    return
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if old then
+    redis.call('HINCRBY', KEYS[2], 'sum', tonumber(ARGV[2]) - tonumber(old))
+    redis.call('HINCRBY', KEYS[2], 'h:' .. old, -1)
+else
+    redis.call('HINCRBY', KEYS[2], 'count', 1)
+    redis.call('HINCRBY', KEYS[2], 'sum', ARGV[2])
+end
+redis.call('HINCRBY', KEYS[2], 'h:' .. ARGV[2], 1)
+redis.call('SADD', KEYS[3], ARGV[4])
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[3])
+end
+"""
+
+
+# Member of a space's Redis set once its expired votes have been restored
+RESTORED = "restored"
+
+
+def summarize(count: int, total: int, histogram: dict) -> dict:
+    """Aggregate for one ticket as returned by the stores. min/max come from the
+    histogram, so they stay correct when a re-vote removes the old extreme."""
+    histogram = {choice: 0 for choice, _ in VOTE_CHOICES} | {
+        choice: n for choice, n in histogram.items() if n
+    }
+    chosen = [choice for choice, n in histogram.items() if n]
+    return {
+        "count": count,
+        "sum": total,
+        "average": total / count if count else None,
+        "min": min(chosen) if chosen else None,
+        "max": max(chosen) if chosen else None,
+        "histogram": histogram,
+    }
+
+
+class VoteStore(ABC):
+    """Interface shared by the vote stores. Ticket IDs are ints, votes are
+    {username: choice} and aggregates are as returned by summarize().
+    `durable` stores keep votes themselves, so they need no write-behind copy
+    in the Vote table (see writebehind.py).
+    """
+
+    durable = False
+
+    @abstractmethod
+    def record_vote(self, space_name: str, ticket_id: int, username: str, choice: int):
+        "Write (or overwrite) one user's vote on one ticket."
+
+    @abstractmethod
+    def get_ticket_votes(self, space_name: str, ticket_id: int) -> dict:
+        "{username: choice} for one ticket."
+
+    @abstractmethod
+    def get_space_votes(self, space_name: str) -> dict:
+        "{ticket_id: {username: choice}} for every ticket with votes in this space."
+
+    @abstractmethod
+    def get_ticket_aggregate(self, space_name: str, ticket_id: int) -> dict:
+        "Aggregate for one ticket (see summarize())."
+
+    @abstractmethod
+    def get_space_aggregates(self, space_name: str) -> dict:
+        "{ticket_id: aggregate} for every ticket with votes in this space."
+
+    @abstractmethod
+    def clear_space(self, space_name: str):
+        "Drop all votes in a space (moderator 'Clear Votes')."
+
+    @abstractmethod
+    def clear_tickets(self, space_name: str, ticket_ids: list):
+        "Drop the votes on some tickets in a space."
+
+
+class RedisVoteStore(RedisStore, VoteStore):
+    """Stores one Redis hash per ticket plus its aggregates, both updated by one
+    server-side script per vote."""
+
+    def _space_key(self, space_name: str) -> str:
+        return cache.make_key(f"votes:{space_name}")
+
+    def _ticket_key(self, space_name: str, ticket_id: int) -> str:
+        return cache.make_key(f"votes:{space_name}:{ticket_id}")
+
+    def _aggregate_key(self, space_name: str, ticket_id: int) -> str:
+        return cache.make_key(f"votes:{space_name}:{ticket_id}:agg")
+
+    def _members(self, space_name: str) -> tuple[list[int], bool]:
+        "Ticket IDs in the space set, and whether the space has been restored."
+        members = {member.decode() for member in self.client.smembers(self._space_key(space_name))}
+        return sorted(int(member) for member in members if member != RESTORED), RESTORED in members
+
+    def _ticket_ids(self, space_name: str) -> list[int]:
+        """IDs of the tickets with votes in a space, first restoring any that expired
+        with the space set."""
+        ticket_ids, restored = self._members(space_name)
+        if not restored:
+            self._restore(space_name, exclude=ticket_ids)
+            ticket_ids, _ = self._members(space_name)
+        return ticket_ids
+
+    def _restore(self, space_name: str, ticket_ids: list | None = None, exclude: list = ()):
+        """Copy a space's votes back from the Vote table: on ticket_ids, or on all
+        but the excluded tickets, marking the space set RESTORED. Votes in Redis
+        win over the table's. Tickets the table has no votes on leave the set."""
+        rows = Vote.objects.filter(ticket__space__slug=space_name).exclude(ticket_id__in=exclude)
+        if ticket_ids is not None:
+            rows = rows.filter(ticket_id__in=ticket_ids)
+        found = set()
+        for ticket_id, username, choice in rows.values_list("ticket_id", "username", "choice"):
+            self.record_vote(space_name, ticket_id, username, choice, keep_existing=True)
+            found.add(ticket_id)
+
+        space_key = self._space_key(space_name)
+        pipe = self.client.pipeline(transaction=True)
+        if ticket_ids is None:
+            pipe.sadd(space_key, RESTORED)
+        gone = [ticket_id for ticket_id in ticket_ids or [] if ticket_id not in found]
+        if gone:
+            pipe.srem(space_key, *gone)
+        pipe.expire(space_key, VOTE_TTL)
+        pipe.execute()
+
+    def _hgetall(self, keys: list) -> list[dict]:
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        return pipe.execute()
+
+    def _read_hashes(self, space_name: str, ticket_ids: list, key) -> list[dict]:
+        "Raw hashes key(space_name, ticket_id) for ticket_ids, restoring expired ones."
+        raws = self._hgetall([key(space_name, ticket_id) for ticket_id in ticket_ids])
+        expired = [ticket_id for ticket_id, raw in zip(ticket_ids, raws) if not raw]
+        if expired:
+            self._restore(space_name, expired)
+            restored = self._hgetall([key(space_name, ticket_id) for ticket_id in expired])
+            restored = dict(zip(expired, restored))
+            raws = [raw or restored[ticket_id] for ticket_id, raw in zip(ticket_ids, raws)]
+        return raws
+
+    def _read_ticket_hash(self, space_name: str, ticket_id: int, key) -> dict:
+        "One ticket's raw hash. Only when it's empty is there more to check."
+        raw = self.client.hgetall(key(space_name, ticket_id))
+        if raw or ticket_id not in self._ticket_ids(space_name):
+            return raw
+        return self._read_hashes(space_name, [ticket_id], key)[0]
+
+    def record_vote(
+        self,
+        space_name: str,
+        ticket_id: int,
+        username: str,
+        choice: int,
+        keep_existing: bool = False,
+    ):
+        """Write (or overwrite) one user's vote on one ticket in a single round trip.
+        keep_existing leaves a vote the user already has in place."""
+        self.script(RECORD_VOTE_SCRIPT)(
+            keys=[
+                self._ticket_key(space_name, ticket_id),
+                self._aggregate_key(space_name, ticket_id),
+                self._space_key(space_name),
+            ],
+            args=[username, choice, VOTE_TTL, ticket_id, int(keep_existing)],
+        )
+
+    def get_ticket_votes(self, space_name: str, ticket_id: int) -> dict:
+        "{username: choice} for one ticket."
+        return _decode(self._read_ticket_hash(space_name, ticket_id, self._ticket_key))
+
+    def get_space_votes(self, space_name: str) -> dict:
+        "{ticket_id: {username: choice}} for every ticket with votes in this space."
+        ticket_ids = self._ticket_ids(space_name)
+        raws = self._read_hashes(space_name, ticket_ids, self._ticket_key)
+        return {ticket_id: _decode(raw) for ticket_id, raw in zip(ticket_ids, raws) if raw}
+
+    def get_ticket_aggregate(self, space_name: str, ticket_id: int) -> dict:
+        "Running aggregate for one ticket (see summarize())."
+        raw = self._read_ticket_hash(space_name, ticket_id, self._aggregate_key)
+        return _decode_aggregate(raw)
+
+    def get_space_aggregates(self, space_name: str) -> dict:
+        "{ticket_id: aggregate} for every ticket with votes in this space."
+        ticket_ids = self._ticket_ids(space_name)
+        raws = self._read_hashes(space_name, ticket_ids, self._aggregate_key)
+        return {
+            ticket_id: _decode_aggregate(raw) for ticket_id, raw in zip(ticket_ids, raws) if raw
+        }
+
+    def clear_space(self, space_name: str):
+        """Drop all votes in a space (moderator 'Clear Votes'). The space stays marked
+        RESTORED, as the caller is clearing the Vote table too."""
+        keys = []
+        for ticket_id in self._members(space_name)[0]:
+            keys += [
+                self._ticket_key(space_name, ticket_id),
+                self._aggregate_key(space_name, ticket_id),
+            ]
+        space_key = self._space_key(space_name)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(space_key, *keys)
+        pipe.sadd(space_key, RESTORED)
+        pipe.expire(space_key, VOTE_TTL)
+        pipe.execute()
+
+    def clear_tickets(self, space_name: str, ticket_ids: list):
+        if not ticket_ids:
+            return
+        keys = []
+        for ticket_id in ticket_ids:
+            keys += [
+                self._ticket_key(space_name, ticket_id),
+                self._aggregate_key(space_name, ticket_id),
+            ]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*keys)
+        pipe.srem(self._space_key(space_name), *ticket_ids)
+        pipe.execute()
+
+
+def _decode(raw: dict) -> dict:
+    "Redis hashes come back as bytes; votes are {str: int}."
+    return {username.decode(): int(choice) for username, choice in raw.items()}
+
+
+def _decode_aggregate(raw: dict) -> dict:
+    fields = {key.decode(): int(value) for key, value in raw.items()}
+    histogram = {int(key[2:]): value for key, value in fields.items() if key.startswith("h:")}
+    return summarize(fields.get("count", 0), fields.get("sum", 0), histogram)
+
+
+class LocalVoteStore(VoteStore):
+    """In-process fallback for when Redis is not enabled (single process dev use).
+    Same per-ticket layout, guarded by a lock instead of Redis atomicity.
+    Votes do not expire and are not shared between processes. They don't survive
+    a restart either, so the first use of a space in a process copies its votes
+    back from the Vote table (the write-behind copy, writebehind.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = defaultdict(lambda: defaultdict(dict))
+        # space -> ticket -> [count, sum, {choice: n}]
+        self._aggregates = defaultdict(lambda: defaultdict(lambda: [0, 0, defaultdict(int)]))
+        # Spaces whose votes in the Vote table have been loaded
+        self._loaded = set()
+
+    def _load(self, space_name: str):
+        "Copy a space's votes from the Vote table on its first use. Votes held here win."
+        if space_name in self._loaded:
+            return
+        rows = list(
+            Vote.objects.filter(ticket__space__slug=space_name).values_list(
+                "ticket_id", "username", "choice"
+            )
+        )
+        with self._lock:
+            if space_name in self._loaded:
+                return
+            self._loaded.add(space_name)
+            for ticket_id, username, choice in rows:
+                if username not in self._data[space_name].get(ticket_id, {}):
+                    self._record(space_name, ticket_id, username, choice)
+
+    def _record(self, space_name: str, ticket_id: int, username: str, choice: int):
+        "record_vote() with the lock held."
+        votes = self._data[space_name][ticket_id]
+        aggregate = self._aggregates[space_name][ticket_id]
+        old = votes.get(username)
+        votes[username] = choice
+
+        if old is None:
+            aggregate[0] += 1
+        else:
+            aggregate[1] -= old
+            aggregate[2][old] -= 1
+        aggregate[1] += choice
+        aggregate[2][choice] += 1
+
+    def record_vote(self, space_name: str, ticket_id: int, username: str, choice: int):
+        self._load(space_name)
+        with self._lock:
+            self._record(space_name, ticket_id, username, choice)
+
+    def get_ticket_votes(self, space_name: str, ticket_id: int) -> dict:
+        self._load(space_name)
+        with self._lock:
+            return dict(self._data[space_name].get(ticket_id, {}))
+
+    def get_space_votes(self, space_name: str) -> dict:
+        self._load(space_name)
+        with self._lock:
+            return {tid: dict(votes) for tid, votes in sorted(self._data[space_name].items())}
+
+    def get_ticket_aggregate(self, space_name: str, ticket_id: int) -> dict:
+        self._load(space_name)
+        with self._lock:
+            count, total, histogram = self._aggregates[space_name].get(ticket_id, (0, 0, {}))
+            return summarize(count, total, dict(histogram))
+
+    def get_space_aggregates(self, space_name: str) -> dict:
+        self._load(space_name)
+        with self._lock:
+            return {
+                tid: summarize(count, total, dict(histogram))
+                for tid, (count, total, histogram) in sorted(self._aggregates[space_name].items())
+            }
+
+    def clear_space(self, space_name: str):
+        "The caller clears the Vote table too, so there is nothing left to load."
+        with self._lock:
+            self._data.pop(space_name, None)
+            self._aggregates.pop(space_name, None)
+            self._loaded.add(space_name)
+
+    def clear_tickets(self, space_name: str, ticket_ids: list):
+        self._load(space_name)
+        with self._lock:
+            for ticket_id in ticket_ids:
+                self._data[space_name].pop(ticket_id, None)
+                self._aggregates[space_name].pop(ticket_id, None)
+
+
+class DatabaseVoteStore(VoteStore):
+    """Votes as rows of the Vote table, one upsert per vote. Aggregates are
+    computed by the database on read. Votes never expire."""
+
+    durable = True
+
+    def _space_votes(self, space_name: str):
+        return Vote.objects.filter(ticket__space__slug=space_name)
+
+    def record_vote(self, space_name: str, ticket_id: int, username: str, choice: int):
+        write_votes({(space_name, ticket_id, username): choice})
+
+    def get_ticket_votes(self, space_name: str, ticket_id: int) -> dict:
+        return dict(
+            self._space_votes(space_name)
+            .filter(ticket_id=ticket_id)
+            .values_list("username", "choice")
+        )
+
+    def get_space_votes(self, space_name: str) -> dict:
+        data = {}
+        rows = self._space_votes(space_name).order_by("ticket_id")
+        for ticket_id, username, choice in rows.values_list("ticket_id", "username", "choice"):
+            data.setdefault(ticket_id, {})[username] = choice
+        return data
+
+    def _aggregates(self, votes) -> dict:
+        histograms = defaultdict(dict)
+        rows = votes.values_list("ticket_id", "choice").annotate(n=Count("id"))
+        for ticket_id, choice, n in rows.order_by("ticket_id"):
+            histograms[ticket_id][choice] = n
+        return {
+            ticket_id: summarize(
+                sum(histogram.values()),
+                sum(choice * n for choice, n in histogram.items()),
+                histogram,
+            )
+            for ticket_id, histogram in histograms.items()
+        }
+
+    def get_ticket_aggregate(self, space_name: str, ticket_id: int) -> dict:
+        votes = self._space_votes(space_name).filter(ticket_id=ticket_id)
+        return self._aggregates(votes).get(ticket_id, summarize(0, 0, {}))
+
+    def get_space_aggregates(self, space_name: str) -> dict:
+        return self._aggregates(self._space_votes(space_name))
+
+    def clear_space(self, space_name: str):
+        self._space_votes(space_name).delete()
+
+    def clear_tickets(self, space_name: str, ticket_ids: list):
+        self._space_votes(space_name).filter(ticket_id__in=ticket_ids).delete()
+
+
+VOTE_STORES = {
+    "redis": RedisVoteStore,
+    "local": LocalVoteStore,
+    "database": DatabaseVoteStore,
+}
+
+_vote_store = None
+
+
+def get_vote_store() -> VoteStore:
+    """Module-level vote store named by settings.VOTE_STORE.
+    If unset, Redis-backed when REDIS_ENABLED, in-process otherwise."""
+    global _vote_store
+    if _vote_store is None:
+        name = settings.VOTE_STORE or ("redis" if settings.REDIS_ENABLED else "local")
+        if name not in VOTE_STORES:
+            raise ImproperlyConfigured(f"VOTE_STORE must be one of {', '.join(VOTE_STORES)}")
+        _vote_store = VOTE_STORES[name]()
+    return _vote_store
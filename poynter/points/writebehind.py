@@ -0,0 +1,136 @@
+import logging
+import threading
+from typing import Callable
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+
+from poynter.points.models import Vote
+
+log = logging.getLogger(__name__)
+
+"""
+Write-behind copy of votes into the Vote table.
+
+The vote store (votes.py) expires its data and, without Redis, lives in one
+process. To keep votes past that, every vote is also queued here. Queued votes
+are written with one upsert per VOTE_FLUSH_MS interval, on a timer thread, so
+casting a vote never waits on the database. Several votes by the same user on
+the same ticket within an interval collapse to the latest.
+
+A batch that fails to write (e.g. the database is briefly unreachable) goes
+back in the queue, under any newer votes queued meanwhile, and is retried on
+the next interval. A batch the database rejects (IntegrityError, e.g. a vote
+for a ticket deleted since) is written again one vote at a time, and votes
+that still fail are dropped, so one bad row can't hold back all the others.
+Votes still queued when a process dies are lost from the
+table, but not from the vote store; the table is a fallback for expired votes,
+not the primary copy.
+"""
+
+
+def write_votes(votes: dict):
+    "Upsert {(space_name, ticket_id, username): choice} into the Vote table in one query."
+    Vote.objects.bulk_create(
+        [
+            Vote(ticket_id=ticket_id, username=username, choice=choice)
+            for (_, ticket_id, username), choice in votes.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["ticket", "username"],
+        update_fields=["choice", "modified"],
+    )
+
+
+class VoteWriteBehind:
+    """Buffers votes and hands them to `write` in batches, at most once per
+    settings.VOTE_FLUSH_MS. Same timer pattern as debounce.RefreshDebouncer.
+    """
+
+    def __init__(self, write: Callable[[dict], None]):
+        self.write = write
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, int] = {}
+        self._timer = None
+
+    def add(self, space_name: str, ticket_id: int, username: str, choice: int):
+        "Queue one vote for the next batch."
+        interval = settings.VOTE_FLUSH_MS / 1000
+        if interval <= 0:
+            self.write({(space_name, ticket_id, username): choice})
+            return
+
+        with self._lock:
+            self._pending[(space_name, ticket_id, username)] = choice
+            self._schedule(interval)
+
+    def _schedule(self, interval: float):
+        "Start the flush timer if it isn't running. Call with the lock held."
+        if self._timer is None:
+            self._timer = threading.Timer(interval, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def discard_space(self, space_name: str, ticket_ids: list | None = None):
+        "Drop queued votes for a space (or some of its tickets) whose votes are being cleared."
+        with self._lock:
+            self._pending = {
+                key: v
+                for key, v in self._pending.items()
+                if key[0] != space_name or (ticket_ids is not None and key[1] not in ticket_ids)
+            }
+
+    def flush(self):
+        """Write everything queued now, on the calling thread. If the write fails,
+        the batch is queued again for the next interval and the error raised."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        except IntegrityError:
+            self._write_each(pending)
+        except Exception:
+            self._requeue(pending)
+            raise
+
+    def _write_each(self, pending: dict):
+        "Write votes one by one, dropping those the database rejects."
+        votes = list(pending.items())
+        for n, (key, choice) in enumerate(votes):
+            try:
+                self.write({key: choice})
+            except IntegrityError:
+                log.warning("Dropping vote %s: %s that can't be written", key, choice)
+            except Exception:
+                self._requeue(dict(votes[n:]))
+                raise
+
+    def _requeue(self, pending: dict):
+        "Put a batch that failed back in the queue, under newer votes, and retry it."
+        with self._lock:
+            self._pending = pending | self._pending
+            self._schedule(max(settings.VOTE_FLUSH_MS, 1) / 1000)
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            log.exception("Writing queued votes failed; retrying with the next batch")
+        finally:
+            connections.close_all()
+
+
+_writer = VoteWriteBehind(write_votes)
+
+
+def queue_vote(space_name: str, ticket_id: int, username: str, choice: int):
+    "Persist a vote to the Vote table in the next batch."
+    _writer.add(space_name, ticket_id, username, choice)
+
+
+def discard_queued_votes(space_name: str, ticket_ids: list | None = None):
+    _writer.discard_space(space_name, ticket_ids)